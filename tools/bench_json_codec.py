@@ -0,0 +1,93 @@
+'''
+module -- bench_json_codec
+
+Micro-benchmark of jsonutils, the JSON codec of xCAT responses and REST
+bodies, against the standard json module. It replays xCAT response bodies
+as received on the wire: the "xCAT response:" records of zvmsdk logs
+written with log_level = logging.DEBUG, or the tabdump, rpower and xdsh
+bodies kept in tools/xcat_responses when no log is given.
+
+Usage: python tools/bench_json_codec.py [zvmsdk.log ...]
+
+'''
+
+
+import ast
+import glob
+import json
+import os
+import sys
+import timeit
+
+sys.path.append('.')
+sys.path.append('..')
+from zvmsdk import jsonutils
+
+
+ROUNDS = 20
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'xcat_responses')
+LOG_RECORD = 'xCAT response: '
+
+
+def load_fixtures():
+    bodies = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, '*.json'))):
+        with open(path) as f:
+            bodies.append((os.path.basename(path)[:-5], f.read()))
+    return bodies
+
+
+def load_log(path):
+    bodies = []
+    with open(path) as f:
+        for num, line in enumerate(f, 1):
+            if LOG_RECORD not in line:
+                continue
+            resp = ast.literal_eval(line.split(LOG_RECORD, 1)[1].strip())
+            if resp['message']:
+                bodies.append(('%s:%d' % (os.path.basename(path), num),
+                               resp['message']))
+    return bodies
+
+
+def best_time(codec):
+    return min(timeit.Timer(codec).repeat(repeat=3, number=ROUNDS)) / ROUNDS
+
+
+def main(logs):
+    if logs:
+        bodies = [body for path in logs for body in load_log(path)]
+    else:
+        bodies = load_fixtures()
+    if not bodies:
+        print('No xCAT response found')
+        return 1
+
+    print('decoder: %s, encoder: %s' % (jsonutils.DECODER,
+                                        jsonutils.ENCODER))
+    totals = {}
+    for name, raw in bodies:
+        doc = json.loads(raw)
+        if (jsonutils.loads(raw) != doc or
+                jsonutils.dumps(doc) != json.dumps(doc)):
+            print('%s: codecs results differ' % name)
+            return 1
+        for op, module, codec in (
+                ('loads', 'json', lambda: json.loads(raw)),
+                ('loads', 'jsonutils', lambda: jsonutils.loads(raw)),
+                ('dumps', 'json', lambda: json.dumps(doc)),
+                ('dumps', 'jsonutils', lambda: jsonutils.dumps(doc))):
+            best = best_time(codec)
+            totals[op, module] = totals.get((op, module), 0) + best
+            print('%-30s %7d bytes %s %-9s %.3f ms' % (name, len(raw), op,
+                                                       module, best * 1000))
+
+    print('%d responses:' % len(bodies))
+    for (op, module), total in sorted(totals.items()):
+        print('  %s %-9s %.3f ms' % (op, module, total * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,98 @@
+'''
+module -- bench_translate_xcat_resp
+
+Micro-benchmark of utils.translate_xcat_resp, the parser of rinv and
+Image_Performance_Query responses, against its former implementation
+testing every keyword against every line.
+
+Usage: python tools/bench_translate_xcat_resp.py [guests] [rounds]
+
+'''
+
+
+import sys
+import timeit
+
+sys.path.append('.')
+sys.path.append('..')
+from zvmsdk import utils as zvmutils
+
+
+IPQ_KEYWORDS = {
+    'userid': "Guest name:",
+    'guest_cpus': "Guest CPUs:",
+    'used_cpu_time': "Used CPU time:",
+    'elapsed_cpu_time': "Elapsed time:",
+    'min_cpu_count': "Minimum CPU count:",
+    'max_cpu_limit': "Max CPU limit:",
+    'samples_cpu_in_use': "Samples CPU in use:",
+    'samples_cpu_delay': ",Samples CPU delay:",
+    'used_memory': "Used memory:",
+    'max_memory': " Max memory:",
+}
+
+IPQ_RECORD = '\n'.join((
+    'zhcp2: Virtual server ID: %(uid)s',
+    'zhcp2: Record version: "1"',
+    'zhcp2: Guest flags: "0"',
+    'zhcp2: Used CPU time: "26238001893 uS"',
+    'zhcp2: Elapsed time: "89185770400 uS"',
+    'zhcp2: Minimum memory: "0 KB"',
+    'zhcp2: Max memory: "8388608 KB"',
+    'zhcp2: Shared memory: "5222192 KB"',
+    'zhcp2: Used memory: "5222184 KB"',
+    'zhcp2: Active CPUs in CEC: "44"',
+    'zhcp2: Logical CPUs in VM: "6"',
+    'zhcp2: Guest CPUs: "2"',
+    'zhcp2: Minimum CPU count: "2"',
+    'zhcp2: Max CPU limit: "10000"',
+    'zhcp2: Processor share: "100"',
+    'zhcp2: Samples CPU in use: "16659"',
+    'zhcp2: ,Samples CPU delay: "638"',
+    'zhcp2: Samples page wait: "0"',
+    'zhcp2: Samples idle: "71550"',
+    'zhcp2: Samples other: "337"',
+    'zhcp2: Samples total: "89184"',
+    'zhcp2: Guest name: "%(uid)s  "'))
+
+
+def translate_xcat_resp_linear(rawdata, dirt):
+    """The former implementation of utils.translate_xcat_resp."""
+    data_list = rawdata.split("\n")
+
+    data = {}
+
+    for ls in data_list:
+        for k in list(dirt.keys()):
+            if ls.__contains__(dirt[k]):
+                data[k] = ls[(ls.find(dirt[k]) + len(dirt[k])):].strip()
+                break
+
+    return data
+
+
+def parse_records(records, translate):
+    return [translate(rpi, IPQ_KEYWORDS) for rpi in records]
+
+
+def main(guests=2000, rounds=10):
+    raw_data = ': \n'.join(IPQ_RECORD % {'uid': 'GUEST%04d' % i}
+                           for i in range(guests))
+    records = raw_data.split(': \n')
+
+    expected = parse_records(records, translate_xcat_resp_linear)
+    if parse_records(records, zvmutils.translate_xcat_resp) != expected:
+        print('Parsers results differ')
+        return 1
+
+    for name, translate in (('linear', translate_xcat_resp_linear),
+                            ('compiled', zvmutils.translate_xcat_resp)):
+        timer = timeit.Timer(lambda: parse_records(records, translate))
+        best = min(timer.repeat(repeat=3, number=rounds)) / rounds
+        print('%-9s %d guests: %.2f ms per query' % (name, guests,
+                                                    best * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:3]]))
@@ -60,6 +60,20 @@ def check_input_types(*types):
     return decorator
 
 
+def _check_unique(keys, what):
+    """Raise ZVMInvalidInput if keys, results are keyed by, repeat."""
+    seen = set()
+    duplicates = set()
+    for key in keys:
+        if key in seen:
+            duplicates.add(key)
+        seen.add(key)
+    if duplicates:
+        msg = ("duplicate %(what)s: %(keys)s" %
+               {'what': what, 'keys': ', '.join(sorted(duplicates))})
+        raise exception.ZVMInvalidInput(msg=msg)
+
+
 class SDKAPI(object):
     """Compute action interfaces."""
 
@@ -86,8 +100,8 @@ class SDKAPI(object):
 
         :param str userid: the id of the virtual machine to be power off
         :param int timeout: time to wait for GuestOS to shutdown
-        :param int retry_interval: How often to signal guest while
-                                   waiting for it to shutdown
+        :param int retry_interval: not used, the guest is signaled once and
+                                   its power state watched until timeout
 
         :returns: None
         """
@@ -102,10 +116,65 @@ class SDKAPI(object):
 
         self._vmops.guest_stop(userid, timeout, retry_interval)
 
+    def guest_stop_async(self, userid, timeout=300):
+        """Power off a virtual machine without waiting for it.
+
+        :param str userid: the id of the virtual machine to be power off
+        :param int timeout: time to watch for GuestOS to shutdown
+
+        :returns: a handle whose wait(seconds) method returns True once the
+                  virtual machine is off, and done() method tells whether
+                  it is off or timeout expired.
+        """
+        if not isinstance(timeout, int):
+            LOG.error('Invalid input parameter - timeout, expect an integer')
+            raise exception.ZVMInvalidInput('timeout')
+
+        return self._vmops.guest_stop_async(userid, timeout)
+
+    def guest_watch_power_state(self, userid, state, timeout=300,
+                                callback=None):
+        """Watch a virtual machine reaching a power state.
+
+        The power state of all the virtual machines watched is queried
+        with a single request to xCAT, whatever their number.
+
+        :param str userid: the id of the virtual machine
+        :param str state: the power state to wait for, 'on' or 'off'
+        :param int timeout: time to watch the virtual machine
+        :param callback: function called with the returned handle once
+                         done
+
+        :returns: a handle whose wait(seconds) method returns True once the
+                  virtual machine is in state, and done() method tells
+                  whether it is in state or timeout expired.
+        """
+        if not isinstance(timeout, int):
+            LOG.error('Invalid input parameter - timeout, expect an integer')
+            raise exception.ZVMInvalidInput('timeout')
+
+        return self._vmops.watch_power_state(userid, state, timeout,
+                                             callback)
+
     def guest_get_power_state(self, guest_id):
         """Returns power state."""
         return self._vmops.get_power_state(guest_id)
 
+    def guest_get_power_states(self, userid_list):
+        """Returns power state of a list of virtual machines.
+
+        All the guests are queried with a single request to xCAT.
+
+        :param list userid_list: the ids of the virtual machines
+
+        :returns: Dictionary of power state keyed by userid, in the form
+                  {'UID1': 'on', 'UID2': 'off'}. The virtual machines that
+                  do not exist are left out.
+        """
+        if not isinstance(userid_list, list):
+            userid_list = [userid_list]
+        return self._vmops.get_power_states(userid_list)
+
     def guest_get_info(self, userid):
         """Get the status of a virtual machine.
 
@@ -175,6 +244,11 @@ class SDKAPI(object):
                format sample: [{'nic_id': XXX, 'mac_addr': YYY}]
         :param ip_addr: IP address of the vm
 
+        The host name of the vm is added to /etc/hosts of xCAT MN within
+        CONF.xcat.makehosts_window seconds, together with the host names
+        of the other vms whose nics were created meanwhile. guest_deploy
+        adds them first, call guest_nic_flush_hosts to add them right away
+        otherwise.
         """
         if len(nic_info) == 0:
             msg = ("no nic info is provided to create nic")
@@ -182,6 +256,13 @@ class SDKAPI(object):
 
         self._networkops.create_nic(vm_id, nic_info, ip_addr=ip_addr)
 
+    def guest_nic_flush_hosts(self):
+        """Add the host names of the vms whose nics were just created into
+        /etc/hosts of xCAT MN now, instead of waiting for the end of the
+        makehosts window.
+        """
+        self._networkops.flush_hosts()
+
     def guest_get_nic_switch_info(self, user_id):
         """ Return the nic and switch pair for the specified vm.
 
@@ -211,9 +292,45 @@ class SDKAPI(object):
 
         :param image_file_path:the absolute path for image file
         :param os_version:the os version of the image
+        :returns: name of the xCAT osimage holding the image, an image of
+                  the same content imported before is not imported again
 
         """
-        self._imageops.image_import(image_file_path, os_version)
+        return self._imageops.image_import(image_file_path, os_version)
+
+    def images_import(self, image_specs):
+        """import many images to z/VM
+
+        The images are hashed, bundled and uploaded to xCAT concurrently,
+        the failure of one image does not stop the import of the others.
+
+        :param image_specs: (list) one dictionary for each image, with the
+               keys image_file_path and os_version, that have the same
+               meaning as the parameters of image_import.
+        :returns: Dictionary of import result keyed by image_file_path, in
+                  the form
+                  {'/images/img1': {'imported': True,
+                                    'osimage': 'rhel7.2-s390x-netboot-img1',
+                                    'size': 2147483648,
+                                    'seconds': 30.5,
+                                    'throughput': 70410938.4},
+                   '/images/img2': {'imported': False,
+                                    'stage': 'bundle',
+                                    'error': 'error message'}}
+                  throughput is in bytes per second, stage is where the
+                  import failed, one of hash, bundle or import.
+        """
+        for spec in image_specs:
+            missing = [k for k in ('image_file_path', 'os_version')
+                       if k not in spec]
+            if missing:
+                msg = ("image spec %(spec)s misses %(keys)s" %
+                       {'spec': spec, 'keys': ', '.join(missing)})
+                raise exception.ZVMInvalidInput(msg=msg)
+
+        return self._imageops.images_import(
+            [(spec['image_file_path'], spec['os_version'])
+             for spec in image_specs])
 
     def guest_create(self, userid, vcpus, memory, disk_list=[],
                      user_profile=CONF.zvm.user_profile):
@@ -246,6 +363,36 @@ class SDKAPI(object):
         """
         self._vmops.create_vm(userid, vcpus, memory, disk_list, user_profile)
 
+    def guests_create(self, guest_specs):
+        """create many vms in z/VM
+
+        The guests are created concurrently, the failure of one guest does
+        not stop the creation of the others.
+
+        :param guest_specs: (list) one dictionary for each guest, with the
+               keys userid, vcpus, memory, disk_list and user_profile, that
+               have the same meaning as the parameters of guest_create.
+               disk_list and user_profile are optional.
+        :returns: Dictionary of creation result keyed by userid, in the form
+                  {'UID1': {'created': True},
+                   'UID2': {'created': False,
+                            'stage': 'create',
+                            'error': 'error message'}}
+                  stage is where the guest creation failed, one of define,
+                  create or add_disks.
+        """
+        for spec in guest_specs:
+            missing = [k for k in ('userid', 'vcpus', 'memory')
+                       if k not in spec]
+            if missing:
+                msg = ("guest spec %(spec)s misses %(keys)s" %
+                       {'spec': spec, 'keys': ', '.join(missing)})
+                raise exception.ZVMInvalidInput(msg=msg)
+        _check_unique([spec['userid'].upper() for spec in guest_specs],
+                      'userid')
+
+        return self._vmops.create_vms(guest_specs)
+
     def image_get_root_disk_size(self, image_file_name):
         """Get the root disk size of the image
 
@@ -388,6 +535,23 @@ class SDKAPI(object):
         """
         return self._vmops.delete_vm(userid)
 
+    def guests_delete(self, userid_list):
+        """Delete many guests
+
+        The guests are deleted concurrently, the failure of one guest does
+        not stop the deletion of the others.
+
+        :param userid_list: a list of guest userids, each given once
+        :returns: Dictionary of deletion result keyed by userid, in the form
+                  {'UID1': {'deleted': True},
+                   'UID2': {'deleted': False,
+                            'error': 'error message'}}
+        """
+        if not isinstance(userid_list, list):
+            userid_list = [userid_list]
+        _check_unique([userid.upper() for userid in userid_list], 'userid')
+        return self._vmops.delete_vms(userid_list)
+
     def guest_inspect_cpus(self, userid_list):
         """Get the cpu statistics of the guest virtual machines
 
@@ -422,6 +586,21 @@ class SDKAPI(object):
         # parsed_uid_list = [uid.upper() for uid in userid_list]
         return self._monitor.inspect_cpus(userid_list)
 
+    def host_get_metering_stats(self):
+        """Get metrics of the background collector of guest statistics
+
+        :returns: Dictionary describing the collector in the form
+                  {'refreshing': False,
+                   'refresh_count': 12,
+                   'refresh_duration': 3.2,
+                   'cache_age': 120.5,
+                   'last_error': None}
+                  refresh_duration is the seconds the last refresh of the
+                  statistics of all guests took, cache_age the seconds since
+                  they were refreshed. Empty until guests are inspected.
+        """
+        return self._monitor.get_collector_stats()
+
     def vswitch_grant_user(self, vswitch_name, userid):
         """Set vswitch to grant user
 
@@ -431,6 +610,19 @@ class SDKAPI(object):
 
         self._networkops.grant_user_to_vswitch(vswitch_name, userid)
 
+    def vswitch_grant_users(self, vswitch_name, userid_list):
+        """Set vswitch to grant a list of users
+
+        All the users are granted with a single request to zhcp, a user
+        that fails to be granted does not stop the others.
+
+        :param str vswitch_name: the name of the vswitch
+        :param list userid_list: the user ids of the vms
+        """
+        if not isinstance(userid_list, list):
+            userid_list = [userid_list]
+        self._networkops.grant_users_to_vswitch(vswitch_name, userid_list)
+
     def vswitch_revoke_user(self, vswitch_name, userid):
         """Revoke user for vswitch
 
@@ -14,16 +14,20 @@
 
 
 import datetime
+import multiprocessing.pool
 import os
 import re
-import shutil
-import tarfile
+import threading
 import xml.dom.minidom as Dom
 
 from zvmsdk import config
 from zvmsdk import constants as const
+from zvmsdk import dirmaint
 from zvmsdk import exception
+from zvmsdk import imagebundle
+from zvmsdk import inventory
 from zvmsdk import log
+from zvmsdk import tablecache
 from zvmsdk import utils as zvmutils
 
 
@@ -31,20 +35,70 @@ CONF = config.CONF
 LOG = log.LOG
 
 _XCAT_CLIENT = None
+_XCAT_CLIENT_LOCK = threading.Lock()
+_IDENTITY_CACHE = None
+_IDENTITY_CACHE_LOCK = threading.Lock()
 
 
 def get_zvmclient():
     if CONF.zvm.client_type == 'xcat':
         global _XCAT_CLIENT
-        if _XCAT_CLIENT is None:
-            return XCATClient()
-        else:
-            return _XCAT_CLIENT
+        with _XCAT_CLIENT_LOCK:
+            if _XCAT_CLIENT is None:
+                _XCAT_CLIENT = XCATClient()
+        return _XCAT_CLIENT
     else:
         # TODO: raise Exception
         pass
 
 
+def get_identity_cache():
+    global _IDENTITY_CACHE
+    with _IDENTITY_CACHE_LOCK:
+        if _IDENTITY_CACHE is None:
+            _IDENTITY_CACHE = IdentityCache()
+    return _IDENTITY_CACHE
+
+
+class IdentityCache(object):
+    """Process wide cache of the zhcp and xCAT MN identities.
+
+    The zhcp hostname, node name and userid, and the xCAT MN node name
+    don't change while the SDK runs, so they are looked up once and shared
+    by all the clients.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._values = {}
+
+    def get(self, name, lookup):
+        """Return the cached value of name, call lookup if not cached.
+
+        A None value returned by lookup is not cached.
+        """
+        with self._lock:
+            if self._values.get(name) is None:
+                value = lookup()
+                if value is not None:
+                    self._values[name] = value
+            return self._values.get(name)
+
+    def peek(self, name):
+        """Return the cached value of name, None if not cached."""
+        return self._values.get(name)
+
+    def set(self, name, value):
+        with self._lock:
+            self._values[name] = value
+
+    def invalidate(self, *names):
+        """Drop the given values from cache, all values if none given."""
+        with self._lock:
+            for name in (names or list(self._values.keys())):
+                self._values.pop(name, None)
+
+
 class ZVMClient(object):
 
     def power_on(self, userid):
@@ -67,10 +121,12 @@ class XCATClient(ZVMClient):
 
     def __init__(self):
         self._xcat_url = zvmutils.get_xcat_url()
-        self._zhcp_info = {}
-        self._zhcp_userid = None
-        self._xcat_node_name = None
+        self._identity = get_identity_cache()
         self._pathutils = zvmutils.PathUtils()
+        self._table_cache = tablecache.get_table_cache()
+        self._inventory = inventory.get_inventory()
+        self._makehosts = zvmutils.Debouncer(self._makehost,
+                                             CONF.xcat.makehosts_window)
 
     def _power_state(self, userid, method, state):
         """Invoke xCAT REST API to set/get power state for a instance."""
@@ -108,16 +164,71 @@ class XCATClient(ZVMClient):
 
         return _get_power_string(res_dict)
 
+    def get_power_states(self, userid_list):
+        """Get power status of a list of z/VM instances.
+
+        The whole list is queried with one rpower request over a noderange,
+        only very long lists are split to keep the request URL short.
+        xCAT fails the whole noderange if one guest of it is unknown, the
+        guests of that noderange are then queried one by one.
+
+        :returns: dictionary of power state keyed by userid, for example
+                  {'userid1': 'on', 'userid2': 'off'}. Guests unknown to
+                  xCAT are left out.
+        """
+        userids = dict((uid.upper(), uid) for uid in userid_list)
+        power_states = {}
+        for noderange in self._split_noderange(userid_list):
+            LOG.debug('Query power stat of %s' % noderange)
+            try:
+                res_dict = self._power_state(noderange, "GET", "stat")
+            except exception.ZVMVirtualMachineNotExist:
+                for userid in noderange.split(','):
+                    try:
+                        power_states[userids.get(userid.upper(), userid)] = \
+                            self.get_power_state(userid)
+                    except exception.ZVMVirtualMachineNotExist:
+                        LOG.warning("Guest %s does not exist, no power "
+                                    "state for it", userid)
+                continue
+            with zvmutils.expect_invalid_xcat_resp_data(res_dict):
+                for info in res_dict['info']:
+                    for ln in '\n'.join(info).split('\n'):
+                        node, sep, state = ln.partition(':')
+                        if not sep:
+                            continue
+                        node = node.strip().upper()
+                        power_states[userids.get(node, node)] = state.strip()
+        return power_states
+
+    def _split_noderange(self, node_list):
+        """Split node list into comma separated noderanges of limited size.
+        """
+        noderange = []
+        length = 0
+        for node in node_list:
+            if noderange and (length + len(node) + 1 >
+                              const.XCAT_NODERANGE_MAX_LEN):
+                yield ','.join(noderange)
+                noderange = []
+                length = 0
+            noderange.append(node)
+            length += len(node) + 1
+        if noderange:
+            yield ','.join(noderange)
+
     def get_host_info(self):
         """ Retrive host information"""
         host = CONF.zvm.host
         url = self._xcat_url.rinv('/' + host)
-        inv_info_raw = zvmutils.xcat_request("GET", url)['info'][0]
+        inv_info_raw = zvmutils.xcat_request("GET", url,
+                                             coalesce=True)['info'][0]
         inv_keys = const.XCAT_RINV_HOST_KEYWORDS
         inv_info = zvmutils.translate_xcat_resp(inv_info_raw[0], inv_keys)
 
         hcp_hostname = inv_info['zhcp']
-        self._zhcp_info = self._construct_zhcp_info(hcp_hostname)
+        self._identity.set('zhcp_info',
+                           self._construct_zhcp_info(hcp_hostname))
 
         return inv_info
 
@@ -138,14 +249,17 @@ class XCATClient(ZVMClient):
         """ Return a Dictionary containing zhcp's hostname,
         nodename and userid
         """
-        if self._zhcp_info != {}:
-            return self._zhcp_info
+        zhcp_info = self._identity.peek('zhcp_info')
+        if zhcp_info is not None:
+            return zhcp_info
         else:
             if hcp_hostname is not None:
                 return self._construct_zhcp_info(hcp_hostname)
             else:
-                self.get_host_info()
-                return self._zhcp_info
+                def _lookup():
+                    self.get_host_info()
+                    return self._identity.peek('zhcp_info')
+                return self._identity.get('zhcp_info', _lookup)
 
     def _construct_zhcp_info(self, hcp_hostname):
         hcp_node = hcp_hostname.partition('.')[0]
@@ -157,23 +271,13 @@ class XCATClient(ZVMClient):
         zvm_host = CONF.zvm.host
         hcp_base = self._get_hcp_info()['hostname']
 
-        url = self._xcat_url.tabdump("/zvm")
-        res_dict = zvmutils.xcat_request("GET", url)
-
         vms = []
-
-        with zvmutils.expect_invalid_xcat_resp_data(res_dict):
-            data_entries = res_dict['data'][0][1:]
-            for data in data_entries:
-                l = data.split(",")
-                node, hcp = l[0].strip("\""), l[1].strip("\"")
-                hcp_short = hcp_base.partition('.')[0]
-
-                # exclude zvm host and zhcp node from the list
-                if (hcp.upper() == hcp_base.upper() and
-                        node.upper() not in (zvm_host.upper(),
-                        hcp_short.upper(), CONF.xcat.master_node.upper())):
-                    vms.append(node)
+        hcp_short = hcp_base.partition('.')[0]
+        for node in self._inventory.list_guests(hcp_base):
+            # exclude zvm host and zhcp node from the list
+            if node.upper() not in (zvm_host.upper(), hcp_short.upper(),
+                                    CONF.xcat.master_node.upper()):
+                vms.append(node)
 
         return vms
 
@@ -186,11 +290,47 @@ class XCATClient(ZVMClient):
     def image_performance_query(self, uid_list):
         """Call Image_Performance_Query to get guest current status.
 
+        Long lists are queried by chunks of CONF.monitor.perf_query_chunk_size
+        userids, run concurrently. The data of the chunks successfully
+        queried is returned even if other chunks failed.
+
         :uid_list: A list of zvm userids to be queried
         """
         if not isinstance(uid_list, list):
             uid_list = [uid_list]
 
+        chunk_size = CONF.monitor.perf_query_chunk_size
+        if chunk_size <= 0 or len(uid_list) <= chunk_size:
+            return self._image_performance_query(uid_list)
+
+        chunks = [uid_list[i:i + chunk_size]
+                  for i in range(0, len(uid_list), chunk_size)]
+        workers = multiprocessing.pool.ThreadPool(
+            min(CONF.monitor.perf_query_workers, len(chunks)))
+        try:
+            results = [workers.apply_async(self._image_performance_query,
+                                           (chunk,))
+                       for chunk in chunks]
+            pi_dict = {}
+            errors = []
+            for chunk, result in zip(chunks, results):
+                try:
+                    pi_dict.update(result.get())
+                except exception.SDKBaseException as err:
+                    LOG.warning("Failed to query performance data of %(num)d "
+                                "guests from %(first)s: %(err)s" %
+                                {'num': len(chunk), 'first': chunk[0],
+                                 'err': err})
+                    errors.append(err)
+        finally:
+            workers.close()
+            workers.join()
+
+        if len(errors) == len(chunks):
+            raise errors[0]
+        return pi_dict
+
+    def _image_performance_query(self, uid_list):
         cmd = ('smcli Image_Performance_Query -T "%(uid_list)s" -c %(num)s' %
                {'uid_list': " ".join(uid_list), 'num': len(uid_list)})
 
@@ -254,9 +394,46 @@ class XCATClient(ZVMClient):
         res_dict = zvmutils.xcat_request("GET", url)
         return res_dict
 
+    @tablecache.invalidate_tables('zvm')
     def create_vm(self, userid, cpu, memory, disk_list, profile):
         # Create node for the vm
         self.prepare_for_spawn(userid)
+        self._mkvm(userid, cpu, memory, disk_list, profile)
+
+        if disk_list:
+            # Add disks for vm
+            self.add_mdisks(userid, disk_list)
+
+    @tablecache.invalidate_tables('zvm')
+    def create_vms(self, vm_list):
+        """Create many guests, pipelining their creation stages.
+
+        The xCAT node definition, user directory creation and disks adding
+        of a guest are done as soon as the previous stage of this guest is
+        done, while the other guests are at other stages.
+
+        :vm_list: A list of dictionary with the userid, cpu, memory,
+                  disk_list and profile of each guest.
+        :returns: list of None or (stage name, exception) of each guest.
+        """
+        def _define(vm):
+            self.prepare_for_spawn(vm['userid'])
+
+        def _create(vm):
+            self._mkvm(vm['userid'], vm['cpu'], vm['memory'],
+                       vm['disk_list'], vm['profile'])
+
+        def _add_disks(vm):
+            if vm['disk_list']:
+                self.add_mdisks(vm['userid'], vm['disk_list'])
+
+        workers = CONF.zvm.bulk_create_workers
+        stages = [('define', _define, workers),
+                  ('create', _create, workers),
+                  ('add_disks', _add_disks, workers)]
+        return zvmutils.run_pipeline(vm_list, stages)
+
+    def _mkvm(self, userid, cpu, memory, disk_list, profile):
         profile = 'profile=%s' % profile
 
         body = [profile,
@@ -280,11 +457,7 @@ class XCATClient(ZVMClient):
             body.append('ipl=%s' % ipl_disk)
 
         url = self._xcat_url.mkvm('/' + userid)
-        zvmutils.xcat_request("POST", url, body)
-
-        if disk_list:
-            # Add disks for vm
-            self.add_mdisks(userid, disk_list)
+        dirmaint.xcat_request("POST", url, body)
 
     def add_mdisks(self, userid, disk_list, start_vdev=None):
         """Add disks for the userid
@@ -332,9 +505,10 @@ class XCATClient(ZVMClient):
             body = [" ".join([action, diskpool_name, vdev, size])]
 
         url = zvmutils.get_xcat_url().chvm('/' + userid)
-        zvmutils.xcat_request("PUT", url, body)
+        dirmaint.xcat_request("PUT", url, body)
 
     # TODO:moving to vmops and change name to 'create_vm_node'
+    @tablecache.invalidate_tables('zvm')
     def create_xcat_node(self, userid):
         """Create xCAT node for z/VM instance."""
         LOG.debug("Creating xCAT node for %s" % userid)
@@ -344,6 +518,7 @@ class XCATClient(ZVMClient):
                 'groups=%s' % const.ZVM_XCAT_GROUP]
         url = self._xcat_url.mkdef('/' + userid)
         zvmutils.xcat_request("POST", url, body)
+        self._inventory.add_guest(userid, CONF.xcat.zhcp, userid)
 
     # xCAT client can something special for xCAT here
     def prepare_for_spawn(self, userid):
@@ -369,11 +544,11 @@ class XCATClient(ZVMClient):
         else:
             body = [" ".join([action, diskpool, vdev, size])]
         url = zvmutils.get_xcat_url().chvm('/' + userid)
-        zvmutils.xcat_request("PUT", url, body)
+        dirmaint.xcat_request("PUT", url, body)
 
     def get_tabdump_info(self):
         url = self._xcat_url.tabdump("/zvm")
-        res_dict = zvmutils.xcat_request("GET", url)
+        res_dict = zvmutils.xcat_request("GET", url, coalesce=True)
         return res_dict
 
     def do_capture(self, nodename, profile):
@@ -384,11 +559,30 @@ class XCATClient(ZVMClient):
         return res
 
     def _clean_network_resource(self, userid):
-        """Clean node records in xCAT mac, host and switch table."""
-        self._delete_mac(userid)
-        self._delete_switch(userid)
-        self._delete_host(userid)
+        """Clean node records in xCAT mac, host and switch table.
+
+        The tables are cleaned concurrently, the failure to clean one of
+        them does not stop the cleaning of the others.
+        """
+        cleaners = (self._delete_mac, self._delete_switch, self._delete_host)
+        workers = multiprocessing.pool.ThreadPool(len(cleaners))
+        try:
+            results = [workers.apply_async(clean, (userid,))
+                       for clean in cleaners]
+            errors = []
+            for result in results:
+                try:
+                    result.get()
+                except exception.ZVMNetworkError as err:
+                    errors.append(err)
+        finally:
+            workers.close()
+            workers.join()
 
+        if errors:
+            raise errors[0]
+
+    @tablecache.invalidate_tables('mac')
     def _delete_mac(self, userid):
         """Remove node mac record from xcat mac table."""
         commands = "-d node=%s mac" % userid
@@ -399,6 +593,7 @@ class XCATClient(ZVMClient):
                 exception.ZVMNetworkError):
             return zvmutils.xcat_request("PUT", url, body)['data']
 
+    @tablecache.invalidate_tables('hosts')
     def _delete_host(self, userid):
         """Remove xcat hosts table rows where node name is node_name."""
         commands = "-d node=%s hosts" % userid
@@ -409,6 +604,7 @@ class XCATClient(ZVMClient):
                 exception.ZVMNetworkError):
             return zvmutils.xcat_request("PUT", url, body)['data']
 
+    @tablecache.invalidate_tables('switch')
     def _delete_switch(self, userid):
         """Remove node switch record from xcat switch table."""
         commands = "-d node=%s switch" % userid
@@ -417,7 +613,9 @@ class XCATClient(ZVMClient):
 
         with zvmutils.expect_xcat_call_failed_and_reraise(
                 exception.ZVMNetworkError):
-            return zvmutils.xcat_request("PUT", url, body)['data']
+            data = zvmutils.xcat_request("PUT", url, body)['data']
+        self._inventory.remove_nics(userid)
+        return data
 
     def create_nic(self, userid, nic_info, ip_addr=None):
         if ip_addr is None:
@@ -427,6 +625,7 @@ class XCATClient(ZVMClient):
         self._preset_vm_network(userid, ip_addr)
         nic_vdev = CONF.zvm.default_nic_vdev
         zhcpnode = self._get_hcp_info()['nodename']
+        nics = []
         for nic_item in nic_info:
             nic_id = nic_item['nic_id']
             mac_addr = nic_item['mac_addr']
@@ -435,26 +634,64 @@ class XCATClient(ZVMClient):
                       'vdev is %(vdev)s',
                       {'id': nic_id, 'address': mac_addr,
                       'vdev': nic_vdev})
-            self._create_nic(userid, nic_id, mac_addr,
-                             nic_vdev, zhcpnode)
+            nics.append((nic_id, mac_addr, nic_vdev))
             nic_vdev = str(hex(int(nic_vdev, 16) + 3))[2:]
+        self._create_nics(userid, nics, zhcpnode)
 
-    def _create_nic(self, userid, nic_id, mac_address, vdev, zhcpnode):
+    def _mac_table_value(self, userid, nics):
+        """Return the mac column of the mac table row of userid.
+
+        xCAT keys the mac table by node: a node with one NIC has its mac
+        address, a node with more has them in "mac!hostname" format
+        separated by '|', the first one bound to the node name and the
+        others to "node-vdev".
+        """
+        if len(nics) == 1:
+            return nics[0][1]
+        return '|'.join(
+            '%s!%s' % (mac_address, userid if i == 0 else
+                       '%s-%s' % (userid, vdev))
+            for i, (_nic_id, mac_address, vdev) in enumerate(nics))
+
+    def _create_nics(self, userid, nics, zhcpnode):
+        """Create the NICs of userid with one directory update.
+
+        The mac table row of userid is written once for all the NICs, its
+        interface is the one of the first NIC. The switch table has one
+        row per NIC and a tabch request writes a single row, so these are
+        still one request per NIC, concurrent.
+
+        :nics: list of (nic_id, mac_address, vdev) tuples.
+        """
         self._delete_mac(userid)
-        self._add_mac_table_record(userid, vdev, mac_address, zhcpnode)
-        self._add_switch_table_record(userid, nic_id, vdev, zhcpnode)
+        self._add_mac_table_record(userid, nics[0][2],
+                                   self._mac_table_value(userid, nics),
+                                   zhcpnode)
+
+        def _add_switch(nic):
+            self._add_switch_table_record(userid, nic[0], nic[2], zhcpnode)
+
+        if len(nics) == 1:
+            _add_switch(nics[0])
+        else:
+            workers = multiprocessing.pool.ThreadPool(len(nics))
+            try:
+                workers.map(_add_switch, nics)
+            finally:
+                workers.close()
+                workers.join()
 
-        mac = ''.join(mac_address.split(':'))[6:]
         url = self._xcat_url.chvm('/' + userid)
-        commands = ' '.join((
-            'Image_Definition_Update_DM -T %userid%',
-            '-k \'NICDEF=VDEV=%s TYPE=QDIO' % vdev,
-            'MACID=%s\'' % mac))
+        commands = ' '.join(['Image_Definition_Update_DM -T %userid%'] + [
+            ' '.join(('-k \'NICDEF=VDEV=%s TYPE=QDIO' % vdev,
+                      'MACID=%s\'' % ''.join(mac_address.split(':'))[6:]))
+            for (_nic_id, mac_address, vdev) in nics])
         body = ['--smcli', commands]
 
         with zvmutils.expect_invalid_xcat_resp_data():
-            zvmutils.xcat_request("PUT", url, body)
+            dirmaint.xcat_request("PUT", url, body)
 
+    @tablecache.invalidate_tables('mac')
     def _add_mac_table_record(self, userid, interface, mac, zhcp=None):
         """Add node name, interface, mac address into xcat mac table."""
         commands = ' '.join(("mac.node=%s" % userid,
@@ -469,6 +706,7 @@ class XCATClient(ZVMClient):
                 exception.ZVMNetworkError):
             return zvmutils.xcat_request("PUT", url, body)['data']
 
+    @tablecache.invalidate_tables('switch')
     def _add_switch_table_record(self, userid, nic_id, interface, zhcp=None):
         """Add node name and nic name address into xcat switch table."""
         commands = ' '.join(("switch.node=%s" % userid,
@@ -481,7 +719,9 @@ class XCATClient(ZVMClient):
 
         with zvmutils.expect_xcat_call_failed_and_reraise(
                 exception.ZVMNetworkError):
-            return zvmutils.xcat_request("PUT", url, body)['data']
+            data = zvmutils.xcat_request("PUT", url, body)['data']
+        self._inventory.add_nic(userid, nic_id, interface, zhcp)
+        return data
 
     def _update_vm_info(self, node, node_info):
         """node_info looks like : ['sles12', 's390x', 'netboot',
@@ -501,6 +741,8 @@ class XCATClient(ZVMClient):
     def guest_deploy(self, node, image_name, transportfiles=None, vdev=None):
         """image_name format looks like:
         sles12-s390x-netboot-0a0c576a_157f_42c8_bde5_2a254d8b77fc"""
+        # the host name of the node must be in /etc/hosts before nodeset
+        self._makehosts.flush()
         # Update node info before deploy
         node_info = image_name.split('-')
         self._update_vm_info(node, node_info)
@@ -519,26 +761,54 @@ class XCATClient(ZVMClient):
                 exception.ZVMXCATDeployNodeFailed):
             zvmutils.xcat_request("PUT", url, body)
 
+    def get_free_space_xcat(self, zvm_xcat_master):
+        """Return the free space of /install on xCAT MN, in bytes."""
+        resp = zvmutils.xdsh(zvm_xcat_master, '/bin/df -P -k /install')
+        with zvmutils.expect_invalid_xcat_resp_data(resp):
+            # "xcat: /dev/dasdb1 20642428 10285784 9307788 53% /install"
+            fields = resp['data'][0][0].strip().splitlines()[-1].split()
+            return int(fields[-3]) * 1024
+
     def check_space_imgimport_xcat(self, tar_file, xcat_free_space_threshold,
                                    zvm_xcat_master):
-        pass
+        """Check that importing tar_file to xCAT MN leaves at least
+        xcat_free_space_threshold GB free in its /install.
+
+        tar_file can also be the image file the bundle is built from.
+        """
+        size = os.path.getsize(tar_file)
+        free_space = (self.get_free_space_xcat(zvm_xcat_master) -
+                      xcat_free_space_threshold * const.GiB)
+        if size > free_space:
+            msg = ("Not enough space on xCAT MN to import %(file)s: "
+                   "%(size)d bytes needed, %(free)d bytes available above "
+                   "the %(threshold)d GB threshold" %
+                   {'file': tar_file, 'size': size,
+                    'free': max(free_space, 0),
+                    'threshold': xcat_free_space_threshold})
+            raise exception.ZVMImageError(msg=msg)
 
     def export_image(self, image_file_path):
         pass
 
-    def image_import(self, image_bundle_package, image_profile):
+    def image_import(self, image_bundle_package, image_profile,
+                     streamed=False, compressed=False):
         """
         Import the image bundle from computenode to xCAT's image repository.
         :param image_bundle_package: image bundle file path
                 eg,'/root/images/xxxx.img.tar'
         :param image_profile: mostly use image_uuid
                 eg,'9c95464_2a53_11e7_87fd_020000012'
+        :param streamed: whether image_bundle_package is the path on xCAT MN
+                returned by stream_image_bundle
+        :param compressed: whether image_bundle_package is a gzipped tar
         """
-        remote_host_info = zvmutils.get_host()
         body = ['osimage=%s' % image_bundle_package,
-                'profile=%s' % image_profile,
-                'remotehost=%s' % remote_host_info,
-                'nozip']
+                'profile=%s' % image_profile]
+        if not streamed:
+            body.append('remotehost=%s' % zvmutils.get_host())
+        if not compressed:
+            body.append('nozip')
         url = self._xcat_url.imgimport()
 
         try:
@@ -550,27 +820,25 @@ class XCATClient(ZVMClient):
                    err.format_message())
             raise exception.ZVMImageError(msg=msg)
         finally:
-            os.remove(image_bundle_package)
-            return resp
+            if streamed:
+                host = imagebundle.split_target(
+                    CONF.xcat.bundle_stream_target)[0]
+                imagebundle.remove_remote(host, image_bundle_package)
+            else:
+                os.remove(image_bundle_package)
+        return resp
 
     def get_vm_nic_switch_info(self, vm_id):
         """
         Get NIC and switch mapping for the specified virtual machine.
         """
-        url = self._xcat_url.tabdump("/switch")
-        with zvmutils.expect_invalid_xcat_resp_data():
-            switch_info = zvmutils.xcat_request("GET", url)['data'][0]
-            switch_info.pop(0)
-            switch_dict = {}
-            for item in switch_info:
-                switch_list = item.split(',')
-                if switch_list[0].strip('"') == vm_id:
-                    switch_dict[switch_list[4].strip('"')] = \
-                                            switch_list[1].strip('"')
-
-            LOG.debug("Switch info the %(vm_id)s is %(switch_dict)s",
-                      {"vm_id": vm_id, "switch_dict": switch_dict})
-            return switch_dict
+        switch_dict = {}
+        for row in self._inventory.get_nics(vm_id):
+            switch_dict[row['interface']] = row['switch']
+
+        LOG.debug("Switch info the %(vm_id)s is %(switch_dict)s",
+                  {"vm_id": vm_id, "switch_dict": switch_dict})
+        return switch_dict
 
     def _config_xcat_mac(self, vm_id):
         """Hook xCat to prevent assign MAC for instance."""
@@ -578,6 +846,7 @@ class XCATClient(ZVMClient):
         nic_name = "fake"
         self._add_mac_table_record(vm_id, nic_name, fake_mac_addr)
 
+    @tablecache.invalidate_tables('hosts')
     def _add_host_table_record(self, vm_id, ip, host_name):
         """Add/Update hostname/ip bundle in xCAT MN nodes table."""
         commands = ' '.join(("node=%s" % vm_id,
@@ -603,32 +872,28 @@ class XCATClient(ZVMClient):
                   vm_id)
 
         self._add_host_table_record(vm_id, ip_addr, vm_id)
-        self._makehost()
+        self._makehosts.request()
+
+    def flush_makehosts(self):
+        """Update xCAT MN /etc/hosts file now if hosts table changed."""
+        self._makehosts.flush()
 
     def _get_nic_ids(self):
-        addp = ''
-        url = self._xcat_url.tabdump("/switch", addp)
-        with zvmutils.expect_invalid_xcat_resp_data():
-            nic_settings = zvmutils.xcat_request("GET", url)['data'][0]
-        # remove table header
-        nic_settings.pop(0)
-        # it's possible to return empty array
-        return nic_settings
+        # raw switch table rows without table header, it's possible to
+        # return empty array
+        return list(self._table_cache.get_table('switch').lines)
 
     def _get_userid_from_node(self, vm_id):
-        addp = '&col=node&value=%s&attribute=userid' % vm_id
-        url = self._xcat_url.gettab("/zvm", addp)
-        with zvmutils.expect_invalid_xcat_resp_data():
-            return zvmutils.xcat_request("GET", url)['data'][0][0]
+        guest = self._inventory.get_guest(vm_id)
+        with zvmutils.expect_invalid_xcat_resp_data(guest):
+            return guest['userid']
 
     def _get_nic_settings(self, port_id, field=None, get_node=False):
         """Get NIC information from xCat switch table."""
         LOG.debug("Get nic information for port: %s", port_id)
-        addp = '&col=port&value=%s' % port_id + '&attribute=%s' % (
-                                                field and field or 'node')
-        url = self._xcat_url.gettab("/switch", addp)
-        with zvmutils.expect_invalid_xcat_resp_data():
-            ret_value = zvmutils.xcat_request("GET", url)['data'][0][0]
+        rows = self._inventory.get_nics_by_port(port_id)
+        with zvmutils.expect_invalid_xcat_resp_data(rows):
+            ret_value = rows[0][field and field or 'node']
         if field is None and not get_node:
             ret_value = self._get_userid_from_node(ret_value)
         return ret_value
@@ -638,17 +903,18 @@ class XCATClient(ZVMClient):
 
     def grant_user_to_vswitch(self, vswitch_name, userid):
         """Set vswitch to grant user."""
-        zhcp = CONF.xcat.zhcp_node
-        url = self._xcat_url.xdsh("/%s" % zhcp)
-        commands = ' '.join((
+        self.grant_users_to_vswitch(vswitch_name, [userid])
+
+    def grant_users_to_vswitch(self, vswitch_name, userid_list):
+        """Set vswitch to grant a list of users with one xdsh call."""
+        commands = [' '.join((
             '/opt/zhcp/bin/smcli Virtual_Network_Vswitch_Set_Extended',
             "-T %s" % userid,
             "-k switch_name=%s" % vswitch_name,
             "-k grant_userid=%s" % userid,
-            "-k persist=YES"))
-        xdsh_commands = 'command=%s' % commands
-        body = [xdsh_commands]
-        zvmutils.xcat_request("PUT", url, body)
+            "-k persist=YES")) for userid in userid_list]
+        zvmutils.xdsh_batch(CONF.xcat.zhcp_node, commands,
+                            stop_on_error=False)
 
     def revoke_user_from_vswitch(self, vswitch_name, userid):
         """Revoke user for vswitch."""
@@ -666,55 +932,46 @@ class XCATClient(ZVMClient):
 
     def _couple_nic(self, vswitch_name, userid, vdev, persist=True):
         """Couple NIC to vswitch by adding vswitch into user direct."""
-        zhcp = CONF.xcat.zhcp_node
-        url = self._xcat_url.xdsh("/%s" % zhcp)
+        commands = []
         if persist:
-            commands = ' '.join(('/opt/zhcp/bin/smcli',
-                                 'Virtual_Network_Adapter_Connect_Vswitch_DM',
-                                 "-T %s" % userid,
-                                 "-v %s" % vdev,
-                                 "-n %s" % vswitch_name))
-            xdsh_commands = 'command=%s' % commands
-            body = [xdsh_commands]
-            zvmutils.xcat_request("PUT", url, body)
+            commands.append(' '.join((
+                '/opt/zhcp/bin/smcli',
+                'Virtual_Network_Adapter_Connect_Vswitch_DM',
+                "-T %s" % userid,
+                "-v %s" % vdev,
+                "-n %s" % vswitch_name)))
 
         # the inst must be active, or this call will failed
-        commands = ' '.join(('/opt/zhcp/bin/smcli',
-                             'Virtual_Network_Adapter_Connect_Vswitch',
-                             "-T %s" % userid,
-                             "-v %s" % vdev,
-                             "-n %s" % vswitch_name))
-        xdsh_commands = 'command=%s' % commands
-        body = [xdsh_commands]
-        zvmutils.xcat_request("PUT", url, body)
+        commands.append(' '.join(('/opt/zhcp/bin/smcli',
+                                  'Virtual_Network_Adapter_Connect_Vswitch',
+                                  "-T %s" % userid,
+                                  "-v %s" % vdev,
+                                  "-n %s" % vswitch_name)))
+        zvmutils.xdsh_batch(CONF.xcat.zhcp_node, commands)
 
     def couple_nic_to_vswitch(self, vswitch_name, nic_vdev,
                               userid, persist=True):
         """Couple nic to vswitch."""
         LOG.debug("Connect nic to switch: %s", vswitch_name)
         self._couple_nic(vswitch_name, userid, nic_vdev, persist)
+        self._inventory.set_nic_switch(userid, nic_vdev, vswitch_name)
 
     def _uncouple_nic(self, userid, vdev, persist=True):
         """Uncouple NIC from vswitch"""
-        zhcp = CONF.xcat.zhcp_node
-        url = self._xcat_url.xdsh("/%s" % zhcp)
+        commands = []
         if persist:
-            commands = ' '.join(('/opt/zhcp/bin/smcli',
-                                 'Virtual_Network_Adapter_Disconnect_DM',
-                                 "-T %s" % userid,
-                                 "-v %s" % vdev))
-            xdsh_commands = 'command=%s' % commands
-            body = [xdsh_commands]
-            zvmutils.xcat_request("PUT", url, body)
+            commands.append(' '.join((
+                '/opt/zhcp/bin/smcli',
+                'Virtual_Network_Adapter_Disconnect_DM',
+                "-T %s" % userid,
+                "-v %s" % vdev)))
 
         # the inst must be active, or this call will failed
-        commands = ' '.join(('/opt/zhcp/bin/smcli',
-                             'Virtual_Network_Adapter_Disconnect',
-                             "-T %s" % userid,
-                             "-v %s" % vdev))
-        xdsh_commands = 'command=%s' % commands
-        body = [xdsh_commands]
-        zvmutils.xcat_request("PUT", url, body)
+        commands.append(' '.join(('/opt/zhcp/bin/smcli',
+                                  'Virtual_Network_Adapter_Disconnect',
+                                  "-T %s" % userid,
+                                  "-v %s" % vdev)))
+        zvmutils.xdsh_batch(CONF.xcat.zhcp_node, commands)
 
     def uncouple_nic_from_vswitch(self, vswitch_name, nic_vdev,
                                   userid, persist=True):
@@ -726,19 +983,18 @@ class XCATClient(ZVMClient):
         addp = '&col=key&value=master&attribute=value'
         url = self._xcat_url.gettab("/site", addp)
         with zvmutils.expect_invalid_xcat_resp_data():
-            return zvmutils.xcat_request("GET", url)['data'][0][0]
+            return zvmutils.xcat_request("GET", url,
+                                         coalesce=True)['data'][0][0]
 
     def _get_xcat_node_name(self):
-        if self._xcat_node_name is not None:
-            return self._xcat_node_name
+        def _lookup():
+            xcat_ip = self._get_xcat_node_ip()
+            addp = '&col=ip&value=%s&attribute=node' % (xcat_ip)
+            url = self._xcat_url.gettab("/hosts", addp)
+            with zvmutils.expect_invalid_xcat_resp_data():
+                return zvmutils.xcat_request("GET", url)['data'][0][0]
 
-        xcat_ip = self._get_xcat_node_ip()
-        addp = '&col=ip&value=%s&attribute=node' % (xcat_ip)
-        url = self._xcat_url.gettab("/hosts", addp)
-        with zvmutils.expect_invalid_xcat_resp_data():
-            self._xcat_node_name = zvmutils.xcat_request(
-                "GET", url)['data'][0][0]
-            return self._xcat_node_name
+        return self._identity.get('xcat_node_name', _lookup)
 
     @zvmutils.wrap_invalid_xcat_resp_data_error
     def get_vswitch_list(self):
@@ -762,9 +1018,20 @@ class XCATClient(ZVMClient):
             return output
 
     def _get_zhcp_userid(self):
-        if not self._zhcp_userid:
-            self._zhcp_userid = self._get_userid_from_node(CONF.xcat.zhcp_node)
-        return self._zhcp_userid
+        return self._identity.get(
+            'zhcp_userid',
+            lambda: self._get_userid_from_node(CONF.xcat.zhcp_node))
+
+    def warm_identity_cache(self, refresh=False):
+        """Look up the zhcp and xCAT MN identities shared by all clients.
+
+        :param refresh: look them up again even if they are cached.
+        """
+        if refresh:
+            self._identity.invalidate()
+        self._get_hcp_info()
+        self._get_zhcp_userid()
+        self._get_xcat_node_name()
 
     @zvmutils.wrap_invalid_xcat_resp_data_error
     def add_vswitch(self, name, rdev,
@@ -885,8 +1152,10 @@ class XCATClient(ZVMClient):
         image_list = []
         if res['info']:
             if imagekeyword:
-                image_name = res['info'][0][0].strip().split(" ")[0]
-                image_list.append(image_name)
+                # the keyword is a regular expression, list all matches
+                for img in res['info'][0]:
+                    image_name = img.strip().split(" ")[0]
+                    image_list.append(image_name)
             elif len(res['info'][0]) >= 2:
                 for img in res['info'][0]:
                     image_name = img.strip().split(" ")[0]
@@ -1001,6 +1270,17 @@ class XCATClient(ZVMClient):
             else:
                 raise err
 
+    @tablecache.invalidate_tables()
+    def delete_vms(self, userid_list):
+        """Delete many guests, CONF.zvm.bulk_delete_workers at a time.
+
+        :returns: list of None or exception raised deleting each guest.
+        """
+        stages = [('delete', self.delete_vm, CONF.zvm.bulk_delete_workers)]
+        return [failure and failure[1] for failure in
+                zvmutils.run_pipeline(userid_list, stages)]
+
+    @tablecache.invalidate_tables()
     def delete_xcat_node(self, nodename):
         """Remove xCAT node for z/VM instance."""
         url = self._xcat_url.rmdef('/' + nodename)
@@ -1009,15 +1289,16 @@ class XCATClient(ZVMClient):
         except exception.ZVMXCATInternalError as err:
             if err.format_message().__contains__("Could not find an object"):
                 # The xCAT node not exist
-                return
+                pass
             else:
                 raise err
+        self._inventory.remove_guest(nodename)
 
     def unlock_userid(self, userid):
         """Unlock the specified userid"""
         cmd = "/opt/zhcp/bin/smcli Image_Unlock_DM -T %s" % userid
         zhcp_node = CONF.xcat.zhcp_node
-        zvmutils.xdsh(zhcp_node, cmd)
+        dirmaint.xdsh(zhcp_node, cmd)
 
     def unlock_devices(self, userid):
         cmd = "/opt/zhcp/bin/smcli Image_Lock_Query_DM -T %s" % userid
@@ -1033,7 +1314,7 @@ class XCATClient(ZVMClient):
         def _unlock_device(vdev):
             cmd = ("/opt/zhcp/bin/smcli Image_Unlock_DM -T %(uid)s -v %(vdev)s"
                    % {'uid': userid, 'vdev': vdev})
-            zvmutils.xdsh(zhcp_node, cmd)
+            dirmaint.xdsh(zhcp_node, cmd)
 
         resp_list = resp_str.split('\n')
         for s in resp_list:
@@ -1041,10 +1322,11 @@ class XCATClient(ZVMClient):
                 vdev = s.rpartition(':')[2].strip()
                 _unlock_device(vdev)
 
+    @tablecache.invalidate_tables()
     def delete_userid(self, userid):
         url = self._xcat_url.rmvm('/' + userid)
         try:
-            zvmutils.xcat_request("DELETE", url)
+            dirmaint.xcat_request("DELETE", url)
         except exception.ZVMXCATInternalError as err:
             emsg = err.format_message()
             LOG.debug("error emsg in delete_userid: %s", emsg)
@@ -1054,6 +1336,7 @@ class XCATClient(ZVMClient):
                 self.delete_xcat_node(userid)
             else:
                 raise
+        self._inventory.remove_guest(userid)
 
     def _rewr(self, manifest_path):
         f = open(manifest_path + '/manifest.xml', 'r')
@@ -1149,26 +1432,52 @@ class XCATClient(ZVMClient):
 
         return manifest_path + '/manifest.xml'
 
+    def _write_image_bundle(self, fd, time_stamp_dir, image_name,
+                            image_file_path, codec='none'):
+        bundle_file_path = self._pathutils.get_bundle_tmp_path(time_stamp_dir)
+        stream = None
+        if codec == 'gzip':
+            stream = imagebundle.GzipStream(
+                fd, CONF.xcat.bundle_compression_workers)
+        try:
+            writer = imagebundle.BundleWriter(fd, stream)
+            writer.add_directory(time_stamp_dir, bundle_file_path)
+            writer.add_file(time_stamp_dir + '/manifest.xml',
+                            os.path.join(bundle_file_path, 'manifest.xml'))
+            writer.add_file(time_stamp_dir + '/' + image_name,
+                            image_file_path)
+            writer.close()
+        except Exception:
+            if stream is not None:
+                stream.abort()
+            raise
+        if stream is not None:
+            LOG.debug("Compressed the image bundle of %(path)s from "
+                      "%(in)d to %(out)d bytes" %
+                      {'path': image_file_path, 'in': stream.bytes_in,
+                       'out': stream.bytes_out})
+
+    def _get_image_bundle_name(self, image_name, codec):
+        if codec == 'gzip':
+            return image_name + '.tgz'
+        return image_name + '.tar'
+
     def generate_image_bundle(self, spawn_path, time_stamp_dir,
-                              image_name, image_file_path):
+                              image_name, image_file_path, codec='none'):
         """
         Generate the image bundle which is used to import to xCAT MN's
         image repository.
+        :param codec: one of imagebundle.CODECS
         """
-        image_bundle_name = image_name + '.tar'
+        image_bundle_name = self._get_image_bundle_name(image_name, codec)
         tar_file = spawn_path + '/' + time_stamp_dir + '_' + image_bundle_name
         LOG.debug("The generate the image bundle file is %s", tar_file)
 
-        # copy tmp image file to bundle path
         bundle_file_path = self._pathutils.get_bundle_tmp_path(time_stamp_dir)
-        image_file_copy = os.path.join(bundle_file_path, image_name)
-        shutil.copyfile(image_file_path, image_file_copy)
-
-        os.chdir(spawn_path)
-        tarFile = tarfile.open(tar_file, mode='w')
         try:
-            tarFile.add(time_stamp_dir)
-            tarFile.close()
+            with open(tar_file, 'wb') as f:
+                self._write_image_bundle(f.fileno(), time_stamp_dir,
+                                         image_name, image_file_path, codec)
         except Exception as err:
             msg = ("Generate image bundle failed: %s" % err)
             LOG.error(msg)
@@ -1176,13 +1485,43 @@ class XCATClient(ZVMClient):
                 os.remove(tar_file)
             raise exception.ZVMImageError(msg=msg)
         finally:
-            self._pathutils.clean_temp_folder(time_stamp_dir)
+            self._pathutils.clean_temp_folder(bundle_file_path)
+
+        return tar_file
+
+    def stream_image_bundle(self, time_stamp_dir, image_name,
+                            image_file_path, codec='none'):
+        """
+        Write the image bundle straight to CONF.xcat.bundle_stream_target
+        on xCAT MN over ssh, return its path there.
+        """
+        host, directory = imagebundle.split_target(
+            CONF.xcat.bundle_stream_target)
+        tar_file = (directory.rstrip('/') + '/' + time_stamp_dir + '_' +
+                    self._get_image_bundle_name(image_name, codec))
+        LOG.debug("Streaming the image bundle to %(host)s:%(file)s",
+                  {'host': host, 'file': tar_file})
+
+        bundle_file_path = self._pathutils.get_bundle_tmp_path(time_stamp_dir)
+        remote_file = None
+        try:
+            remote_file = imagebundle.RemoteFile(host, tar_file)
+            self._write_image_bundle(remote_file.fileno(), time_stamp_dir,
+                                     image_name, image_file_path, codec)
+            remote_file.close()
+        except Exception as err:
+            msg = ("Stream image bundle to %(host)s failed: %(err)s" %
+                   {'host': host, 'err': err})
+            LOG.error(msg)
+            if remote_file is not None:
+                remote_file.abort()
+            raise exception.ZVMImageError(msg=msg)
+        finally:
+            self._pathutils.clean_temp_folder(bundle_file_path)
 
         return tar_file
 
     def set_vswitch_port_vlan_id(self, vswitch_name, userid, vlan_id):
-        zhcp = CONF.xcat.zhcp_node
-        url = self._xcat_url.xdsh("/%s" % zhcp)
         commands = ' '.join((
             '/opt/zhcp/bin/smcli Virtual_Network_Vswitch_Set_Extended',
             "-T %s" % userid,
@@ -1190,9 +1529,7 @@ class XCATClient(ZVMClient):
             "-k switch_name=%s" % vswitch_name,
             "-k user_vlan_id=%s" % vlan_id,
             "-k persist=YES"))
-        xdsh_commands = 'command=%s' % commands
-        body = [xdsh_commands]
-        zvmutils.xcat_request("PUT", url, body)
+        zvmutils.xdsh_batch(CONF.xcat.zhcp_node, [commands])
 
     def update_nic_definition(self, userid, nic_vdev, mac, switch_name):
         """add one NIC's info to user direct."""
@@ -1206,4 +1543,77 @@ class XCATClient(ZVMClient):
         body = ['--smcli', commands]
 
         with zvmutils.expect_invalid_xcat_resp_data():
-            zvmutils.xcat_request("PUT", url, body)
+            dirmaint.xcat_request("PUT", url, body)
+        self._inventory.set_nic_switch(userid, nic_vdev, switch_name)
+
+
+class AsyncXCATClient(object):
+    """Issue xCAT REST requests without blocking the caller.
+
+    Each operation is queued to a bounded pool of worker threads and
+    returns a multiprocessing.pool.AsyncResult right away, call get() on
+    it to wait for the parsed xCAT response or the raised exception. The
+    requests are sent over a connection pool owned by this client, so a
+    large batch does not starve the process wide xCAT connection pool.
+
+    Example:
+        aclient = AsyncXCATClient()
+        results = [aclient.power(uid, 'stat') for uid in userids]
+        states = [r.get() for r in results]
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or CONF.xcat.async_max_workers
+        self._xcat_url = zvmutils.get_xcat_url()
+        self._conn_pool = zvmutils.XCATConnectionPool(
+            CONF.xcat.server, 443, CONF.xcat.ca_file,
+            timeout=CONF.xcat.connection_timeout,
+            pool_size=self.max_workers,
+            idle_timeout=CONF.xcat.connection_idle_timeout)
+        self._workers = multiprocessing.pool.ThreadPool(self.max_workers)
+
+    def _submit(self, method, url, body=None, dirmaint_change=False):
+        # requests changing the z/VM directory go through the DirMaint
+        # concurrency limiter shared with XCATClient
+        request = (dirmaint.xcat_request if dirmaint_change else
+                   zvmutils.xcat_request)
+        return self._workers.apply_async(request, (method, url, body),
+                                         {'conn_pool': self._conn_pool})
+
+    def power(self, userid, state):
+        """Set power state on|off|reset, or query it with 'stat'."""
+        method = "GET" if state == 'stat' else "PUT"
+        return self._submit(method, self._xcat_url.rpower('/' + userid),
+                            [state])
+
+    def rinv(self, node, addp=None):
+        return self._submit("GET", self._xcat_url.rinv('/' + node, addp))
+
+    def tabdump(self, table, addp=None):
+        return self._submit("GET", self._xcat_url.tabdump('/' + table, addp))
+
+    def tabch(self, table, commands):
+        return self._submit("PUT", self._xcat_url.tabch('/' + table),
+                            [commands])
+
+    def xdsh(self, node, commands):
+        body = ['command=%s' % commands, 'options=-q']
+        return self._submit("PUT", self._xcat_url.xdsh('/' + node), body)
+
+    def chvm(self, userid, body):
+        return self._submit("PUT", self._xcat_url.chvm('/' + userid), body,
+                            dirmaint_change=True)
+
+    def mkvm(self, userid, body):
+        return self._submit("POST", self._xcat_url.mkvm('/' + userid), body,
+                            dirmaint_change=True)
+
+    def rmvm(self, userid):
+        return self._submit("DELETE", self._xcat_url.rmvm('/' + userid),
+                            dirmaint_change=True)
+
+    def close(self):
+        """Wait for queued requests and release threads and connections."""
+        self._workers.close()
+        self._workers.join()
+        self._conn_pool.close()
@@ -53,9 +53,49 @@ zvm_opts = [
         section='xcat',
         default=3600,
         opt_type='int'),
+    Opt('connection_pool_size',
+        section='xcat',
+        default=10,
+        opt_type='int'),
+    Opt('connection_idle_timeout',
+        section='xcat',
+        default=60,
+        opt_type='int'),
+    Opt('table_cache_ttl',
+        section='xcat',
+        default=60,
+        opt_type='int'),
+    Opt('inventory_db',
+        section='xcat',
+        default=':memory:'),
+    Opt('inventory_reconcile_interval',
+        section='xcat',
+        default=600,
+        opt_type='int'),
+    Opt('makehosts_window',
+        section='xcat',
+        default=5,
+        opt_type='int'),
+    Opt('async_max_workers',
+        section='xcat',
+        default=16,
+        opt_type='int'),
+    Opt('bundle_stream_target',
+        section='xcat'),
+    Opt('bundle_compression',
+        section='xcat',
+        default='none'),
+    Opt('bundle_compression_workers',
+        section='xcat',
+        default=4,
+        opt_type='int'),
+    Opt('bundle_link_bandwidth',
+        section='xcat',
+        default=100,
+        opt_type='int'),
     Opt('free_space_threshold',
         section='xcat',
-        default=50,
+        default=0,
         opt_type='int'),
     Opt('mgt_ip',
         section='xcat',
@@ -96,6 +136,32 @@ zvm_opts = [
     Opt('image_tmp_path',
         section='zvm',
         default='/tmp/zvmsdk/images/'),
+    Opt('image_store_db',
+        section='zvm'),
+    Opt('dirmaint_max_concurrency',
+        section='zvm',
+        default=8,
+        opt_type='int'),
+    Opt('bulk_create_workers',
+        section='zvm',
+        default=8,
+        opt_type='int'),
+    Opt('bulk_delete_workers',
+        section='zvm',
+        default=8,
+        opt_type='int'),
+    Opt('bulk_import_workers',
+        section='zvm',
+        default=2,
+        opt_type='int'),
+    Opt('power_poll_min_interval',
+        section='zvm',
+        default=1,
+        opt_type='int'),
+    Opt('power_poll_max_interval',
+        section='zvm',
+        default=10,
+        opt_type='int'),
     # network options
     Opt('my_ip',
         section='network'),
@@ -131,6 +197,14 @@ zvm_opts = [
         default=600,
         opt_type='int',
         ),
+    Opt('perf_query_chunk_size',
+        section='monitor',
+        default=200,
+        opt_type='int'),
+    Opt('perf_query_workers',
+        section='monitor',
+        default=4,
+        opt_type='int'),
     ]
 
 
@@ -48,6 +48,16 @@ XCAT_DISKPOOL_KEYWORDS = {
 
 XCAT_RESPONSE_KEYS = ('info', 'data', 'node', 'errorcode', 'error')
 
+# Keep the noderange in xCAT request URLs well below the 8K request line
+# limit of the web server
+XCAT_NODERANGE_MAX_LEN = 6000
+
+# Marks the exit code of each command run by utils.xdsh_batch
+XDSH_RC_MARKER = '@@XDSH_RC@@'
+
+MiB = 1024 * 1024
+GiB = 1024 * MiB
+
 ZVM_VOLUMES_FILE = 'zvm_volumes'
 ZVM_VOLUME_STATUS = ['free', 'in-use']
 VOLUME_MULTI_PASS = 'MULTI'
@@ -0,0 +1,170 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import threading
+import time
+
+from zvmsdk import config
+from zvmsdk import exception
+from zvmsdk import log
+from zvmsdk import utils as zvmutils
+
+
+CONF = config.CONF
+LOG = log.LOG
+
+_DIRMAINT_LIMITER = None
+_DIRMAINT_LIMITER_LOCK = threading.Lock()
+
+
+def get_dirmaint_limiter():
+    global _DIRMAINT_LIMITER
+    with _DIRMAINT_LIMITER_LOCK:
+        if _DIRMAINT_LIMITER is None:
+            _DIRMAINT_LIMITER = AIMDLimiter(
+                CONF.zvm.dirmaint_max_concurrency)
+    return _DIRMAINT_LIMITER
+
+
+def _is_congested(resp):
+    """Whether DirMaint reported its request counter save condition."""
+    if not isinstance(resp, dict):
+        return False
+    return any(zvmutils._is_recoverable_issue(str(e))
+               for e in resp.get('error', []))
+
+
+def _request_operation(method, url, body=None):
+    """Return the kind of directory change a xCAT request does.
+
+    For example 'POST vms' for mkvm, 'PUT vms --add3390' for adding a
+    disk and 'PUT vms Image_Definition_Update_DM' for a smcli command.
+    """
+    operation = [method] + url.split('?')[0].split('/')[2:3]
+    if body:
+        if body[0] == '--smcli' and len(body) > 1:
+            operation.append(body[1].split()[0])
+        elif body[0].startswith('--'):
+            operation.append(body[0].split()[0])
+    return ' '.join(operation)
+
+
+def _command_operation(commands):
+    """Return the smcli function run by commands."""
+    words = [w for w in commands.split() if not w.startswith('/')]
+    return 'xdsh ' + (words[0] if words else '')
+
+
+def xcat_request(method, url, body=None, conn_pool=None):
+    """Send a DirMaint changing request to xCAT within the limiter."""
+    kwargs = {'conn_pool': conn_pool} if conn_pool else {}
+    return get_dirmaint_limiter().call(
+        _request_operation(method, url, body), zvmutils.xcat_request,
+        method, url, body, **kwargs)
+
+
+def xdsh(node, commands):
+    """Run a DirMaint changing smcli command within the limiter."""
+    return get_dirmaint_limiter().call(_command_operation(commands),
+                                       zvmutils.xdsh, node, commands)
+
+
+class AIMDLimiter(object):
+    """Bound the number of concurrent DirMaint requests adaptively.
+
+    The window of requests allowed in flight grows by one each time a
+    full window completes fine (additive increase) and is halved
+    (multiplicative decrease) when DirMaint reports the request counter
+    save condition, or when a request takes much longer than the usual
+    latency of its operation. The usual latency is kept per operation, as
+    formatting a disk takes much longer than unlocking a guest on a
+    healthy DirMaint. Only one decrease is done for the requests that
+    were in flight together, so a burst of congested replies does not
+    collapse the window to its minimum.
+    """
+
+    def __init__(self, max_limit, min_limit=1, initial_limit=None,
+                 backoff=0.5, latency_tolerance=3.0, min_latency=1.0,
+                 smoothing=0.2):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.limit = float(initial_limit or self.max_limit)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        # requests faster than this never count as slow
+        self.min_latency = min_latency
+        self.smoothing = smoothing
+        # exponentially weighted moving average of the latency, by
+        # operation
+        self.baselines = {}
+        self.inflight = 0
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                self._cond.wait()
+            self.inflight += 1
+        return time.time()
+
+    def release(self, start, congested=False, operation=None):
+        """Give back the slot taken at time start and adjust the window."""
+        now = time.time()
+        latency = now - start
+        with self._cond:
+            self.inflight -= 1
+            baseline = self.baselines.get(operation)
+            if (not congested and baseline is not None and
+                    latency > self.min_latency and
+                    latency > baseline * self.latency_tolerance):
+                LOG.debug("DirMaint request %(op)s took %(lat).1fs, usual "
+                          "latency is %(base).1fs" %
+                          {'op': operation, 'lat': latency,
+                           'base': baseline})
+                congested = True
+            if congested:
+                if start >= self._last_decrease:
+                    self.limit = max(self.min_limit,
+                                     self.limit * self.backoff)
+                    self._last_decrease = now
+                    LOG.info("DirMaint is congested, concurrent requests "
+                             "limited to %d" % int(self.limit))
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if baseline is None:
+                self.baselines[operation] = latency
+            else:
+                self.baselines[operation] = (
+                    baseline + self.smoothing * (latency - baseline))
+            self._cond.notify_all()
+
+    def run(self, function, *args, **kwargs):
+        """Call function once a slot is free, return its xCAT response."""
+        return self.call(None, function, *args, **kwargs)
+
+    def call(self, operation, function, *args, **kwargs):
+        """Same as run, for a request doing operation."""
+        start = self.acquire()
+        congested = False
+        try:
+            resp = function(*args, **kwargs)
+            congested = _is_congested(resp)
+            return resp
+        except exception.ZVMXCATInternalError as err:
+            congested = zvmutils._is_recoverable_issue(err.format_message())
+            raise
+        finally:
+            self.release(start, congested, operation)
@@ -0,0 +1,456 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Writer of the image bundles imported to xCAT.
+
+An image bundle is a tar archive of a directory holding manifest.xml and
+the disk image. BundleWriter writes each member straight from its source
+file, with copy_file_range or sendfile when the kernel and Python offer
+them, so a multi-GB image is read once and never copied to a temporary
+directory first. The output can be a local file or a RemoteFile, which
+pipes it to a file of another host over ssh.
+
+A bundle can also be compressed by a GzipStream on its way out, xCAT
+imports tar and gzipped tar bundles only. choose_codec decides whether
+compressing an image pays off.
+"""
+
+import collections
+import errno
+import grp
+import multiprocessing.pool
+import os
+import pwd
+import stat
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import zlib
+
+import six
+
+from zvmsdk import config
+from zvmsdk import constants as const
+from zvmsdk import exception
+from zvmsdk import log
+
+
+CONF = config.CONF
+LOG = log.LOG
+
+_CHUNK_SIZE = 1024 * 1024
+# errors of copy_file_range and sendfile meaning they can't copy between
+# these two files, the next copy method is tried then
+_FALLBACK_ERRNOS = (errno.EXDEV, errno.EINVAL, errno.ENOSYS,
+                    errno.EOPNOTSUPP, errno.EBADF)
+
+# codecs of the bundles xCAT imgimport can unpack
+CODECS = ('none', 'gzip')
+_GZIP_LEVEL = 1
+_GZIP_CHUNK_SIZE = 4 * _CHUNK_SIZE
+_ZERO_CHUNK = b'\0' * _GZIP_CHUNK_SIZE
+# chunks of the image compressed to estimate the gzip ratio and speed
+_SAMPLES = 8
+# gzip must be this much faster than no compression to be chosen
+_GZIP_MIN_GAIN = 0.8
+
+# bytes per second of the last bundle transfers to xCAT MN
+_TRANSFER_RATE = None
+_TRANSFER_RATE_LOCK = threading.Lock()
+
+
+def _write_all(fd, data):
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+
+# each copy method copies at most count bytes of src_fd from offset at the
+# offset of dst_fd in one call, and returns the number of bytes copied
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def _read_write(src_fd, dst_fd, offset, count):
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    data = os.read(src_fd, min(count, _CHUNK_SIZE))
+    _write_all(dst_fd, data)
+    return len(data)
+
+
+def _copy_methods():
+    methods = []
+    if hasattr(os, 'copy_file_range'):
+        methods.append(_copy_file_range)
+    if hasattr(os, 'sendfile'):
+        methods.append(_sendfile)
+    methods.append(_read_write)
+    return methods
+
+
+def copy_data(src_fd, dst_fd, size):
+    """Copy the first size bytes of src_fd at the offset of dst_fd.
+
+    A copy method failing before it copied anything leaves the copy to the
+    next one, on python 2.7 only the read and write one is available.
+    Errors after some data was copied are raised, the offset of dst_fd is
+    not known then.
+    """
+    methods = _copy_methods()
+    method_copied = 0
+    offset = 0
+    while offset < size:
+        try:
+            copied = methods[0](src_fd, dst_fd, offset,
+                                min(size - offset, _CHUNK_SIZE * 64))
+        except OSError as err:
+            if (err.errno not in _FALLBACK_ERRNOS or method_copied or
+                    len(methods) == 1):
+                raise
+            LOG.debug("%(method)s failed to copy data: %(err)s" %
+                      {'method': methods[0].__name__.lstrip('_'),
+                       'err': err})
+            methods.pop(0)
+            continue
+        if copied == 0:
+            break
+        method_copied += copied
+        offset += copied
+    if offset < size:
+        raise IOError("File shrank to %(offset)d bytes while copying its "
+                      "%(size)d bytes" % {'offset': offset, 'size': size})
+
+
+def _is_zero(chunk):
+    if len(chunk) == _GZIP_CHUNK_SIZE:
+        return chunk == _ZERO_CHUNK
+    return chunk.count(b'\0') == len(chunk)
+
+
+def _gzip_member(chunk):
+    compressor = zlib.compressobj(_GZIP_LEVEL, zlib.DEFLATED,
+                                  16 + zlib.MAX_WBITS)
+    return compressor.compress(chunk) + compressor.flush()
+
+
+class GzipStream(object):
+    """Write the data written to it to fd compressed in gzip format.
+
+    The data is cut in chunks compressed by a pool of worker threads,
+    each to a gzip member of its own, and the members are written in
+    order: a series of gzip members is a valid gzip file for gzip and
+    tar. Chunks of zeros, the unused blocks of disk images, are not
+    compressed, the member of the first one is written again.
+    """
+
+    def __init__(self, fd, workers):
+        self._fd = fd
+        self._pool = multiprocessing.pool.ThreadPool(workers)
+        # members to write in order, compressed or being compressed
+        self._pending = collections.deque()
+        self._max_pending = workers * 2
+        self._buffer = []
+        self._buffered = 0
+        self._zero_members = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self.bytes_in += len(data)
+        if self._buffered < _GZIP_CHUNK_SIZE:
+            return
+        data = b''.join(self._buffer)
+        end = len(data) - len(data) % _GZIP_CHUNK_SIZE
+        for offset in range(0, end, _GZIP_CHUNK_SIZE):
+            self._submit(data[offset:offset + _GZIP_CHUNK_SIZE])
+        self._buffer = [data[end:]] if end < len(data) else []
+        self._buffered = len(data) - end
+
+    def _submit(self, chunk):
+        if _is_zero(chunk):
+            member = self._zero_members.get(len(chunk))
+            if member is None:
+                member = _gzip_member(chunk)
+                self._zero_members[len(chunk)] = member
+            self._pending.append(member)
+        else:
+            self._pending.append(self._pool.apply_async(_gzip_member,
+                                                        (chunk,)))
+        while len(self._pending) > self._max_pending:
+            self._write_next()
+
+    def _write_next(self):
+        member = self._pending.popleft()
+        if not isinstance(member, bytes):
+            member = member.get()
+        _write_all(self._fd, member)
+        self.bytes_out += len(member)
+
+    def close(self):
+        """Compress and write the data left."""
+        try:
+            if self._buffered:
+                self._submit(b''.join(self._buffer))
+                self._buffer = []
+                self._buffered = 0
+            while self._pending:
+                self._write_next()
+        finally:
+            self._pool.close()
+            self._pool.join()
+
+    def abort(self):
+        """Drop the data not written yet."""
+        self._pool.terminate()
+        self._pending.clear()
+
+
+class BundleWriter(object):
+    """Write a tar archive to the file descriptor fd, member by member.
+
+    The archive is the one tarfile writes in GNU format, but the file
+    contents are copied with copy_data instead of going through Python.
+    If stream is given, a GzipStream writing to fd, the archive goes
+    through it instead.
+    """
+
+    def __init__(self, fd, stream=None):
+        self._fd = fd
+        self._stream = stream
+        self._offset = 0
+
+    def _write(self, data):
+        if self._stream is None:
+            _write_all(self._fd, data)
+        else:
+            self._stream.write(data)
+        self._offset += len(data)
+
+    def _pad(self, size):
+        remainder = size % tarfile.BLOCKSIZE
+        if remainder:
+            self._write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+    def _add_header(self, name, st, size, member_type):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mode = stat.S_IMODE(st.st_mode)
+        info.mtime = int(st.st_mtime)
+        info.type = member_type
+        info.uid = st.st_uid
+        info.gid = st.st_gid
+        try:
+            info.uname = pwd.getpwuid(st.st_uid).pw_name
+        except KeyError:
+            pass
+        try:
+            info.gname = grp.getgrgid(st.st_gid).gr_name
+        except KeyError:
+            pass
+        self._write(info.tobuf(format=tarfile.GNU_FORMAT))
+
+    def _stream_data(self, src_fd, size):
+        copied = 0
+        while copied < size:
+            data = os.read(src_fd, min(size - copied, _GZIP_CHUNK_SIZE))
+            if not data:
+                raise IOError("File shrank to %(offset)d bytes while "
+                              "copying its %(size)d bytes" %
+                              {'offset': copied, 'size': size})
+            self._write(data)
+            copied += len(data)
+
+    def add_directory(self, name, path):
+        """Add a directory entry name with the attributes of path."""
+        self._add_header(name, os.stat(path), 0, tarfile.DIRTYPE)
+
+    def add_file(self, name, path):
+        """Add the content of file path as member name."""
+        src_fd = os.open(path, os.O_RDONLY)
+        try:
+            st = os.fstat(src_fd)
+            self._add_header(name, st, st.st_size, tarfile.REGTYPE)
+            if self._stream is None:
+                copy_data(src_fd, self._fd, st.st_size)
+                self._offset += st.st_size
+            else:
+                self._stream_data(src_fd, st.st_size)
+            self._pad(st.st_size)
+        finally:
+            os.close(src_fd)
+
+    def close(self):
+        """Write the end of archive blocks and pad the last record."""
+        self._write(tarfile.NUL * (tarfile.BLOCKSIZE * 2))
+        remainder = self._offset % tarfile.RECORDSIZE
+        if remainder:
+            self._write(tarfile.NUL * (tarfile.RECORDSIZE - remainder))
+        if self._stream is not None:
+            self._stream.close()
+
+
+def record_transfer(nbytes, seconds):
+    """Record that nbytes of bundle were sent to xCAT MN in seconds."""
+    global _TRANSFER_RATE
+    if seconds <= 0 or nbytes < _GZIP_CHUNK_SIZE:
+        return
+    rate = nbytes / seconds
+    with _TRANSFER_RATE_LOCK:
+        if _TRANSFER_RATE is None:
+            _TRANSFER_RATE = rate
+        else:
+            _TRANSFER_RATE += 0.3 * (rate - _TRANSFER_RATE)
+
+
+def get_transfer_rate():
+    """Return the bytes per second expected to xCAT MN."""
+    with _TRANSFER_RATE_LOCK:
+        rate = _TRANSFER_RATE
+    return rate or CONF.xcat.bundle_link_bandwidth * const.MiB
+
+
+def sample_image(path):
+    """Compress chunks spread over file path to measure how gzip does.
+
+    Return the ratio of zero chunks, the compressed to original size
+    ratio of the other chunks and the bytes per second gzip compressed
+    them at, with one thread.
+    """
+    size = os.path.getsize(path)
+    count = max(1, min(_SAMPLES, size // _GZIP_CHUNK_SIZE))
+    step = max(size - _GZIP_CHUNK_SIZE, 0) // max(count - 1, 1)
+    zeros = 0
+    data_in = data_out = 0
+    seconds = 0.0
+    with open(path, 'rb') as f:
+        for idx in range(count):
+            f.seek(idx * step)
+            chunk = f.read(_GZIP_CHUNK_SIZE)
+            if _is_zero(chunk):
+                zeros += 1
+                continue
+            start = time.time()
+            data_out += len(_gzip_member(chunk))
+            seconds += time.time() - start
+            data_in += len(chunk)
+    ratio = float(data_out) / data_in if data_in else 0.0
+    speed = data_in / seconds if seconds > 0 else float('inf')
+    return float(zeros) / count, ratio, speed
+
+
+def choose_codec(path, codec, workers):
+    """Return the codec to bundle the image file path with.
+
+    codec is one of CODECS, returned as is, or 'auto'. gzip is then
+    chosen if compressing the image with workers threads and sending the
+    result to xCAT MN at the rate of the last transfers is expected to be
+    faster than sending the image as is.
+    """
+    if codec in CODECS:
+        return codec
+    if codec != 'auto':
+        msg = ("Invalid bundle compression %(codec)s, xCAT only imports "
+               "%(codecs)s bundles, or use auto" %
+               {'codec': codec, 'codecs': ', '.join(CODECS)})
+        raise exception.ZVMImageError(msg=msg)
+
+    size = os.path.getsize(path)
+    zero_ratio, ratio, speed = sample_image(path)
+    rate = get_transfer_rate()
+    data = size * (1 - zero_ratio)
+    # compression and transfer overlap, the slowest one sets the pace
+    plain_time = float(size) / rate
+    gzip_time = max(data / (speed * workers), data * ratio / rate)
+    LOG.debug("Image %(path)s: %(zero).0f%% zeros, gzip ratio %(ratio).2f "
+              "at %(speed).1f MB/s per thread, link %(rate).1f MB/s, "
+              "%(plain).1fs plain vs %(gzip).1fs gzip" %
+              {'path': path, 'zero': zero_ratio * 100, 'ratio': ratio,
+               'speed': speed / const.MiB, 'rate': rate / const.MiB,
+               'plain': plain_time, 'gzip': gzip_time})
+    if gzip_time < plain_time * _GZIP_MIN_GAIN:
+        return 'gzip'
+    return 'none'
+
+
+def split_target(target):
+    """Split an ssh destination "[user@]host:directory"."""
+    host, sep, directory = target.rpartition(':')
+    if not sep or not host or not directory:
+        raise ValueError("Invalid ssh destination %s, expected "
+                         "[user@]host:directory" % target)
+    return host, directory
+
+
+def _ssh(host, command):
+    return ['ssh', '-o', 'BatchMode=yes', host, command]
+
+
+class RemoteFile(object):
+    """File path of host written with "ssh host cat".
+
+    The errors of ssh go to a temporary file, not to a pipe nobody reads
+    while the file is written, which would block ssh once full.
+    """
+
+    def __init__(self, host, path):
+        self.host = host
+        self.path = path
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self._proc = subprocess.Popen(
+                _ssh(host, 'cat > %s' % six.moves.shlex_quote(path)),
+                stdin=subprocess.PIPE, stderr=self._stderr)
+        except Exception:
+            self._stderr.close()
+            raise
+
+    def fileno(self):
+        return self._proc.stdin.fileno()
+
+    def close(self):
+        """Wait for the whole file to be written, raise IOError if not."""
+        self._proc.stdin.close()
+        returncode = self._proc.wait()
+        self._stderr.seek(0)
+        error = self._stderr.read().decode('utf-8', 'replace')
+        self._stderr.close()
+        if returncode:
+            raise IOError("Failed to write %(path)s on %(host)s: %(err)s" %
+                          {'path': self.path, 'host': self.host,
+                           'err': error.strip()})
+
+    def abort(self):
+        """Stop writing and remove what was written."""
+        if self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+        self._stderr.close()
+        remove_remote(self.host, self.path)
+
+
+def remove_remote(host, path):
+    """Remove file path of host, return whether it worked."""
+    if subprocess.call(_ssh(host, 'rm -f %s' %
+                            six.moves.shlex_quote(path))):
+        LOG.warning("Failed to remove %(path)s on %(host)s" %
+                    {'path': path, 'host': host})
+        return False
+    return True
@@ -13,9 +13,17 @@
 #    under the License.
 
 
+import collections
+import os
+import threading
+import time
+
 from zvmsdk import client as zvmclient
 from zvmsdk import config
+from zvmsdk import constants as const
 from zvmsdk import exception
+from zvmsdk import imagebundle
+from zvmsdk import imagestore
 from zvmsdk import utils as zvmutils
 from zvmsdk import log
 
@@ -24,6 +32,15 @@ CONF = config.CONF
 
 _IMAGEOPS = None
 
+# an image captured by xCAT starts with a text header like
+# "xCAT CKD Disk Image:        3338 CYL HLen: 0055 GZIP: 6"
+_IMAGE_HEADER_SIZE = 64
+_IMAGE_HEADERS = {}
+_IMAGE_HEADERS_LOCK = threading.Lock()
+
+ImageHeader = collections.namedtuple('ImageHeader',
+                                     ['disk_type', 'disk_size', 'size_unit'])
+
 
 def get_imageops():
     global _IMAGEOPS
@@ -32,6 +49,89 @@ def get_imageops():
     return _IMAGEOPS
 
 
+def _parse_image_header(data, image_file_path):
+    header = data.decode('ascii', 'replace')
+    disk_type = header[5:8]
+    if not header.startswith('xCAT ') or disk_type not in ('CKD', 'FBA'):
+        msg = ("The image's disk type is not valid. Currently we only"
+               " support FBA and CKD disk")
+        raise exception.ZVMImageError(msg=msg)
+
+    disk_size = header[20:32].strip()
+    if not disk_size.isdigit():
+        msg = ("Image file at %s is missing built-in disk size "
+               "metadata, it was probably not captured with xCAT"
+               % image_file_path)
+        raise exception.ZVMImageError(msg=msg)
+    size_unit = header[32:].split(None, 1)
+    return ImageHeader(str(disk_type), int(disk_size),
+                       str(size_unit[0]) if size_unit else None)
+
+
+def read_image_header(image_file_path):
+    """Return the ImageHeader of the image file captured by xCAT.
+
+    Headers are cached by path, modification time and size of the file.
+    """
+    try:
+        st = os.stat(image_file_path)
+        key = (image_file_path, st.st_mtime, st.st_size)
+        with _IMAGE_HEADERS_LOCK:
+            header = _IMAGE_HEADERS.get(key)
+        if header is not None:
+            return header
+        with open(image_file_path, 'rb') as f:
+            data = f.read(_IMAGE_HEADER_SIZE)
+    except (IOError, OSError) as err:
+        LOG.error("Failed to read image file %(path)s: %(err)s" %
+                  {'path': image_file_path, 'err': err})
+        msg = ("Get image property failed,"
+               " please check whether the image file exists!")
+        raise exception.ZVMImageError(msg=msg)
+
+    header = _parse_image_header(data, image_file_path)
+    with _IMAGE_HEADERS_LOCK:
+        # forget the previous versions of the file
+        for old_key in [k for k in _IMAGE_HEADERS
+                        if k[0] == image_file_path]:
+            del _IMAGE_HEADERS[old_key]
+        _IMAGE_HEADERS[key] = header
+    return header
+
+
+class SpaceBudget(object):
+    """Bytes of a file system that workers use at the same time.
+
+    acquire waits until size bytes are free in the budget, and fails
+    once size is larger than the whole budget. Bytes released with keep
+    stay used for good, they are taken off the budget.
+    """
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size):
+        with self._cond:
+            while self.used + size > self.capacity:
+                if size > self.capacity:
+                    msg = ("Not enough space on %(name)s: %(size)d bytes "
+                           "needed, %(free)d bytes available" %
+                           {'name': self.name, 'size': size,
+                            'free': max(self.capacity, 0)})
+                    raise exception.ZVMImageError(msg=msg)
+                self._cond.wait()
+            self.used += size
+
+    def release(self, size, keep=0):
+        with self._cond:
+            self.used -= size
+            self.capacity -= keep
+            self._cond.notify_all()
+
+
 class ImageOps(object):
     def __init__(self):
         self.zvmclient = zvmclient.get_zvmclient()
@@ -40,6 +140,8 @@ class ImageOps(object):
     def get_image_path_by_name(self, spawn_image_name):
         # eg. rhel7.2-s390x-netboot-<image_uuid>
         # eg. /install/netboot/rhel7.2/s390x/<image_uuid>/image_name.img
+        spawn_image_name = imagestore.get_image_store().resolve(
+            spawn_image_name)
         name_split = spawn_image_name.split('-')
         # tmpdir can extract from 'tabdump site' but consume time
         tmpdir = '/install'
@@ -57,49 +159,65 @@ class ImageOps(object):
         return image_file_path
 
     def image_get_root_disk_size(self, spawn_image_name):
-        """use 'hexdump' to get the root_disk_size."""
+        """Get the root_disk_size from the header of the image file."""
         image_file_path = self.get_image_path_by_name(spawn_image_name)
-        try:
-            cmd = 'hexdump -C -n 64 %s' % image_file_path
-            output = zvmutils.execute(cmd)
-        except ValueError:
-            msg = ("Get image property failed,"
-                    " please check whether the image file exists!")
-            raise exception.ZVMImageError(msg=msg)
-
-        LOG.debug("hexdump result is %s", output)
-        try:
-            root_disk_size = output[144:156].strip()
-        except ValueError:
-            msg = ("Image file at %s is missing built-in disk size "
-                    "metadata, it was probably not captured with xCAT"
-                    % image_file_path)
-            raise exception.ZVMImageError(msg=msg)
-
-        if 'FBA' not in output and 'CKD' not in output:
-            msg = ("The image's disk type is not valid. Currently we only"
-                      " support FBA and CKD disk")
-            raise exception.ZVMImageError(msg=msg)
-
+        root_disk_size = str(read_image_header(image_file_path).disk_size)
         LOG.debug("The image's root_disk_size is %s", root_disk_size)
         return root_disk_size
 
-    def image_import(self, image_file_path, os_version):
-        """import a spawn image to XCAT"""
-        LOG.debug("Getting a spawn image...")
+    def _get_imported_image(self, digest):
+        """Return the osimage in xCAT holding the image of digest."""
+        store = imagestore.get_image_store()
+        osimage = store.lookup(digest)
+        if osimage is None:
+            return None
+        if osimage not in self.zvmclient.image_query(osimage.split('-')[-1]):
+            LOG.info("Image %s was removed from xCAT, forget it" % osimage)
+            store.remove(osimage)
+            return None
+        return osimage
+
+    def _new_import(self, image_file_path, os_version):
         image_uuid = image_file_path.split('/')[-1]
+        profile = image_uuid.replace('-', '_')
+        return {'path': image_file_path,
+                'os_version': os_version,
+                'uuid': image_uuid,
+                'profile': profile,
+                'name': '-'.join((os_version, 's390x', 'netboot', profile)),
+                'size': os.path.getsize(image_file_path),
+                'osimage': None}
+
+    def _hash_image(self, job):
+        """Look for the content of the image of job in xCAT already."""
+        job['start'] = time.time()
+        store = imagestore.get_image_store()
+        job['digest'] = store.digest(job['path'])
+        osimage = self._get_imported_image(job['digest'])
+        if osimage is not None:
+            if osimage != job['name']:
+                store.add_alias(job['name'], job['digest'])
+            LOG.info("Image %(name)s has the content of image %(osimage)s "
+                     "already in xCAT, skip importing it" %
+                     {'name': job['name'], 'osimage': osimage})
+            job['osimage'] = osimage
+
+    def _bundle_image(self, job):
+        """Build the image bundle of job, on xCAT MN if streamed."""
         disk_file_name = CONF.zvm.user_root_vdev + '.img'
         image_name = disk_file_name
         image_name = zvmutils.remove_prefix_of_unicode(image_name)
         spawn_path = self._pathutils.get_spawn_folder()
 
-        time_stamp_dir = self._pathutils.make_time_stamp()
+        # the profile keeps apart the bundles of concurrent imports
+        time_stamp_dir = '_'.join((self._pathutils.make_time_stamp(),
+                                   job['profile']))
         bundle_file_path = self._pathutils.get_bundle_tmp_path(time_stamp_dir)
 
         image_meta = {
-                u'id': image_uuid,
+                u'id': job['uuid'],
                 u'properties': {u'image_type_xcat': u'linux',
-                               u'os_version': os_version,
+                               u'os_version': job['os_version'],
                                u'os_name': u'Linux',
                                u'architecture': u's390x',
                                u'provision_method': u'netboot'}
@@ -112,22 +230,156 @@ class ImageOps(object):
                                     disk_file_name, bundle_file_path)
         # Generate the image bundle
         LOG.debug("Generating bundle file for image %s", image_meta['id'])
-        image_bundle_package = self.zvmclient.generate_image_bundle(
+        job['codec'] = imagebundle.choose_codec(
+            job['path'], CONF.xcat.bundle_compression,
+            CONF.xcat.bundle_compression_workers)
+        job['streamed'] = bool(CONF.xcat.bundle_stream_target)
+        if job['streamed']:
+            job['bundle'] = self.zvmclient.stream_image_bundle(
+                                    time_stamp_dir, image_name, job['path'],
+                                    codec=job['codec'])
+        else:
+            job['bundle'] = self.zvmclient.generate_image_bundle(
                                     spawn_path, time_stamp_dir,
-                                    image_name, image_file_path)
+                                    image_name, job['path'],
+                                    codec=job['codec'])
+
+    def _upload_image(self, job):
+        """Import the image bundle of job to xCAT MN."""
+        LOG.debug("Importing the image %s to xCAT", job['uuid'])
+        bundle_size = None
+        if not job['streamed']:
+            bundle_size = os.path.getsize(job['bundle'])
+        start = time.time()
+        self.zvmclient.image_import(job['bundle'], job['profile'],
+                                    streamed=job['streamed'],
+                                    compressed=job['codec'] != 'none')
+        if bundle_size is not None:
+            # xCAT MN pulled the bundle, includes the time to unpack it
+            imagebundle.record_transfer(bundle_size, time.time() - start)
+        imagestore.get_image_store().add(job['digest'], job['name'],
+                                         job['size'])
+        job['osimage'] = job['name']
+
+    def _log_import(self, job):
+        seconds = max(time.time() - job['start'], 0.001)
+        job['seconds'] = seconds
+        job['throughput'] = job['size'] / seconds
+        LOG.info("Image %(name)s (%(size).1f MB) imported in %(sec).1f "
+                 "seconds, %(rate).1f MB/s" %
+                 {'name': job['name'], 'size': float(job['size']) / const.MiB,
+                  'sec': seconds, 'rate': job['throughput'] / const.MiB})
+
+    def image_import(self, image_file_path, os_version):
+        """import a spawn image to XCAT
+
+        An image file whose content was imported before is not imported
+        again, its name is made an alias of the osimage holding it.
+        Return the name of that osimage.
+        """
+        LOG.debug("Getting a spawn image...")
+        job = self._new_import(image_file_path, os_version)
+        self._hash_image(job)
+        if job['osimage'] is not None:
+            return job['osimage']
 
-        # Import image bundle to xCAT MN's image repository
-        LOG.debug("Importing the image %s to xCAT", image_meta['id'])
-        profile_str = image_uuid.replace('-', '_')
-        image_profile = profile_str
-        self.zvmclient.check_space_imgimport_xcat(image_bundle_package,
+        self.zvmclient.check_space_imgimport_xcat(image_file_path,
                         CONF.xcat.free_space_threshold,
                         CONF.xcat.master_node)
-        self.zvmclient.image_import(image_bundle_package,
-                                    image_profile)
+        self._bundle_image(job)
+        self._upload_image(job)
+        self._log_import(job)
+        return job['osimage']
+
+    def images_import(self, image_list):
+        """Import many spawn images to xCAT, failures don't stop the others.
+
+        The images are hashed, bundled and uploaded by bounded pools of
+        CONF.zvm.bulk_import_workers threads, an image enters a stage as
+        soon as it left the previous one. The bundles being built and
+        uploaded never take more than the free space of image_tmp_path,
+        and the images uploaded never leave less than
+        CONF.xcat.free_space_threshold GB free on xCAT MN, streamed bundles
+        included.
+
+        :param image_list: list of (image_file_path, os_version) tuples.
+        """
+        jobs = []
+        results = {}
+        for image_file_path, os_version in image_list:
+            try:
+                jobs.append(self._new_import(image_file_path, os_version))
+            except OSError as err:
+                results[image_file_path] = {'imported': False,
+                                            'stage': 'hash',
+                                            'error': str(err)}
+
+        streamed = bool(CONF.xcat.bundle_stream_target)
+        local_budget = None
+        if not streamed:
+            local_budget = SpaceBudget(
+                'image_tmp_path', zvmutils.get_free_space(
+                    self._pathutils.get_spawn_folder()))
+        xcat_budget = SpaceBudget(
+            'xCAT MN', self.zvmclient.get_free_space_xcat(
+                CONF.xcat.master_node) -
+            CONF.xcat.free_space_threshold * const.GiB)
+
+        def _bundle(job):
+            if job['osimage'] is not None:
+                return
+            # a bundle is about as large as its image, a streamed one is
+            # written to xCAT MN and unpacked there next to it
+            if streamed:
+                xcat_budget.acquire(job['size'] * 2)
+            else:
+                local_budget.acquire(job['size'])
+            try:
+                self._bundle_image(job)
+            except Exception:
+                if streamed:
+                    xcat_budget.release(job['size'] * 2)
+                else:
+                    local_budget.release(job['size'])
+                raise
+
+        def _upload(job):
+            if job['osimage'] is not None:
+                return
+            try:
+                # xCAT MN holds the bundle while unpacking it, then the
+                # image stays
+                if not streamed:
+                    xcat_budget.acquire(job['size'] * 2)
+                try:
+                    self._upload_image(job)
+                finally:
+                    kept = job['size'] if job['osimage'] else 0
+                    xcat_budget.release(job['size'] * 2, keep=kept)
+            finally:
+                if local_budget is not None:
+                    local_budget.release(job['size'])
+            self._log_import(job)
+
+        workers = CONF.zvm.bulk_import_workers
+        stages = [('hash', self._hash_image, workers),
+                  ('bundle', _bundle, workers),
+                  ('import', _upload, workers)]
+        failures = zvmutils.run_pipeline(jobs, stages)
 
-        # TODO(Cao Biao): Add log info
-        pass
+        for job, failure in zip(jobs, failures):
+            if failure is None:
+                results[job['path']] = {'imported': True,
+                                        'osimage': job['osimage'],
+                                        'size': job['size'],
+                                        'seconds': job.get('seconds'),
+                                        'throughput': job.get('throughput')}
+            else:
+                stage, err = failure
+                results[job['path']] = {'imported': False,
+                                        'stage': stage,
+                                        'error': str(err)}
+        return results
 
     def image_query(self, imagekeyword=None):
         return self.zvmclient.image_query(imagekeyword)
@@ -0,0 +1,161 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from zvmsdk import config
+from zvmsdk import log
+
+
+CONF = config.CONF
+LOG = log.LOG
+
+_IMAGE_STORE = None
+_IMAGE_STORE_LOCK = threading.Lock()
+
+_CHUNK_SIZE = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    digest TEXT PRIMARY KEY,
+    osimage TEXT,
+    size INTEGER,
+    imported REAL);
+CREATE INDEX IF NOT EXISTS images_osimage ON images (osimage);
+CREATE TABLE IF NOT EXISTS aliases (
+    name TEXT PRIMARY KEY,
+    digest TEXT);
+CREATE INDEX IF NOT EXISTS aliases_digest ON aliases (digest);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    digest TEXT);
+"""
+
+
+def get_image_store():
+    global _IMAGE_STORE
+    with _IMAGE_STORE_LOCK:
+        if _IMAGE_STORE is None:
+            path = CONF.zvm.image_store_db or os.path.join(
+                CONF.zvm.image_tmp_path, 'imagestore.db')
+            _IMAGE_STORE = ImageStore(path)
+    return _IMAGE_STORE
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of file path, read in chunks."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ImageStore(object):
+    """SQLite record of the images imported to xCAT, keyed by content.
+
+    Each image imported is recorded with the SHA-256 digest of its disk
+    image and the xCAT osimage holding it. Importing a file of the same
+    content again under another name only records that name as an alias
+    of the osimage, which resolve then translates. The digests of the
+    files hashed are kept by path, modification time and size, so an
+    unchanged file is not read again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if path != ':memory:':
+            directory = os.path.dirname(os.path.abspath(path))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            with self._conn:
+                return self._conn.execute(sql, args).fetchall()
+
+    def digest(self, path):
+        """Return the SHA-256 digest of the image file path."""
+        st = os.stat(path)
+        rows = self._execute('SELECT digest FROM files WHERE path = ? AND '
+                             'mtime = ? AND size = ?',
+                             (path, st.st_mtime, st.st_size))
+        if rows:
+            return rows[0][0]
+
+        start = time.time()
+        digest = file_digest(path)
+        LOG.debug("Hashed image file %(path)s in %(dur).1f seconds" %
+                  {'path': path, 'dur': time.time() - start})
+        self._execute('INSERT OR REPLACE INTO files (path, mtime, size, '
+                      'digest) VALUES (?, ?, ?, ?)',
+                      (path, st.st_mtime, st.st_size, digest))
+        return digest
+
+    def lookup(self, digest):
+        """Return the osimage holding the image of digest, None if none."""
+        rows = self._execute('SELECT osimage FROM images WHERE digest = ?',
+                             (digest,))
+        return rows[0][0] if rows else None
+
+    def add(self, digest, osimage, size=None):
+        """Record that osimage holds the image of digest."""
+        self._execute('INSERT OR REPLACE INTO images (digest, osimage, '
+                      'size, imported) VALUES (?, ?, ?, ?)',
+                      (digest, osimage, size, time.time()))
+
+    def add_alias(self, name, digest):
+        """Make the osimage name stand for the image of digest."""
+        self._execute('INSERT OR REPLACE INTO aliases (name, digest) '
+                      'VALUES (?, ?)', (name, digest))
+
+    def resolve(self, name):
+        """Return the osimage standing for image name, name if none."""
+        rows = self._execute('SELECT images.osimage FROM aliases JOIN images '
+                             'ON aliases.digest = images.digest '
+                             'WHERE aliases.name = ?', (name,))
+        return rows[0][0] if rows else name
+
+    def aliases(self, osimage):
+        """Return the names standing for the image held by osimage."""
+        rows = self._execute('SELECT aliases.name FROM aliases JOIN images '
+                             'ON aliases.digest = images.digest '
+                             'WHERE images.osimage = ? AND aliases.name != ? '
+                             'ORDER BY aliases.name', (osimage, osimage))
+        return [row[0] for row in rows]
+
+    def remove_alias(self, name):
+        self._execute('DELETE FROM aliases WHERE name = ?', (name,))
+
+    def remove(self, osimage):
+        """Forget the image held by osimage and its aliases."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM aliases WHERE digest IN '
+                                   '(SELECT digest FROM images WHERE '
+                                   'osimage = ?)', (osimage,))
+                self._conn.execute('DELETE FROM images WHERE osimage = ?',
+                                   (osimage,))
+                self._conn.execute('DELETE FROM aliases WHERE name = ?',
+                                   (osimage,))
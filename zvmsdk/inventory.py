@@ -0,0 +1,235 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import sqlite3
+import threading
+import time
+
+from zvmsdk import config
+from zvmsdk import log
+from zvmsdk import tablecache
+
+
+CONF = config.CONF
+LOG = log.LOG
+
+_INVENTORY = None
+_INVENTORY_LOCK = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS guests (
+    node TEXT PRIMARY KEY,
+    hcp TEXT COLLATE NOCASE,
+    userid TEXT);
+CREATE INDEX IF NOT EXISTS guests_hcp ON guests (hcp);
+CREATE TABLE IF NOT EXISTS nics (
+    node TEXT,
+    switch TEXT,
+    port TEXT,
+    vlan TEXT,
+    interface TEXT,
+    comments TEXT);
+CREATE INDEX IF NOT EXISTS nics_node ON nics (node);
+CREATE INDEX IF NOT EXISTS nics_port ON nics (port);
+"""
+
+# inventory tables, the xCAT tables they mirror and their columns
+INVENTORY_TABLES = {
+    'guests': ('zvm', ('node', 'hcp', 'userid')),
+    'nics': ('switch', ('node', 'switch', 'port', 'vlan', 'interface',
+                        'comments')),
+    }
+
+
+def get_inventory():
+    global _INVENTORY
+    with _INVENTORY_LOCK:
+        if _INVENTORY is None:
+            _INVENTORY = Inventory()
+    return _INVENTORY
+
+
+class Inventory(object):
+    """SQLite store of the guests and NICs known to xCAT.
+
+    The guests table mirrors the xCAT zvm table and the nics table the
+    xCAT switch table. A table is loaded from xCAT on first use, then the
+    reads are served from it: XCATClient updates it on each write it does
+    to xCAT, so the SDK reads back its own changes without asking xCAT.
+    The changes done by others are caught by reconciling a table with
+    xCAT on its first use CONF.xcat.inventory_reconcile_interval seconds
+    after its last load, or by reconcile, and lookups of a guest or port
+    not found reload the table once.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or CONF.xcat.inventory_db
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        # time each table was last loaded from xCAT
+        self._synced = {}
+        # bumped on each write, so a table loaded from xCAT before a write
+        # does not overwrite it
+        self._generations = dict((t, 0) for t in INVENTORY_TABLES)
+
+    def reconcile(self):
+        """Reload all tables from xCAT."""
+        for table in INVENTORY_TABLES:
+            self.sync(table)
+
+    def sync(self, table):
+        """Replace the content of table by the one of its xCAT table.
+
+        Return False if the table was written meanwhile, it is then kept
+        as is and loaded again on next use.
+        """
+        columns = INVENTORY_TABLES[table][1]
+        with self._lock:
+            generation = self._generations[table]
+        start = time.time()
+        xcat_table = tablecache.get_table_cache().get_table(
+            INVENTORY_TABLES[table][0], refresh=True)
+        rows = [tuple(row.get(col) for col in columns)
+                for row in xcat_table.rows]
+
+        with self._lock:
+            if generation != self._generations[table]:
+                LOG.debug("Inventory table %s changed while loading it"
+                          % table)
+                self._synced.pop(table, None)
+                return False
+            old_rows = self._conn.execute(
+                'SELECT %s FROM %s' % (', '.join(columns), table)).fetchall()
+            if table == 'nics':
+                rows = self._keep_switches(rows, old_rows)
+            with self._conn:
+                self._conn.execute('DELETE FROM %s' % table)
+                self._conn.executemany(
+                    'INSERT INTO %s (%s) VALUES (%s)' % (
+                        table, ', '.join(columns),
+                        ', '.join('?' * len(columns))),
+                    rows)
+            if table in self._synced:
+                added = set(rows) - set(tuple(r) for r in old_rows)
+                removed = set(tuple(r) for r in old_rows) - set(rows)
+                if added or removed:
+                    LOG.info("Reconciled inventory table %(table)s with "
+                             "xCAT: %(added)d rows added, %(removed)d rows "
+                             "removed" % {'table': table,
+                                          'added': len(added),
+                                          'removed': len(removed)})
+            self._synced[table] = start
+        LOG.debug("Loaded %(num)d rows of inventory table %(table)s in "
+                  "%(dur).2f seconds" % {'num': len(rows), 'table': table,
+                                         'dur': time.time() - start})
+        return True
+
+    def _keep_switches(self, rows, old_rows):
+        # the vswitch a NIC is coupled to is not always in xCAT switch
+        # table, keep the one recorded when the SDK coupled it
+        switches = dict(((r['node'], r['interface']), r['switch'])
+                        for r in old_rows if r['switch'])
+        return [(node, switch or switches.get((node, interface)), port,
+                 vlan, interface, comments)
+                for (node, switch, port, vlan, interface, comments) in rows]
+
+    def clear(self):
+        """Drop the content of all tables, they are loaded on next use."""
+        with self._lock:
+            with self._conn:
+                for table in INVENTORY_TABLES:
+                    self._conn.execute('DELETE FROM %s' % table)
+                    self._generations[table] += 1
+            self._synced.clear()
+
+    def _needs_sync(self, table):
+        with self._lock:
+            synced = self._synced.get(table)
+        if synced is None:
+            return True
+        interval = CONF.xcat.inventory_reconcile_interval
+        return interval > 0 and time.time() - synced >= interval
+
+    def _query(self, table, sql, args, reload_on_miss=False):
+        if self._needs_sync(table):
+            self.sync(table)
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        if not rows and reload_on_miss:
+            # catch rows added by others since last reconciliation
+            self.sync(table)
+            with self._lock:
+                rows = self._conn.execute(sql, args).fetchall()
+        return [dict(zip(row.keys(), row)) for row in rows]
+
+    def _write(self, table, sql, args):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(sql, args)
+            self._generations[table] += 1
+
+    def list_guests(self, hcp):
+        """Return the node names of the guests managed by hcp."""
+        return [row['node'] for row in self._query(
+            'guests', 'SELECT node FROM guests WHERE hcp = ? ORDER BY rowid',
+            (hcp,))]
+
+    def get_guest(self, node):
+        """Return the guest of node name node, None if not found."""
+        rows = self._query('guests', 'SELECT * FROM guests WHERE node = ?',
+                           (node,), reload_on_miss=True)
+        return rows[0] if rows else None
+
+    def get_nics(self, node):
+        """Return the NICs of the guest of node name node."""
+        return self._query('nics',
+                           'SELECT * FROM nics WHERE node = ? ORDER BY rowid',
+                           (node,))
+
+    def get_nics_by_port(self, port):
+        """Return the NICs of port id port."""
+        return self._query('nics',
+                           'SELECT * FROM nics WHERE port = ? ORDER BY rowid',
+                           (port,), reload_on_miss=True)
+
+    def add_guest(self, node, hcp, userid):
+        self._write('guests', 'INSERT OR REPLACE INTO guests '
+                    '(node, hcp, userid) VALUES (?, ?, ?)',
+                    (node, hcp, userid))
+
+    def remove_guest(self, node):
+        """Remove the guest of node name node and its NICs."""
+        self._write('guests', 'DELETE FROM guests WHERE node = ?', (node,))
+        self.remove_nics(node)
+
+    def add_nic(self, node, port, interface, comments=None):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM nics WHERE node = ? AND '
+                                   'port = ?', (node, port))
+                self._conn.execute('INSERT INTO nics (node, port, interface, '
+                                   'comments) VALUES (?, ?, ?, ?)',
+                                   (node, port, interface, comments))
+            self._generations['nics'] += 1
+
+    def remove_nics(self, node):
+        self._write('nics', 'DELETE FROM nics WHERE node = ?', (node,))
+
+    def set_nic_switch(self, node, interface, switch):
+        """Record the vswitch the NIC interface of node is coupled to."""
+        self._write('nics', 'UPDATE nics SET switch = ? WHERE node = ? AND '
+                    'interface = ?', (switch, node, interface))
@@ -0,0 +1,107 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""JSON codec for xCAT responses and REST bodies.
+
+The fastest JSON library installed among orjson, ujson and simplejson
+(with its C extension) is picked at import time, the standard json module
+is used if none is. The results are the same as the json module ones:
+- strings are decoded to unicode, and a document the fast decoder rejects
+  is decoded again by json, so errors are json's ValueError.
+- only simplejson encodes with the same separators and escaping as json,
+  orjson and ujson are used for decoding only. simplejson is told not to
+  encode namedtuples as objects and Decimals as numbers, which json does
+  not do.
+- calls with extra keyword arguments go to json.
+"""
+
+import functools
+import json
+
+import six
+
+
+def _import_simplejson():
+    try:
+        import simplejson
+    except ImportError:
+        return None
+    # without its C extension simplejson is slower than json
+    try:
+        from simplejson import _speedups  # noqa
+    except ImportError:
+        return None
+    return simplejson
+
+
+try:
+    import orjson as _fast_decoder
+except ImportError:
+    try:
+        import ujson as _fast_decoder
+    except ImportError:
+        _fast_decoder = _import_simplejson()
+
+_fast_encoder = _import_simplejson()
+
+
+def _get_decode():
+    if _fast_decoder is None:
+        return json.loads
+    name = _fast_decoder.__name__
+    if name == 'ujson':
+        # ujson rounds floats unless asked not to
+        def _decode(s):
+            return _fast_decoder.loads(s, precise_float=True)
+        return _decode
+    if name == 'simplejson' and six.PY2:
+        # simplejson returns ascii strings as str when given a str
+        def _decode(s):
+            if isinstance(s, str):
+                s = s.decode('utf-8')
+            return _fast_decoder.loads(s)
+        return _decode
+    return _fast_decoder.loads
+
+
+def _get_encode():
+    if _fast_encoder is None:
+        return json.dumps
+    # the simplejson defaults json does not share
+    return functools.partial(_fast_encoder.dumps, namedtuple_as_object=False,
+                             use_decimal=False)
+
+
+_decode = _get_decode()
+_encode = _get_encode()
+
+DECODER = getattr(_fast_decoder, '__name__', 'json')
+ENCODER = getattr(_fast_encoder, '__name__', 'json')
+
+
+def loads(s, **kwargs):
+    """Decode the JSON document s like json.loads."""
+    if kwargs or _decode is json.loads:
+        return json.loads(s, **kwargs)
+    try:
+        return _decode(s)
+    except Exception:
+        # let json decode it, or raise its error
+        return json.loads(s)
+
+
+def dumps(obj, **kwargs):
+    """Encode obj to JSON like json.dumps."""
+    if kwargs:
+        return json.dumps(obj, **kwargs)
+    return _encode(obj)
@@ -12,11 +12,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
 import time
+
 from zvmsdk import client as zvmclient
 from zvmsdk import config
 from zvmsdk import exception
 from zvmsdk import log
+from zvmsdk import powerstate
 from zvmsdk import utils as zvmutils
 
 _MONITOR = None
@@ -34,10 +37,29 @@ def get_monitor():
 class ZVMMonitor(object):
     """Monitor support for ZVM"""
     _TYPES = ('cpumem', 'vnics')
+    # types refreshed by the background collector
+    _COLLECTED_TYPES = ('cpumem',)
 
     def __init__(self):
         self._cache = MeteringCache(self._TYPES)
         self._zvmclient = zvmclient.get_zvmclient()
+        self._power_poller = powerstate.get_power_poller()
+        self._collector = None
+        self._collector_lock = threading.Lock()
+
+    def _start_collector(self):
+        with self._collector_lock:
+            if self._collector is None:
+                self._collector = MeteringCollector(self._zvmclient,
+                                                    self._cache,
+                                                    self._COLLECTED_TYPES)
+                self._collector.start()
+
+    def get_collector_stats(self):
+        """Return metrics of the background metering collector."""
+        if self._collector is None:
+            return {}
+        return self._collector.stats()
 
     def inspect_cpus(self, uid_list):
         cpumem_data = self._get_inspect_data('cpumem', uid_list)
@@ -71,38 +93,126 @@ class ZVMMonitor(object):
 
     def _get_inspect_data(self, type, uid_list):
         inspect_data = {}
-        update_needed = False
+        not_cached = []
         for uid in uid_list:
-            cache_data = self._cache.get(type, uid)
+            # data a bit older than the cache interval is still served
+            # while the collector refreshes it
+            cache_data = self._cache.get(type, uid,
+                                         max_stale=CONF.monitor.cache_interval)
             if cache_data is not None:
                 inspect_data[uid.upper()] = cache_data
             else:
-                try:
-                    if self._zvmclient.get_power_state(uid) == 'on':
-                        update_needed = True
-                        inspect_data = {}
-                        break
-                    else:
-                        # Skip the guest that is in 'off' state
-                        continue
-                except exception.ZVMVirtualMachineNotExist:
-                    # Skip the guest that does not exist, ignore this exception
+                not_cached.append(uid)
+
+        update_needed = []
+        if not_cached:
+            power_states, errors = self._power_poller.query_power_states(
+                not_cached)
+            for uid in not_cached:
+                err = errors.get(uid)
+                if (err is not None and
+                        not isinstance(err,
+                                       exception.ZVMVirtualMachineNotExist)):
+                    raise err
+                if uid not in power_states:
+                    # Skip the guest that does not exist
                     LOG.info('Guest %s does not exist.' % uid)
-                    continue
+                elif power_states[uid] == 'on':
+                    update_needed.append(uid)
+                # Skip the guest that is in 'off' state
 
         # If all data are found in cache, just return
         if not update_needed:
             return inspect_data
 
-        # Call client to query latest data
-        if self._cache_enabled():
+        if not self._cache_enabled():
+            return self._zvmclient.image_performance_query(uid_list)
+
+        # The data of all guests is refreshed in background, only query the
+        # guests not in cache yet
+        self._start_collector()
+        rdata = self._zvmclient.image_performance_query(update_needed)
+        for data in rdata.values():
+            self._cache.set(type, data)
+        inspect_data.update(rdata)
+
+        return inspect_data
+
+
+class MeteringCollector(object):
+    """Refresh the metering cache of all guests in background.
+
+    The cache is refreshed every CONF.monitor.cache_interval seconds by a
+    daemon thread, API callers are served the cached data meanwhile.
+    """
+
+    def __init__(self, zvm_client, cache, types):
+        self._zvmclient = zvm_client
+        self._cache = cache
+        self._types = types
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._refresh_count = 0
+        self._last_duration = None
+        self._last_error = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run,
+                                        name='zvmsdk-metering-collector')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            start = time.time()
+            self.refresh()
+            interval = CONF.monitor.cache_interval
+            self._stopped.wait(max(interval - (time.time() - start), 1))
+
+    def refresh(self):
+        """Query the data of all guests and put it in cache."""
+        with self._lock:
+            self._refreshing = True
+        start = time.time()
+        error = None
+        try:
             rdata = self._zvmclient.image_performance_query(
                 self._zvmclient.get_vm_list())
-            self._cache.refresh(type, rdata)
-        else:
-            rdata = self._zvmclient.image_performance_query(uid_list)
+            for ctype in self._types:
+                self._cache.refresh(ctype, rdata)
+        except Exception as err:
+            error = str(err)
+            LOG.warning("Failed to refresh metering data: %s" % err)
+        duration = time.time() - start
+        LOG.debug("Refreshed metering data in %.1f seconds" % duration)
+        with self._lock:
+            self._refreshing = False
+            self._refresh_count += 1
+            self._last_duration = duration
+            self._last_error = error
 
-        return rdata
+    def stats(self):
+        """Return the collector metrics.
+
+        refresh_duration is the duration in seconds of the last refresh,
+        cache_age the seconds since the cache was last refreshed, None if
+        it never was.
+        """
+        refreshed = [self._cache.refreshed_at(t) for t in self._types]
+        refreshed = [r for r in refreshed if r is not None]
+        with self._lock:
+            return {'refreshing': self._refreshing,
+                    'refresh_count': self._refresh_count,
+                    'refresh_duration': self._last_duration,
+                    'cache_age': (time.time() - min(refreshed)
+                                  if refreshed else None),
+                    'last_error': self._last_error,
+                    }
 
 
 class MeteringCache(object):
@@ -116,6 +226,7 @@ class MeteringCache(object):
     def _reset(self, types):
         for type in types:
             self._cache[type] = {'expiration': time.time(),
+                                'refreshed': None,
                                 'data': {},
                                 }
 
@@ -131,13 +242,20 @@ class MeteringCache(object):
         target_cache = self._get_ctype_cache(ctype)
         target_cache['data'][data['userid']] = data
 
-    def get(self, ctype, userid):
+    def get(self, ctype, userid, max_stale=0):
+        """Get cache content of userid.
+
+        @max_stale:    seconds the content is still returned once expired.
+        """
         target_cache = self._get_ctype_cache(ctype)
-        if(time.time() > target_cache['expiration']):
+        if(time.time() > target_cache['expiration'] + max_stale):
             return None
         else:
             return target_cache['data'].get(userid.upper(), None)
 
+    def refreshed_at(self, ctype):
+        return self._get_ctype_cache(ctype)['refreshed']
+
     def delete(self, ctype, userid):
         uid = userid.upper()
         target_cache = self._get_ctype_cache(ctype)
@@ -146,15 +264,16 @@ class MeteringCache(object):
 
     def clear(self, ctype='all'):
         if ctype == 'all':
-            self._reset()
+            self._reset(self._types)
         else:
             target_cache = self._get_ctype_cache(ctype)
             target_cache['data'] = {}
 
     def refresh(self, ctype, data):
-        self.clear(ctype)
+        # replace the data at once, so readers never see it partly filled
+        new_data = dict((d['userid'], d) for d in data.values())
         target_cache = self._get_ctype_cache(ctype)
-        target_cache['expiration'] = (time.time() +
-                                        float(CONF.monitor.cache_interval))
-        for d in data.values():
-            self.set(ctype, d)
+        target_cache['data'] = new_data
+        target_cache['refreshed'] = time.time()
+        target_cache['expiration'] = (target_cache['refreshed'] +
+                                      float(CONF.monitor.cache_interval))
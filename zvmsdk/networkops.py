@@ -40,6 +40,9 @@ class NetworkOPS(object):
     def create_nic(self, vm_id, nic_info, ip_addr=None):
         self.zvmclient.create_nic(vm_id, nic_info, ip_addr=ip_addr)
 
+    def flush_hosts(self):
+        self.zvmclient.flush_makehosts()
+
     def get_vm_nic_switch_info(self, vm_id):
         return self.zvmclient.get_vm_nic_switch_info(vm_id)
 
@@ -69,6 +72,9 @@ class NetworkOPS(object):
     def grant_user_to_vswitch(self, vswitch_name, userid):
         self.zvmclient.grant_user_to_vswitch(vswitch_name, userid)
 
+    def grant_users_to_vswitch(self, vswitch_name, userid_list):
+        self.zvmclient.grant_users_to_vswitch(vswitch_name, userid_list)
+
     def revoke_user_from_vswitch(self, vswitch_name, userid):
         self.zvmclient.revoke_user_from_vswitch(vswitch_name, userid)
 
@@ -0,0 +1,283 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import threading
+import time
+
+from zvmsdk import client as zvmclient
+from zvmsdk import config
+from zvmsdk import log
+
+
+CONF = config.CONF
+LOG = log.LOG
+
+_POWER_POLLER = None
+_POWER_POLLER_LOCK = threading.Lock()
+
+
+def get_power_poller():
+    global _POWER_POLLER
+    with _POWER_POLLER_LOCK:
+        if _POWER_POLLER is None:
+            _POWER_POLLER = PowerStatePoller(zvmclient.get_zvmclient())
+    return _POWER_POLLER
+
+
+class PowerStateWaiter(object):
+    """Handle on a guest reaching a power state.
+
+    It is done once the guest is seen in the state, once its timeout
+    expired, or once querying the guest failed: reached tells whether the
+    state was reached and error is the error of the failed query, None
+    otherwise. A waiter of state None is done on the first query of the
+    guest, power_state is then the state seen, None if the query failed.
+    """
+
+    def __init__(self, userid, state, deadline=None):
+        self.userid = userid
+        self.state = state
+        self.deadline = deadline
+        self.reached = None
+        self.power_state = None
+        self.error = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait at most timeout seconds, return whether state was reached.
+        """
+        self._done.wait(timeout)
+        return bool(self.reached)
+
+    def add_done_callback(self, callback):
+        """Call callback with the waiter once done, now if already done."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+    def _call(self, callback):
+        try:
+            callback(self)
+        except Exception as err:
+            LOG.error("Power state callback of %(uid)s failed: %(err)s" %
+                      {'uid': self.userid, 'err': err})
+
+    def _finish(self, reached, power_state=None, error=None):
+        self.reached = reached
+        self.power_state = power_state
+        self.error = error
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._call(callback)
+
+
+class PowerStatePoller(object):
+    """Wait for guests to reach power states with shared queries.
+
+    A daemon thread queries the power state of all the watched guests
+    with one get_power_states call per tick. The ticks are
+    CONF.zvm.power_poll_min_interval seconds apart after a guest is
+    watched or reached its state, the interval doubles up to
+    CONF.zvm.power_poll_max_interval seconds while no state changes.
+    """
+
+    def __init__(self, zvm_client):
+        self._zvmclient = zvm_client
+        self._cond = threading.Condition()
+        self._waiters = []
+        # last state seen of each guest: (state, time)
+        self._states = {}
+        self._interval = CONF.zvm.power_poll_min_interval
+        self._next_poll = None
+        self._thread = None
+
+    def watch(self, userid, state, timeout=None, callback=None):
+        """Return a PowerStateWaiter for userid reaching state.
+
+        :state:    power state to wait for, None to wait for the next query
+                   of userid, which is then done right away.
+        :timeout:  seconds after which the waiter is done, even if userid
+                   did not reach state. None to wait forever.
+        :callback: function called with the waiter once done.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        waiter = PowerStateWaiter(userid, state, deadline)
+        if callback is not None:
+            waiter.add_done_callback(callback)
+        self._add_waiters([waiter])
+        return waiter
+
+    def _add_waiters(self, waiters):
+        with self._cond:
+            self._waiters.extend(waiters)
+            # the new waiters are served by the next tick, brought forward
+            self._interval = CONF.zvm.power_poll_min_interval
+            next_poll = time.time()
+            if any(w.state is not None for w in waiters):
+                next_poll += self._interval
+            if self._next_poll is None or next_poll < self._next_poll:
+                self._next_poll = next_poll
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='zvmsdk-power-poller')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._waiters:
+                        self._next_poll = None
+                        self._cond.wait()
+                        continue
+                    delay = self._next_poll - time.time()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                self._next_poll = None
+                waiters = list(self._waiters)
+            try:
+                self.poll(waiters)
+            except Exception as err:
+                LOG.error("Failed to poll power state: %s" % err)
+                with self._cond:
+                    self._next_poll = (time.time() +
+                                       CONF.zvm.power_poll_max_interval)
+
+    def get_power_states(self, userid_list, timeout=None):
+        """Return the power state of guests, keyed by userid.
+
+        States seen less than CONF.zvm.power_poll_min_interval seconds ago
+        are returned as is, the other guests are queried by the next tick
+        together with all the guests watched. Guests whose state could not
+        be queried are left out.
+        """
+        return self.query_power_states(userid_list, timeout)[0]
+
+    def query_power_states(self, userid_list, timeout=None):
+        """Return the power states and the query errors of guests.
+
+        Same as get_power_states, the errors of the guests whose query
+        failed are returned too, keyed by userid. Guests unknown to xCAT
+        are in neither.
+        """
+        now = time.time()
+        states = {}
+        errors = {}
+        missing = []
+        with self._cond:
+            for userid in userid_list:
+                seen = self._states.get(userid.upper())
+                if (seen is not None and
+                        now - seen[1] <= CONF.zvm.power_poll_min_interval):
+                    states[userid] = seen[0]
+                else:
+                    missing.append(userid)
+
+        deadline = None if timeout is None else now + timeout
+        waiters = [PowerStateWaiter(userid, None, deadline)
+                   for userid in missing]
+        if waiters:
+            self._add_waiters(waiters)
+        for waiter in waiters:
+            waiter.wait()
+            if waiter.power_state is not None:
+                states[waiter.userid] = waiter.power_state
+            elif waiter.error is not None:
+                errors[waiter.userid] = waiter.error
+        return states, errors
+
+    def _query(self, userids):
+        """Return the power states and the query errors, by userid."""
+        try:
+            return self._zvmclient.get_power_states(userids), {}
+        except Exception as err:
+            LOG.warning("Failed to query power state of %(num)d guests: "
+                        "%(err)s" % {'num': len(userids), 'err': err})
+            if len(userids) == 1:
+                return {}, {userids[0]: err}
+        # query one by one so one failing guest does not stall the others
+        states = {}
+        errors = {}
+        for userid in userids:
+            try:
+                states[userid] = self._zvmclient.get_power_state(userid)
+            except Exception as err:
+                LOG.warning("Failed to query power state of %(uid)s: "
+                            "%(err)s" % {'uid': userid, 'err': err})
+                errors[userid] = err
+        return states, errors
+
+    def poll(self, waiters):
+        """Query the power state of the guests of waiters and notify them.
+        """
+        userids = sorted(set(w.userid for w in waiters))
+        states, errors = self._query(userids)
+        states = dict((uid.upper(), state) for uid, state in states.items())
+        errors = dict((uid.upper(), err) for uid, err in errors.items())
+
+        now = time.time()
+        with self._cond:
+            for userid, power_state in states.items():
+                self._states[userid] = (power_state, now)
+
+        finished = []
+        changed = False
+        for waiter in waiters:
+            power_state = states.get(waiter.userid.upper())
+            error = errors.get(waiter.userid.upper())
+            if error is not None:
+                waiter._finish(False, error=error)
+                finished.append(waiter)
+            elif waiter.state is None:
+                waiter._finish(power_state is not None, power_state)
+                finished.append(waiter)
+            elif power_state == waiter.state:
+                waiter._finish(True, power_state)
+                finished.append(waiter)
+                changed = True
+            elif waiter.deadline is not None and now >= waiter.deadline:
+                waiter._finish(False, power_state)
+                finished.append(waiter)
+
+        with self._cond:
+            for waiter in finished:
+                self._waiters.remove(waiter)
+            if changed:
+                self._interval = CONF.zvm.power_poll_min_interval
+            else:
+                self._interval = min(self._interval * 2,
+                                     CONF.zvm.power_poll_max_interval)
+            next_poll = now + self._interval
+            # don't let a waiter run much longer than its timeout
+            deadlines = [w.deadline for w in self._waiters
+                         if w.deadline is not None]
+            if deadlines:
+                next_poll = min(next_poll, min(deadlines))
+            if self._next_poll is not None:
+                # a guest was watched during the query
+                next_poll = min(next_poll, self._next_poll)
+            self._next_poll = next_poll
@@ -12,14 +12,15 @@
 """Utility methods for placement API."""
 
 import functools
-import json
 import six
 
 import webob
 
+from zvmsdk import jsonutils
+
 
 def loads(s, **kwargs):
-    return json.loads(s, **kwargs)
+    return jsonutils.loads(s, **kwargs)
 
 
 def check_accept(*types):
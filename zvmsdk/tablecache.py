@@ -0,0 +1,166 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import csv
+import functools
+import threading
+import time
+
+from zvmsdk import config
+from zvmsdk import log
+from zvmsdk import utils as zvmutils
+
+
+CONF = config.CONF
+LOG = log.LOG
+
+_TABLE_CACHE = None
+_TABLE_CACHE_LOCK = threading.Lock()
+
+# xCAT tables kept in cache and the columns they are indexed by
+CACHED_TABLES = {
+    'zvm': ('node', 'hcp'),
+    'switch': ('node', 'port'),
+    'mac': ('node',),
+    'hosts': ('node', 'ip'),
+    }
+
+
+def get_table_cache():
+    global _TABLE_CACHE
+    with _TABLE_CACHE_LOCK:
+        if _TABLE_CACHE is None:
+            _TABLE_CACHE = XCATTableCache()
+    return _TABLE_CACHE
+
+
+def invalidate_tables(*names):
+    """Decorator to drop xCAT tables from cache once they are written.
+
+    The tables are dropped even if the decorated function failed, as the
+    write may have partly been done. All tables are dropped if none given.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def decorated_function(*args, **kwargs):
+            try:
+                return function(*args, **kwargs)
+            finally:
+                get_table_cache().invalidate(*names)
+        return decorated_function
+    return decorator
+
+
+class XCATTable(object):
+    """Parsed content of a xCAT table, indexed by some of its columns.
+
+    The tabdump output looks like:
+    ['#node,hcp,userid,nodetype,parent,comments,disable',
+     '"fakenode","fakehcp.fake.com","FAKEUSER",,,,']
+
+    each row is turned into a dictionary keyed by column name, empty
+    values are None.
+    """
+
+    def __init__(self, name, tabdump_data, index_columns=()):
+        self.name = name
+        self.columns = [c.strip() for c in
+                        tabdump_data[0].lstrip('#').split(',')]
+        # raw csv rows without table header
+        self.lines = tabdump_data[1:]
+        self.rows = []
+        self._indexes = dict((col, {}) for col in index_columns)
+
+        lines = [zvmutils.to_utf8(ln) for ln in self.lines]
+        for values in csv.reader(lines):
+            row = dict((col, (v.decode('utf-8') if v else None))
+                       for col, v in zip(self.columns, values))
+            self.rows.append(row)
+            for col, index in self._indexes.items():
+                value = row.get(col)
+                if value is not None:
+                    index.setdefault(value, []).append(row)
+
+    def lookup(self, column, value):
+        """Return rows whose column equals to value."""
+        if column in self._indexes:
+            return list(self._indexes[column].get(value, []))
+        return [row for row in self.rows if row.get(column) == value]
+
+
+class XCATTableCache(object):
+    """In memory cache of the xCAT zvm, switch, mac and hosts tables.
+
+    A table is downloaded with tabdump on first use and kept for
+    CONF.xcat.table_cache_ttl seconds, then downloaded again on next use.
+    XCATClient invalidates a table whenever it writes to it, so the SDK
+    always reads back its own changes.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = CONF.xcat.table_cache_ttl if ttl is None else ttl
+        self._xcat_url = zvmutils.get_xcat_url()
+        self._lock = threading.Lock()
+        # table name: (XCATTable, expiration time)
+        self._tables = {}
+        # bumped on each invalidation, so a table loaded before a write is
+        # not put in cache after it
+        self._generations = dict((t, 0) for t in CACHED_TABLES)
+        self._table_locks = dict((t, threading.Lock())
+                                 for t in CACHED_TABLES)
+
+    def _load(self, name):
+        url = self._xcat_url.tabdump('/' + name)
+        with zvmutils.expect_invalid_xcat_resp_data():
+            data = zvmutils.xcat_request("GET", url,
+                                         coalesce=True)['data'][0]
+            table = XCATTable(name, data, CACHED_TABLES[name])
+        LOG.debug("Loaded %(num)d rows of xCAT table %(table)s into cache" %
+                  {'num': len(table.rows), 'table': name})
+        return table
+
+    def get_table(self, name, refresh=False):
+        """Return the cached XCATTable, reload it if expired."""
+        with self._table_locks[name]:
+            with self._lock:
+                cached = self._tables.get(name)
+                generation = self._generations[name]
+            if (cached is not None and not refresh and
+                    time.time() < cached[1]):
+                return cached[0]
+
+            table = self._load(name)
+            with self._lock:
+                if generation == self._generations[name]:
+                    self._tables[name] = (table, time.time() + self.ttl)
+            return table
+
+    def lookup(self, name, column, value):
+        """Return the rows of table name whose column equals to value.
+
+        A miss reloads the table once, so rows written by others since the
+        table was cached are still found.
+        """
+        rows = self.get_table(name).lookup(column, value)
+        if not rows:
+            rows = self.get_table(name, refresh=True).lookup(column, value)
+        return rows
+
+    def invalidate(self, *names):
+        """Drop the given tables from cache, all tables if none given."""
+        with self._lock:
+            for name in (names or list(CACHED_TABLES.keys())):
+                self._generations[name] += 1
+                self._tables.pop(name, None)
@@ -33,6 +33,11 @@ class SDKAPITestCase(base.SDKTestCase):
         self.api.guest_get_info('fakevm')
         ginfo.assert_called_once_with('fakevm')
 
+    @mock.patch("zvmsdk.vmops.VMOps.get_power_states")
+    def test_guest_get_power_states(self, get_power_states):
+        self.api.guest_get_power_states(['fakevm1', 'fakevm2'])
+        get_power_states.assert_called_once_with(['fakevm1', 'fakevm2'])
+
     @mock.patch("zvmsdk.vmops.VMOps.guest_deploy")
     def test_guest_deploy(self, guest_deploy):
         user_id = 'fakevm'
@@ -50,6 +55,19 @@ class SDKAPITestCase(base.SDKTestCase):
         self.api.image_import(image_file_path, os_version)
         image_import.assert_called_once_with(image_file_path, os_version)
 
+    @mock.patch("zvmsdk.imageops.ImageOps.images_import")
+    def test_images_import(self, images_import):
+        specs = [{'image_file_path': '/install/temp/test.img',
+                  'os_version': 'rhel7.2'}]
+        self.api.images_import(specs)
+        images_import.assert_called_once_with([('/install/temp/test.img',
+                                                'rhel7.2')])
+
+    def test_images_import_invalid_spec(self):
+        specs = [{'image_file_path': '/install/temp/test.img'}]
+        self.assertRaises(exception.ZVMInvalidInput,
+                          self.api.images_import, specs)
+
     @mock.patch("zvmsdk.vmops.VMOps.create_vm")
     def test_guest_create(self, create_vm):
         userid = 'userid'
@@ -63,6 +81,25 @@ class SDKAPITestCase(base.SDKTestCase):
         create_vm.assert_called_once_with(userid, vcpus, memory, disk_list,
                                           user_profile)
 
+    @mock.patch("zvmsdk.vmops.VMOps.create_vms")
+    def test_guests_create(self, create_vms):
+        specs = [{'userid': 'userid', 'vcpus': 1, 'memory': 1024}]
+        self.api.guests_create(specs)
+        create_vms.assert_called_once_with(specs)
+
+    def test_guests_create_invalid_spec(self):
+        specs = [{'userid': 'userid', 'vcpus': 1}]
+        self.assertRaises(exception.ZVMInvalidInput,
+                          self.api.guests_create, specs)
+
+    @mock.patch("zvmsdk.vmops.VMOps.create_vms")
+    def test_guests_create_duplicate_userid(self, create_vms):
+        specs = [{'userid': 'userid1', 'vcpus': 1, 'memory': 1024},
+                 {'userid': 'USERID1', 'vcpus': 2, 'memory': 2048}]
+        self.assertRaises(exception.ZVMInvalidInput,
+                          self.api.guests_create, specs)
+        self.assertFalse(create_vms.called)
+
     @mock.patch("zvmsdk.imageops.ImageOps.image_query")
     def test_image_query(self, image_query):
         imagekeyword = 'eae09a9f_7958_4024_a58c_83d3b2fc0aab'
@@ -75,12 +112,36 @@ class SDKAPITestCase(base.SDKTestCase):
         self.api.guest_delete(userid)
         delete_vm.assert_called_once_with(userid)
 
+    @mock.patch("zvmsdk.vmops.VMOps.delete_vms")
+    def test_guests_delete(self, delete_vms):
+        self.api.guests_delete(['userid1', 'userid2'])
+        delete_vms.assert_called_once_with(['userid1', 'userid2'])
+
+    @mock.patch("zvmsdk.vmops.VMOps.delete_vms")
+    def test_guests_delete_duplicate_userid(self, delete_vms):
+        self.assertRaises(exception.ZVMInvalidInput,
+                          self.api.guests_delete, ['userid1', 'USERID1'])
+        self.assertFalse(delete_vms.called)
+
+    @mock.patch("zvmsdk.networkops.NetworkOPS.grant_users_to_vswitch")
+    def test_vswitch_grant_users(self, grant_users):
+        self.api.vswitch_grant_users('vswitch1', ['userid1', 'userid2'])
+        grant_users.assert_called_once_with('vswitch1',
+                                            ['userid1', 'userid2'])
+        self.api.vswitch_grant_users('vswitch1', 'userid3')
+        grant_users.assert_called_with('vswitch1', ['userid3'])
+
     @mock.patch("zvmsdk.monitor.ZVMMonitor.inspect_cpus")
     def test_guest_inspect_cpus_list(self, inspect_cpus):
         userid_list = ["userid1", "userid2"]
         self.api.guest_inspect_cpus(userid_list)
         inspect_cpus.assert_called_once_with(userid_list)
 
+    @mock.patch("zvmsdk.monitor.ZVMMonitor.get_collector_stats")
+    def test_host_get_metering_stats(self, get_collector_stats):
+        self.api.host_get_metering_stats()
+        get_collector_stats.assert_called_once_with()
+
     @mock.patch("zvmsdk.monitor.ZVMMonitor.inspect_cpus")
     def test_guest_inspect_cpus_single(self, inspect_cpus):
         userid_list = "userid1"
@@ -93,6 +154,12 @@ class SDKAPITestCase(base.SDKTestCase):
         self.api.guest_stop(userid)
         gs.assert_called_once_with(userid, 0, 10)
 
+    @mock.patch("zvmsdk.vmops.VMOps.guest_stop_async")
+    def test_guest_stop_async(self, gsa):
+        handle = self.api.guest_stop_async('fakeuser', timeout=60)
+        gsa.assert_called_once_with('fakeuser', 60)
+        self.assertIs(gsa.return_value, handle)
+
     @mock.patch("zvmsdk.vmops.VMOps.guest_config_minidisks")
     def test_guest_process_additional_disks(self, config_disks):
         userid = 'userid'
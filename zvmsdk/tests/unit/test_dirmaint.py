@@ -0,0 +1,140 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import mock
+import threading
+import time
+
+from zvmsdk import dirmaint
+from zvmsdk import exception
+from zvmsdk import utils as zvmutils
+from zvmsdk.tests.unit import base
+
+
+_DIRMAINT_BUSY = ('Return Code: 596\nReason Code: 1185\n'
+                  'DirMaint request counter save')
+
+
+class SDKAIMDLimiterTestCase(base.SDKTestCase):
+    def setUp(self):
+        super(SDKAIMDLimiterTestCase, self).setUp()
+        self._limiter = dirmaint.AIMDLimiter(8, initial_limit=4)
+
+    def test_additive_increase(self):
+        for i in range(5):
+            self._limiter.run(lambda: {'error': []})
+        self.assertEqual(5, int(self._limiter.limit))
+        for i in range(100):
+            self._limiter.run(lambda: {})
+        self.assertEqual(8, self._limiter.limit)
+        self.assertEqual(0, self._limiter.inflight)
+
+    def test_decrease_on_dirmaint_busy(self):
+        resp = {'error': [[_DIRMAINT_BUSY]]}
+        self.assertEqual(resp, self._limiter.run(lambda: resp))
+        self.assertEqual(2, self._limiter.limit)
+
+    def test_decrease_on_dirmaint_busy_error(self):
+        def _busy():
+            raise exception.ZVMXCATInternalError(msg=_DIRMAINT_BUSY)
+
+        self.assertRaises(exception.ZVMXCATInternalError,
+                          self._limiter.run, _busy)
+        self.assertEqual(2, self._limiter.limit)
+        self.assertEqual(0, self._limiter.inflight)
+
+    def test_no_decrease_on_other_error(self):
+        def _fail():
+            raise exception.ZVMXCATInternalError(msg='Return Code: 400')
+
+        self.assertRaises(exception.ZVMXCATInternalError,
+                          self._limiter.run, _fail)
+        self.assertEqual(4, int(self._limiter.limit))
+
+    @mock.patch.object(dirmaint, 'time')
+    def test_decrease_on_latency(self, fake_time):
+        fake_time.time.side_effect = [0, 1, 10, 11, 20, 30]
+        self._limiter.run(lambda: {})
+        self._limiter.run(lambda: {})
+        self.assertEqual(4, int(self._limiter.limit))
+        # 10 seconds while usual latency is 1 second
+        self._limiter.run(lambda: {})
+        self.assertEqual(2, int(self._limiter.limit))
+
+    @mock.patch.object(dirmaint, 'time')
+    def test_latency_by_operation(self, fake_time):
+        fake_time.time.side_effect = [0, 1, 10, 20, 30, 40, 50, 51]
+        self._limiter.call('xdsh Image_Unlock_DM', lambda: {})
+        # formatting a disk is slow, not congested
+        self._limiter.call('PUT vms --add3390', lambda: {})
+        self._limiter.call('PUT vms --add3390', lambda: {})
+        self.assertEqual(4, int(self._limiter.limit))
+        self._limiter.call('xdsh Image_Unlock_DM', lambda: {})
+        self.assertEqual(4, int(self._limiter.limit))
+
+    def test_operations(self):
+        self.assertEqual('POST vms', dirmaint._request_operation(
+            'POST', '/xcatws/vms/user1?userName=admin', ['password=x']))
+        self.assertEqual('PUT vms --add3390', dirmaint._request_operation(
+            'PUT', '/xcatws/vms/user1', ['--add3390 POOL1 0101 1g']))
+        self.assertEqual('PUT vms Image_Definition_Update_DM',
+                         dirmaint._request_operation(
+                             'PUT', '/xcatws/vms/user1',
+                             ['--smcli', 'Image_Definition_Update_DM -T x']))
+        self.assertEqual('DELETE vms', dirmaint._request_operation(
+            'DELETE', '/xcatws/vms/user1'))
+        self.assertEqual('xdsh Image_Unlock_DM', dirmaint._command_operation(
+            '/opt/zhcp/bin/smcli Image_Unlock_DM -T user1'))
+
+    @mock.patch.object(dirmaint, 'time')
+    def test_one_decrease_per_window(self, fake_time):
+        fake_time.time.side_effect = [0, 1, 2, 3]
+        start1 = self._limiter.acquire()
+        start2 = self._limiter.acquire()
+        self._limiter.release(start1, congested=True)
+        # started before the previous decrease
+        self._limiter.release(start2, congested=True)
+        self.assertEqual(2, self._limiter.limit)
+
+    def test_window_bounds_inflight(self):
+        limiter = dirmaint.AIMDLimiter(2)
+        release = threading.Event()
+        inflight = []
+
+        def _call():
+            inflight.append(limiter.inflight)
+            release.wait(5)
+            return {}
+
+        threads = [threading.Thread(target=limiter.run, args=(_call,))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        self.assertEqual(2, limiter.inflight)
+        release.set()
+        for t in threads:
+            t.join(5)
+        self.assertTrue(max(inflight) <= 2)
+        self.assertEqual(0, limiter.inflight)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_dirmaint_xcat_request(self, xrequest):
+        xrequest.return_value = {'error': [[_DIRMAINT_BUSY]]}
+        limiter = dirmaint.AIMDLimiter(8)
+        with mock.patch.object(dirmaint, '_DIRMAINT_LIMITER', limiter):
+            dirmaint.xcat_request('PUT', '/url', ['--add3390'])
+        xrequest.assert_called_once_with('PUT', '/url', ['--add3390'])
+        self.assertEqual(4, limiter.limit)
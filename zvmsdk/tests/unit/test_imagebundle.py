@@ -0,0 +1,218 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import errno
+import mock
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+
+from zvmsdk import config
+from zvmsdk import exception
+from zvmsdk import imagebundle
+from zvmsdk.tests.unit import base
+
+
+CONF = config.CONF
+
+
+class SDKImageBundleTestCase(base.SDKTestCase):
+    def setUp(self):
+        super(SDKImageBundleTestCase, self).setUp()
+        self._tmp_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tmp_path)
+        self._bundle_dir = os.path.join(self._tmp_path, 'bundle')
+        os.mkdir(self._bundle_dir)
+        self._manifest = os.path.join(self._bundle_dir, 'manifest.xml')
+        with open(self._manifest, 'w') as f:
+            f.write('<xcatimage/>')
+        self._image = os.path.join(self._tmp_path, '0100.img')
+        self._data = os.urandom(3 * 1024 * 1024 + 17)
+        with open(self._image, 'wb') as f:
+            f.write(self._data)
+
+    def _write_bundle(self):
+        tar_file = os.path.join(self._tmp_path, 'bundle.tar')
+        with open(tar_file, 'wb') as f:
+            writer = imagebundle.BundleWriter(f.fileno())
+            writer.add_directory('bundle', self._bundle_dir)
+            writer.add_file('bundle/manifest.xml', self._manifest)
+            writer.add_file('bundle/0100.img', self._image)
+            writer.close()
+        return tar_file
+
+    def _check_bundle(self, tar_file):
+        self.assertEqual(0, os.path.getsize(tar_file) % tarfile.RECORDSIZE)
+        with tarfile.open(tar_file) as tar:
+            members = tar.getmembers()
+            self.assertEqual(['bundle', 'bundle/manifest.xml',
+                              'bundle/0100.img'],
+                             [m.name for m in members])
+            self.assertTrue(members[0].isdir())
+            self.assertEqual(len(self._data), members[2].size)
+            self.assertEqual(b'<xcatimage/>',
+                             tar.extractfile(members[1]).read())
+            self.assertEqual(self._data, tar.extractfile(members[2]).read())
+
+    def test_bundle_writer(self):
+        self._check_bundle(self._write_bundle())
+
+    @mock.patch.object(imagebundle, '_copy_methods')
+    def test_bundle_writer_read_write(self, copy_methods):
+        copy_methods.return_value = [imagebundle._read_write]
+        self._check_bundle(self._write_bundle())
+
+    @mock.patch.object(imagebundle, '_copy_methods')
+    def test_copy_data_fallback(self, copy_methods):
+        unsupported = mock.Mock(__name__='_unsupported',
+                                side_effect=OSError(errno.EXDEV, 'xdev'))
+        copy_methods.return_value = [unsupported, imagebundle._read_write]
+        self._check_bundle(self._write_bundle())
+        self.assertTrue(unsupported.called)
+
+    @mock.patch.object(imagebundle, '_copy_methods')
+    def test_copy_data_error(self, copy_methods):
+        failing = mock.Mock(__name__='_failing',
+                            side_effect=OSError(errno.EIO, 'io'))
+        copy_methods.return_value = [failing, imagebundle._read_write]
+        self.assertRaises(OSError, self._write_bundle)
+
+    @mock.patch.object(imagebundle, '_copy_methods')
+    def test_copy_data_no_fallback_after_progress(self, copy_methods):
+        partial = mock.Mock(__name__='_partial',
+                            side_effect=[5, OSError(errno.EXDEV, 'xdev')])
+        fallback = mock.Mock(__name__='_fallback')
+        copy_methods.return_value = [partial, fallback]
+        self.assertRaises(OSError, imagebundle.copy_data, 0, 1, 10)
+        self.assertEqual(2, partial.call_count)
+        self.assertFalse(fallback.called)
+
+    def test_copy_data_shrank(self):
+        out_path = os.path.join(self._tmp_path, 'out')
+        src_fd = os.open(self._image, os.O_RDONLY)
+        self.addCleanup(os.close, src_fd)
+        with open(out_path, 'wb') as f:
+            self.assertRaises(IOError, imagebundle.copy_data, src_fd,
+                              f.fileno(), len(self._data) + 1)
+
+    def test_bundle_writer_gzip(self):
+        # a run of zeros long enough to fill whole chunks
+        self._data += b'\0' * (3 * imagebundle._GZIP_CHUNK_SIZE)
+        with open(self._image, 'wb') as f:
+            f.write(self._data)
+        tar_file = os.path.join(self._tmp_path, 'bundle.tgz')
+        with open(tar_file, 'wb') as f:
+            stream = imagebundle.GzipStream(f.fileno(), 2)
+            writer = imagebundle.BundleWriter(f.fileno(), stream)
+            writer.add_directory('bundle', self._bundle_dir)
+            writer.add_file('bundle/manifest.xml', self._manifest)
+            writer.add_file('bundle/0100.img', self._image)
+            writer.close()
+        self.assertEqual(os.path.getsize(tar_file), stream.bytes_out)
+        self.assertLess(stream.bytes_out, len(self._data))
+        with tarfile.open(tar_file, 'r:gz') as tar:
+            self.assertEqual(['bundle', 'bundle/manifest.xml',
+                              'bundle/0100.img'], tar.getnames())
+            self.assertEqual(self._data,
+                             tar.extractfile('bundle/0100.img').read())
+
+    def test_choose_codec(self):
+        self.assertEqual('gzip',
+                         imagebundle.choose_codec(self._image, 'gzip', 4))
+        self.assertEqual('none',
+                         imagebundle.choose_codec(self._image, 'none', 4))
+        self.assertRaises(exception.ZVMImageError, imagebundle.choose_codec,
+                          self._image, 'zstd', 4)
+
+    @mock.patch.object(imagebundle, 'get_transfer_rate')
+    @mock.patch.object(imagebundle, 'sample_image')
+    def test_choose_codec_auto(self, sample_image, get_transfer_rate):
+        mib = 1024 * 1024
+        # half zeros, compresses to 1/3, at 50 MB/s per thread
+        sample_image.return_value = (0.5, 0.33, 50 * mib)
+        get_transfer_rate.return_value = 100 * mib
+        self.assertEqual('gzip',
+                         imagebundle.choose_codec(self._image, 'auto', 4))
+        # a single thread can't keep up with the link
+        self.assertEqual('none',
+                         imagebundle.choose_codec(self._image, 'auto', 1))
+        # random data
+        sample_image.return_value = (0.0, 1.0, 20 * mib)
+        get_transfer_rate.return_value = 10 * mib
+        self.assertEqual('none',
+                         imagebundle.choose_codec(self._image, 'auto', 4))
+
+    def test_sample_image(self):
+        zero_ratio, ratio, speed = imagebundle.sample_image(self._image)
+        self.assertEqual(0.0, zero_ratio)
+        # random data doesn't compress
+        self.assertGreater(ratio, 0.99)
+        self.assertGreater(speed, 0)
+
+    @mock.patch.object(imagebundle, '_TRANSFER_RATE', None)
+    def test_record_transfer(self):
+        mib = 1024 * 1024
+        with mock.patch.dict(CONF.xcat, {'bundle_link_bandwidth': 100}):
+            self.assertEqual(100 * mib, imagebundle.get_transfer_rate())
+            # too small to tell
+            imagebundle.record_transfer(mib, 1)
+            self.assertEqual(100 * mib, imagebundle.get_transfer_rate())
+            imagebundle.record_transfer(200 * mib, 10)
+            self.assertEqual(20 * mib, imagebundle.get_transfer_rate())
+            imagebundle.record_transfer(300 * mib, 10)
+            self.assertAlmostEqual(23 * mib, imagebundle.get_transfer_rate())
+
+    def test_split_target(self):
+        self.assertEqual(('root@xcat', '/install/tmp'),
+                         imagebundle.split_target('root@xcat:/install/tmp'))
+        self.assertRaises(ValueError, imagebundle.split_target, '/tmp')
+
+    @mock.patch.object(subprocess, 'Popen')
+    def test_remote_file(self, popen):
+        popen.return_value.wait.return_value = 0
+        remote_file = imagebundle.RemoteFile('root@xcat', '/tmp/a b.tar')
+        popen.assert_called_once_with(
+            ['ssh', '-o', 'BatchMode=yes', 'root@xcat',
+             "cat > '/tmp/a b.tar'"],
+            stdin=subprocess.PIPE, stderr=remote_file._stderr)
+        remote_file.close()
+        popen.return_value.stdin.close.assert_called_once_with()
+
+    @mock.patch.object(imagebundle, '_ssh')
+    def test_remote_file_failed(self, ssh):
+        ssh.return_value = ['sh', '-c', 'echo Permission denied >&2; exit 1']
+        remote_file = imagebundle.RemoteFile('root@xcat', '/tmp/b.tar')
+        try:
+            remote_file.close()
+        except IOError as err:
+            self.assertIn('Permission denied', str(err))
+        else:
+            self.fail('IOError not raised')
+
+    @mock.patch.object(imagebundle, '_ssh')
+    def test_remote_file_verbose(self, ssh):
+        # more errors than a pipe holds don't block the writer
+        out_path = os.path.join(self._tmp_path, 'out')
+        ssh.return_value = ['sh', '-c', 'head -c 1000000 /dev/zero >&2; '
+                            'cat > %s' % out_path]
+        remote_file = imagebundle.RemoteFile('root@xcat', out_path)
+        src_fd = os.open(self._image, os.O_RDONLY)
+        self.addCleanup(os.close, src_fd)
+        imagebundle.copy_data(src_fd, remote_file.fileno(), len(self._data))
+        remote_file.close()
+        with open(out_path, 'rb') as f:
+            self.assertEqual(self._data, f.read())
@@ -15,11 +15,16 @@
 
 import mock
 import os
+import shutil
+import tempfile
+import threading
 
 # from zvmsdk.config import CONF
 from zvmsdk import client as zvmclient
 from zvmsdk import config
+from zvmsdk import exception
 from zvmsdk import imageops
+from zvmsdk import imagestore
 from zvmsdk import utils as zvmutils
 from zvmsdk.tests.unit import base
 
@@ -31,6 +36,13 @@ class SDKImageOpsTestCase(base.SDKTestCase):
     def setUp(self):
         self._image_ops = imageops.get_imageops()
         self._pathutil = zvmutils.PathUtils()
+        self._tmp_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tmp_path)
+        imageops._IMAGE_HEADERS.clear()
+        self._store = imagestore.ImageStore(':memory:')
+        patcher = mock.patch.object(imagestore, '_IMAGE_STORE', self._store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_get_image_path_by_name(self):
         fake_name = 'rhel7.2-s390x-netboot-fake_image_uuid'
@@ -39,22 +51,61 @@ class SDKImageOpsTestCase(base.SDKTestCase):
         ret = self._image_ops.get_image_path_by_name(fake_name)
         self.assertEqual(ret, expected_path)
 
-    @mock.patch.object(zvmutils, 'execute')
-    def test_image_get_root_disk_size(self, execute_cmd):
+    def _write_image(self, header, name='0100.img'):
+        image_file_path = os.path.join(self._tmp_path, name)
+        with open(image_file_path, 'wb') as f:
+            f.write(header.ljust(64) + b'\x00' * 512)
+        return image_file_path
+
+    @mock.patch.object(imageops.ImageOps, 'get_image_path_by_name')
+    def test_image_get_root_disk_size(self, get_path):
         fake_name = 'rhel7.2-s390x-netboot-fake_image_uuid'
-        execute_cmd.return_value =\
-            '00000000  78 43 41 54 20 43 4b 44  20 44 69 73 6b 20 49 6d  ' +\
-            '|xCAT CKD Disk Im|\n' +\
-            '00000010  61 67 65 3a 20 20 20 20  20 20 20 20 33 33 33 38  ' +\
-            '|age:        3338|\n' +\
-            '00000020  20 43 59 4c 20 48 4c 65  6e 3a 20 30 30 35 35 20  ' +\
-            '| CYL HLen: 0055 |\n' +\
-            '00000030  47 5a 49 50 3a 20 36 20  20 20 20 20 20 20 20 20  ' +\
-            '|GZIP: 6         |\n' +\
-            '00000040'
+        get_path.return_value = self._write_image(
+            b'xCAT CKD Disk Image:        3338 CYL HLen: 0055 GZIP: 6')
 
         ret = self._image_ops.image_get_root_disk_size(fake_name)
         self.assertEqual(ret, '3338')
+        get_path.assert_called_once_with(fake_name)
+
+    def test_read_image_header(self):
+        image_file_path = self._write_image(
+            b'xCAT FBA Disk Image:     2097152 BLK HLen: 0055 GZIP: 6')
+        header = imageops.read_image_header(image_file_path)
+        self.assertEqual(('FBA', 2097152, 'BLK'), header)
+
+    def test_read_image_header_cached(self):
+        image_file_path = self._write_image(
+            b'xCAT CKD Disk Image:        3338 CYL HLen: 0055 GZIP: 6')
+        header = imageops.read_image_header(image_file_path)
+        with mock.patch('six.moves.builtins.open') as open_file:
+            self.assertEqual(header,
+                             imageops.read_image_header(image_file_path))
+            self.assertFalse(open_file.called)
+
+        # a new image at the same path is read again
+        self._write_image(
+            b'xCAT CKD Disk Image:       10016 CYL HLen: 0055 GZIP: 6')
+        os.utime(image_file_path, (0, 0))
+        self.assertEqual(10016,
+                         imageops.read_image_header(image_file_path).disk_size)
+        self.assertEqual(1, len([k for k in imageops._IMAGE_HEADERS
+                                 if k[0] == image_file_path]))
+
+    def test_read_image_header_invalid_type(self):
+        image_file_path = self._write_image(
+            b'xCAT ECK Disk Image:        3338 CYL HLen: 0055 GZIP: 6')
+        self.assertRaises(exception.ZVMImageError,
+                          imageops.read_image_header, image_file_path)
+
+    def test_read_image_header_no_size(self):
+        image_file_path = self._write_image(b'xCAT CKD Disk Image:')
+        self.assertRaises(exception.ZVMImageError,
+                          imageops.read_image_header, image_file_path)
+
+    def test_read_image_header_no_file(self):
+        self.assertRaises(exception.ZVMImageError,
+                          imageops.read_image_header,
+                          os.path.join(self._tmp_path, 'missing.img'))
 
     @mock.patch.object(os.path, 'exists')
     @mock.patch.object(zvmclient.XCATClient, 'image_import')
@@ -67,8 +118,7 @@ class SDKImageOpsTestCase(base.SDKTestCase):
                                 import_image,
                                 file_exists):
         generate_manifest_file.return_value = './tmp_date_dir/manifest.xml'
-        generate_bundle_file.return_value =\
-                                './tmp_date_dir/tmp_date_dir_test.tar'
+        generate_bundle_file.return_value = self._write_bundle('test.tar')
         check_space.return_value = None
         file_exists.return_value = True
         import_image.return_value = {'data': [['1.output line one'],
@@ -76,8 +126,9 @@ class SDKImageOpsTestCase(base.SDKTestCase):
                                              ['3.output line 3'],
                                              ['4.output line 3'],
                                              ['5.output line 5']]}
-        image_file_path = './test/image-uuid'
-        time_stamp_dir = self._pathutil.make_time_stamp()
+        image_file_path = self._write_image(b'xCAT CKD Disk Image:',
+                                            'image-uuid')
+        time_stamp_dir = self._pathutil.make_time_stamp() + '_image_uuid'
         bundle_file_path = self._pathutil.get_bundle_tmp_path(time_stamp_dir)
         os_version = '7.2'
         image_meta = {
@@ -88,11 +139,195 @@ class SDKImageOpsTestCase(base.SDKTestCase):
                                u'architecture': u's390x',
                                u'provision_method': u'netboot'}
                 }
-        self._image_ops.image_import(image_file_path, os_version)
+        ret = self._image_ops.image_import(image_file_path, os_version)
         generate_manifest_file.assert_called_with(image_meta,
                                                   '0100.img',
                                                   '0100.img',
                                                   bundle_file_path)
+        self.assertEqual('7.2-s390x-netboot-image_uuid', ret)
+        self.assertEqual('7.2-s390x-netboot-image_uuid',
+                         self._store.lookup(self._store.digest(
+                             image_file_path)))
+
+    @mock.patch.object(zvmclient.XCATClient, 'image_query')
+    @mock.patch.object(zvmclient.XCATClient, 'image_import')
+    @mock.patch.object(zvmclient.XCATClient, 'generate_image_bundle')
+    def test_image_import_duplicate(self, generate_bundle_file,
+                                    import_image, image_query):
+        image_file_path = self._write_image(b'xCAT CKD Disk Image:',
+                                            'image-uuid2')
+        self._store.add(self._store.digest(image_file_path),
+                        'rhel7.2-s390x-netboot-image_uuid1')
+        image_query.return_value = ['rhel7.2-s390x-netboot-image_uuid1']
+
+        ret = self._image_ops.image_import(image_file_path, 'rhel7.2')
+        self.assertEqual('rhel7.2-s390x-netboot-image_uuid1', ret)
+        image_query.assert_called_once_with('image_uuid1')
+        self.assertFalse(generate_bundle_file.called)
+        self.assertFalse(import_image.called)
+        self.assertEqual('rhel7.2-s390x-netboot-image_uuid1',
+                         self._store.resolve(
+                             'rhel7.2-s390x-netboot-image_uuid2'))
+        self.assertEqual('/install/netboot/rhel7.2/s390x/image_uuid1/' +
+                         CONF.zvm.user_root_vdev + '.img',
+                         self._image_ops.get_image_path_by_name(
+                             'rhel7.2-s390x-netboot-image_uuid2'))
+
+    @mock.patch.object(zvmclient.XCATClient, 'image_query')
+    @mock.patch.object(zvmclient.XCATClient, 'image_import')
+    @mock.patch.object(zvmclient.XCATClient, 'check_space_imgimport_xcat')
+    @mock.patch.object(zvmclient.XCATClient, 'generate_image_bundle')
+    @mock.patch.object(zvmclient.XCATClient, 'generate_manifest_file')
+    def test_image_import_duplicate_removed(self, generate_manifest_file,
+                                            generate_bundle_file,
+                                            check_space, import_image,
+                                            image_query):
+        image_file_path = self._write_image(b'xCAT CKD Disk Image:',
+                                            'image-uuid2')
+        digest = self._store.digest(image_file_path)
+        self._store.add(digest, 'rhel7.2-s390x-netboot-image_uuid1')
+        # the image was deleted from xCAT by others, the query matches
+        # another image only
+        image_query.return_value = ['rhel7.2-s390x-netboot-image_uuid10']
+        generate_bundle_file.return_value = self._write_bundle('uuid2.tar')
+
+        ret = self._image_ops.image_import(image_file_path, 'rhel7.2')
+        self.assertEqual('rhel7.2-s390x-netboot-image_uuid2', ret)
+        self.assertTrue(import_image.called)
+        self.assertEqual('rhel7.2-s390x-netboot-image_uuid2',
+                         self._store.lookup(digest))
+
+    def _write_bundle(self, name):
+        path = os.path.join(self._tmp_path, name)
+        with open(path, 'wb') as f:
+            f.write(b'bundle')
+        return path
+
+    def _fake_import(self, bundle, profile, streamed, compressed):
+        if profile == 'img_fail':
+            raise exception.ZVMImageError(msg='import failed')
+
+    def _fake_bundle(self, spawn_path, time_stamp_dir, image_name,
+                     image_file_path, codec):
+        if 'bad' in image_file_path:
+            raise exception.ZVMImageError(msg='bad image')
+        return self._write_bundle(os.path.basename(image_file_path) + '.tar')
+
+    @mock.patch.object(zvmutils, 'get_free_space')
+    @mock.patch.object(zvmclient.XCATClient, 'get_free_space_xcat')
+    @mock.patch.object(zvmclient.XCATClient, 'image_query')
+    @mock.patch.object(zvmclient.XCATClient, 'image_import')
+    @mock.patch.object(zvmclient.XCATClient, 'generate_image_bundle')
+    @mock.patch.object(zvmclient.XCATClient, 'generate_manifest_file')
+    def test_images_import(self, generate_manifest_file, generate_bundle_file,
+                           import_image, image_query, xcat_free_space,
+                           local_free_space):
+        xcat_free_space.return_value = 10 ** 9
+        local_free_space.return_value = 10 ** 9
+        generate_bundle_file.side_effect = self._fake_bundle
+        image_query.return_value = ['rhel7.2-s390x-netboot-img_dup']
+        img_new = self._write_image(b'xCAT CKD Disk Image:', 'img-new')
+        img_bad = self._write_image(b'xCAT CKD Disk Image: bad', 'img-bad')
+        img_dup = self._write_image(b'xCAT CKD Disk Image: dup', 'img-dup2')
+        self._store.add(self._store.digest(img_dup),
+                        'rhel7.2-s390x-netboot-img_dup')
+        img_missing = os.path.join(self._tmp_path, 'img-missing')
+        img_fail = self._write_image(b'xCAT CKD Disk Image: fail', 'img-fail')
+        import_image.side_effect = self._fake_import
+
+        with mock.patch.dict(CONF.xcat, {'free_space_threshold': 0}):
+            results = self._image_ops.images_import(
+                [(img_new, 'rhel7.2'), (img_bad, 'rhel7.2'),
+                 (img_dup, 'rhel7.2'), (img_missing, 'rhel7.2'),
+                 (img_fail, 'rhel7.2')])
+
+        self.assertTrue(results[img_new]['imported'])
+        self.assertEqual('rhel7.2-s390x-netboot-img_new',
+                         results[img_new]['osimage'])
+        self.assertEqual(576, results[img_new]['size'])
+        self.assertGreater(results[img_new]['throughput'], 0)
+        import_image.assert_any_call(img_new + '.tar', 'img_new',
+                                     streamed=False, compressed=False)
+        self.assertEqual({'imported': False, 'stage': 'bundle',
+                          'error': 'Image error: bad image'},
+                         results[img_bad])
+        self.assertEqual('rhel7.2-s390x-netboot-img_dup',
+                         results[img_dup]['osimage'])
+        self.assertEqual('rhel7.2-s390x-netboot-img_dup',
+                         self._store.resolve('rhel7.2-s390x-netboot-img_dup2'))
+        self.assertFalse(results[img_missing]['imported'])
+        self.assertEqual({'imported': False, 'stage': 'import',
+                          'error': 'Image error: import failed'},
+                         results[img_fail])
+        self.assertEqual(3, generate_manifest_file.call_count)
+
+    @mock.patch.object(zvmutils, 'get_free_space')
+    @mock.patch.object(zvmclient.XCATClient, 'get_free_space_xcat')
+    @mock.patch.object(zvmclient.XCATClient, 'image_import')
+    @mock.patch.object(zvmclient.XCATClient, 'generate_image_bundle')
+    @mock.patch.object(zvmclient.XCATClient, 'generate_manifest_file')
+    def test_images_import_no_space(self, generate_manifest_file,
+                                    generate_bundle_file, import_image,
+                                    xcat_free_space, local_free_space):
+        local_free_space.return_value = 10 ** 9
+        # two images fit in xCAT MN above the threshold, not three
+        xcat_free_space.return_value = 3 * 1024 ** 3 + 576 * 3
+        generate_bundle_file.side_effect = self._fake_bundle
+        images = [self._write_image(b'xCAT CKD Disk Image: %d' % i,
+                                    'img-%d' % i) for i in range(3)]
+
+        with mock.patch.dict(CONF.xcat, {'free_space_threshold': 3}):
+            results = self._image_ops.images_import(
+                [(img, 'rhel7.2') for img in images])
+
+        imported = [img for img in images if results[img]['imported']]
+        self.assertEqual(2, len(imported))
+        self.assertEqual(2, import_image.call_count)
+        failed = [results[img] for img in images
+                  if not results[img]['imported']]
+        self.assertEqual('import', failed[0]['stage'])
+
+    @mock.patch.object(zvmclient.XCATClient, 'get_free_space_xcat')
+    @mock.patch.object(zvmclient.XCATClient, 'image_import')
+    @mock.patch.object(zvmclient.XCATClient, 'stream_image_bundle')
+    @mock.patch.object(zvmclient.XCATClient, 'generate_manifest_file')
+    def test_images_import_streamed_no_space(self, generate_manifest_file,
+                                             stream_bundle, import_image,
+                                             xcat_free_space):
+        # the streamed bundles take the space of xCAT MN as they are built
+        xcat_free_space.return_value = 3 * 1024 ** 3 + 576 * 3
+        stream_bundle.return_value = '/install/tmp/bundle.tar'
+        images = [self._write_image(b'xCAT CKD Disk Image: %d' % i,
+                                    'img-%d' % i) for i in range(3)]
+
+        with mock.patch.dict(CONF.xcat, {'free_space_threshold': 3,
+                                         'bundle_stream_target':
+                                         'root@xcat:/install/tmp'}):
+            results = self._image_ops.images_import(
+                [(img, 'rhel7.2') for img in images])
+
+        self.assertEqual(2, stream_bundle.call_count)
+        self.assertEqual(2, import_image.call_count)
+        failed = [results[img] for img in images
+                  if not results[img]['imported']]
+        self.assertEqual(1, len(failed))
+        self.assertEqual('bundle', failed[0]['stage'])
+
+    def test_space_budget(self):
+        budget = imageops.SpaceBudget('fake', 100)
+        self.assertRaises(exception.ZVMImageError, budget.acquire, 101)
+        budget.acquire(60)
+        waiter = threading.Thread(target=budget.acquire, args=(60,))
+        waiter.start()
+        waiter.join(0.05)
+        self.assertTrue(waiter.is_alive())
+        budget.release(60, keep=30)
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(60, budget.used)
+        self.assertEqual(70, budget.capacity)
+        # never fits any more
+        self.assertRaises(exception.ZVMImageError, budget.acquire, 71)
 
     @mock.patch.object(zvmclient.XCATClient, 'image_query')
     def test_image_query(self, image_query):
@@ -0,0 +1,90 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import hashlib
+import mock
+import os
+import shutil
+import tempfile
+
+from zvmsdk import imagestore
+from zvmsdk.tests.unit import base
+
+
+class SDKImageStoreTestCase(base.SDKTestCase):
+    def setUp(self):
+        super(SDKImageStoreTestCase, self).setUp()
+        self._store = imagestore.ImageStore(':memory:')
+        self._tmp_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tmp_path)
+        self._image = os.path.join(self._tmp_path, '0100.img')
+        with open(self._image, 'wb') as f:
+            f.write(b'image' * 500000)
+
+    def test_digest(self):
+        expected = hashlib.sha256(b'image' * 500000).hexdigest()
+        self.assertEqual(expected, imagestore.file_digest(self._image))
+        self.assertEqual(expected, self._store.digest(self._image))
+
+    @mock.patch.object(imagestore, 'file_digest')
+    def test_digest_cached(self, file_digest):
+        file_digest.return_value = 'digest1'
+        self.assertEqual('digest1', self._store.digest(self._image))
+        self.assertEqual('digest1', self._store.digest(self._image))
+        self.assertEqual(1, file_digest.call_count)
+
+        # a changed file is hashed again
+        file_digest.return_value = 'digest2'
+        with open(self._image, 'ab') as f:
+            f.write(b'more')
+        self.assertEqual('digest2', self._store.digest(self._image))
+
+    def test_lookup_and_resolve(self):
+        self.assertIsNone(self._store.lookup('digest1'))
+        self._store.add('digest1', 'rhel7.2-s390x-netboot-img1', 100)
+        self._store.add_alias('rhel7.2-s390x-netboot-img2', 'digest1')
+        self.assertEqual('rhel7.2-s390x-netboot-img1',
+                         self._store.lookup('digest1'))
+        self.assertEqual('rhel7.2-s390x-netboot-img1',
+                         self._store.resolve('rhel7.2-s390x-netboot-img2'))
+        self.assertEqual('rhel7.2-s390x-netboot-img3',
+                         self._store.resolve('rhel7.2-s390x-netboot-img3'))
+
+        self._store.remove_alias('rhel7.2-s390x-netboot-img2')
+        self.assertEqual('rhel7.2-s390x-netboot-img2',
+                         self._store.resolve('rhel7.2-s390x-netboot-img2'))
+
+    def test_remove(self):
+        self._store.add('digest1', 'rhel7.2-s390x-netboot-img1', 100)
+        self._store.add_alias('rhel7.2-s390x-netboot-img2', 'digest1')
+        self._store.remove('rhel7.2-s390x-netboot-img1')
+        self.assertIsNone(self._store.lookup('digest1'))
+        self.assertEqual('rhel7.2-s390x-netboot-img2',
+                         self._store.resolve('rhel7.2-s390x-netboot-img2'))
+
+    def test_aliases(self):
+        self._store.add('digest1', 'rhel7.2-s390x-netboot-img1', 100)
+        self.assertEqual([], self._store.aliases('rhel7.2-s390x-netboot-img1'))
+        self._store.add_alias('rhel7.2-s390x-netboot-img3', 'digest1')
+        self._store.add_alias('rhel7.2-s390x-netboot-img2', 'digest1')
+        self.assertEqual(['rhel7.2-s390x-netboot-img2',
+                          'rhel7.2-s390x-netboot-img3'],
+                         self._store.aliases('rhel7.2-s390x-netboot-img1'))
+
+    def test_persistent(self):
+        path = os.path.join(self._tmp_path, 'db', 'imagestore.db')
+        imagestore.ImageStore(path).add('digest1', 'osimage1')
+        self.assertEqual('osimage1',
+                         imagestore.ImageStore(path).lookup('digest1'))
@@ -0,0 +1,145 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import mock
+import time
+
+from zvmsdk import client as zvmclient
+from zvmsdk import inventory
+from zvmsdk import tablecache
+from zvmsdk import utils as zvmutils
+from zvmsdk.tests.unit import base
+
+
+class SDKInventoryTestCase(base.SDKTestCase):
+    def setUp(self):
+        super(SDKInventoryTestCase, self).setUp()
+        self._inventory = inventory.Inventory(path=':memory:')
+        self._xcat_url = zvmutils.get_xcat_url()
+        tablecache.get_table_cache().invalidate()
+
+    def _fake_tables(self, url):
+        if url == self._xcat_url.tabdump('/zvm'):
+            return {'data': [[
+                '#node,hcp,userid,nodetype,parent,comments,disable',
+                '"fakehcp","fakehcp.fake.com","HCP","vm","fakenode",,',
+                '"node1","FAKEHCP.fake.com","USER1",,,,',
+                '"node2","otherhcp.fake.com","USER2",,,,']]}
+        return {'data': [[
+            '#node,switch,port,vlan,interface,comments,disable',
+            '"node1","sw1","port1",,"1000","fakehcp",',
+            '"node1",,"port2",,"1003","fakehcp",']]}
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_lookups(self, xrequest):
+        xrequest.side_effect = lambda method, url, **kw: self._fake_tables(url)
+        self.assertEqual(['fakehcp', 'node1'],
+                         self._inventory.list_guests('fakehcp.fake.com'))
+        self.assertEqual('USER2', self._inventory.get_guest('node2')['userid'])
+        nics = self._inventory.get_nics('node1')
+        self.assertEqual(['1000', '1003'], [n['interface'] for n in nics])
+        self.assertEqual('node1',
+                         self._inventory.get_nics_by_port('port2')[0]['node'])
+        # each table is loaded once
+        self.assertEqual(2, xrequest.call_count)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_lookup_reload_on_miss(self, xrequest):
+        xrequest.side_effect = lambda method, url, **kw: self._fake_tables(url)
+        self.assertIsNone(self._inventory.get_guest('node3'))
+        self.assertEqual(2, xrequest.call_count)
+        self.assertEqual([], self._inventory.get_nics('node3'))
+        self.assertEqual(3, xrequest.call_count)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_writes(self, xrequest):
+        xrequest.side_effect = lambda method, url, **kw: self._fake_tables(url)
+        self._inventory.reconcile()
+        self._inventory.add_guest('node3', 'fakehcp.fake.com', 'USER3')
+        self._inventory.add_nic('node3', 'port3', '1000', 'fakehcp')
+        self._inventory.set_nic_switch('node3', '1000', 'sw2')
+        self.assertEqual(['fakehcp', 'node1', 'node3'],
+                         self._inventory.list_guests('fakehcp.fake.com'))
+        self.assertEqual('sw2',
+                         self._inventory.get_nics('node3')[0]['switch'])
+        self._inventory.remove_guest('node1')
+        self.assertEqual([], self._inventory.get_nics('node1'))
+        self.assertEqual(['fakehcp', 'node3'],
+                         self._inventory.list_guests('fakehcp.fake.com'))
+        self.assertEqual(2, xrequest.call_count)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_reconcile_interval(self, xrequest):
+        xrequest.side_effect = lambda method, url, **kw: self._fake_tables(url)
+        self.assertEqual(['fakehcp', 'node1'],
+                         self._inventory.list_guests('fakehcp.fake.com'))
+        self.assertEqual(1, xrequest.call_count)
+
+        # another process added a guest, seen once the table is reconciled
+        def _added_by_others(method, url, **kwargs):
+            data = self._fake_tables(url)
+            data['data'][0].append('"node4","fakehcp.fake.com","USER4",,,,')
+            return data
+
+        xrequest.side_effect = _added_by_others
+        # writes to xCAT tables don't reload the inventory
+        tablecache.get_table_cache().invalidate('zvm')
+        self.assertEqual(['fakehcp', 'node1'],
+                         self._inventory.list_guests('fakehcp.fake.com'))
+        self.assertEqual(1, xrequest.call_count)
+        with mock.patch.object(time, 'time',
+                               return_value=time.time() + 600):
+            self.assertEqual(['fakehcp', 'node1', 'node4'],
+                             self._inventory.list_guests('fakehcp.fake.com'))
+        self.assertEqual(2, xrequest.call_count)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_reconcile(self, xrequest):
+        xrequest.side_effect = lambda method, url, **kw: self._fake_tables(url)
+        self._inventory.reconcile()
+        self._inventory.add_guest('node3', 'fakehcp.fake.com', 'USER3')
+        self._inventory.set_nic_switch('node1', '1003', 'sw2')
+        self._inventory.reconcile()
+        # rows unknown to xCAT are dropped, recorded switches are kept
+        self.assertIsNone(self._inventory.get_guest('node3'))
+        self.assertEqual(['sw1', 'sw2'], [n['switch'] for n in
+                                          self._inventory.get_nics('node1')])
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_sync_written_meanwhile(self, xrequest):
+        def _write_while_loading(method, url, **kwargs):
+            # as XCATClient.create_xcat_node does
+            self._inventory.add_guest('node3', 'fakehcp.fake.com', 'USER3')
+            tablecache.get_table_cache().invalidate('zvm')
+            return self._fake_tables(url)
+
+        xrequest.side_effect = _write_while_loading
+        self.assertFalse(self._inventory.sync('guests'))
+        self.assertEqual('USER3', self._inventory.get_guest('node3')['userid'])
+
+    @mock.patch.object(zvmutils, 'xdsh_batch')
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_client_writes_update_inventory(self, xrequest, xdsh_batch):
+        client = zvmclient.XCATClient()
+        with mock.patch.object(client, '_inventory') as inv:
+            client.create_xcat_node('node3')
+            inv.add_guest.assert_called_once_with(
+                'node3', zvmclient.CONF.xcat.zhcp, 'node3')
+            client.couple_nic_to_vswitch('sw1', '1000', 'node3',
+                                         persist=False)
+            inv.set_nic_switch.assert_called_once_with('node3', '1000',
+                                                       'sw1')
+            client.delete_xcat_node('node3')
+            inv.remove_guest.assert_called_once_with('node3')
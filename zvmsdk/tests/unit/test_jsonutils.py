@@ -0,0 +1,76 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import collections
+import json
+import mock
+import unittest
+
+from zvmsdk import jsonutils
+from zvmsdk.tests.unit import base
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+
+class SDKJsonUtilsTestCase(base.SDKTestCase):
+    def setUp(self):
+        super(SDKJsonUtilsTestCase, self).setUp()
+        self._doc = {'data': [['#node,hcp,userid,nodetype,parent',
+                               '"fakenode","fakehcp.fake.com","FAKEUSER",,']],
+                     'info': [], 'error': [], 'float': 0.1 + 0.2,
+                     'big': 2 ** 70, 'text': u'caf\xe9/\u2603'}
+
+    def test_loads_same_as_json(self):
+        s = json.dumps(self._doc)
+        result = jsonutils.loads(s)
+        self.assertEqual(json.loads(s), result)
+        self.assertIsInstance(result['data'][0][0], type(u''))
+
+    def test_dumps_same_as_json(self):
+        self.assertEqual(json.dumps(self._doc), jsonutils.dumps(self._doc))
+        self.assertEqual(json.dumps(self._doc, sort_keys=True),
+                         jsonutils.dumps(self._doc, sort_keys=True))
+
+    def test_dumps_namedtuple_same_as_json(self):
+        point = collections.namedtuple('Point', ['x', 'y'])
+        doc = {'points': [point(1, 2), point(3, 4)], 'tuple': (5, 6)}
+        s = jsonutils.dumps(doc)
+        self.assertEqual(json.dumps(doc), s)
+        self.assertEqual(json.loads(json.dumps(doc)), jsonutils.loads(s))
+
+    @unittest.skipIf(simplejson is None, "simplejson is not installed")
+    @mock.patch.object(jsonutils, '_fast_encoder', simplejson)
+    def test_dumps_simplejson_same_as_json(self):
+        point = collections.namedtuple('Point', ['x', 'y'])
+        doc = dict(self._doc, point=point(1, 2))
+        self.assertEqual(json.dumps(doc), jsonutils._get_encode()(doc))
+
+    @mock.patch.object(jsonutils, '_fast_encoder')
+    def test_get_encode_simplejson_defaults(self, fast_encoder):
+        jsonutils._get_encode()({'a': 1})
+        fast_encoder.dumps.assert_called_once_with(
+            {'a': 1}, namedtuple_as_object=False, use_decimal=False)
+
+    def test_loads_invalid(self):
+        self.assertRaises(ValueError, jsonutils.loads, '{"data": [')
+
+    @mock.patch.object(jsonutils, '_decode')
+    def test_loads_fallback_to_json(self, decode):
+        decode.side_effect = OverflowError()
+        self.assertEqual({'big': 2 ** 70}, jsonutils.loads('{"big": %d}' %
+                                                           2 ** 70))
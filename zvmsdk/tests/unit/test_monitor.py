@@ -13,10 +13,13 @@
 #    under the License.
 
 import mock
+import threading
+import time
 
 import zvmsdk.client as zvmclient
 from zvmsdk import exception
 from zvmsdk import monitor
+from zvmsdk import powerstate
 from zvmsdk.tests.unit import base
 
 
@@ -25,7 +28,7 @@ class SDKMonitorTestCase(base.SDKTestCase):
         self._monitor = monitor.get_monitor()
 
     @mock.patch.object(monitor.MeteringCache, 'get')
-    @mock.patch.object(zvmclient.XCATClient, 'get_power_state')
+    @mock.patch.object(powerstate.PowerStatePoller, 'query_power_states')
     @mock.patch.object(monitor.ZVMMonitor, '_cache_enabled')
     def test_private_get_inspect_data_cache_hit_single(self, cache_enabled,
                                                        get_ps, cache_get):
@@ -57,7 +60,7 @@ class SDKMonitorTestCase(base.SDKTestCase):
         cache_enabled.assert_not_called()
 
     @mock.patch.object(monitor.MeteringCache, 'get')
-    @mock.patch.object(zvmclient.XCATClient, 'get_power_state')
+    @mock.patch.object(powerstate.PowerStatePoller, 'query_power_states')
     @mock.patch.object(monitor.ZVMMonitor, '_cache_enabled')
     def test_private_get_inspect_data_cache_hit_multi(self, cache_enabled,
                                                        get_ps, cache_get):
@@ -104,17 +107,19 @@ class SDKMonitorTestCase(base.SDKTestCase):
         get_ps.assert_not_called()
         cache_enabled.assert_not_called()
 
+    @mock.patch.object(monitor.ZVMMonitor, '_start_collector')
     @mock.patch.object(monitor.MeteringCache, 'get')
-    @mock.patch.object(zvmclient.XCATClient, 'get_power_state')
+    @mock.patch.object(powerstate.PowerStatePoller, 'query_power_states')
     @mock.patch.object(monitor.ZVMMonitor, '_cache_enabled')
     @mock.patch.object(zvmclient.XCATClient, 'image_performance_query')
     @mock.patch.object(zvmclient.XCATClient, 'get_vm_list')
     def test_private_get_inspect_data_cache_miss_single(self, get_vm_list,
                                                         image_perform_query,
                                                         cache_enabled,
-                                                        get_ps, cache_get):
+                                                        get_ps, cache_get,
+                                                        start_collector):
         cache_get.return_value = None
-        get_ps.return_value = 'on'
+        get_ps.return_value = ({'userid1': 'on'}, {})
         cache_enabled.return_value = True
         image_perform_query.return_value = {
             'USERID1': {
@@ -142,11 +147,12 @@ class SDKMonitorTestCase(base.SDKTestCase):
                 'max_memory': '2097152 KB',
                 }
             }
-        get_vm_list.return_value = ['userid1', 'userid2']
         rdata = self._monitor._get_inspect_data('cpumem', ['userid1'])
-        get_ps.assert_called_once_with('userid1')
-        get_vm_list.assert_called_once_with()
-        image_perform_query.assert_called_once_with(['userid1', 'userid2'])
+        get_ps.assert_called_once_with(['userid1'])
+        start_collector.assert_called_once_with()
+        # the whole host is queried in background by the collector
+        get_vm_list.assert_not_called()
+        image_perform_query.assert_called_once_with(['userid1'])
         self.assertEqual(sorted(rdata.keys()), sorted(['USERID1', 'USERID2']))
         self.assertEqual(sorted(rdata['USERID1'].keys()),
                          sorted(['userid', 'guest_cpus',
@@ -162,15 +168,17 @@ class SDKMonitorTestCase(base.SDKTestCase):
         self._monitor._cache._cache['cpumem']['data']['USERID2']['guest_cpus'],
         '3')
 
+    @mock.patch.object(monitor.ZVMMonitor, '_start_collector')
     @mock.patch.object(monitor.MeteringCache, 'get')
-    @mock.patch.object(zvmclient.XCATClient, 'get_power_state')
+    @mock.patch.object(powerstate.PowerStatePoller, 'query_power_states')
     @mock.patch.object(monitor.ZVMMonitor, '_cache_enabled')
     @mock.patch.object(zvmclient.XCATClient, 'image_performance_query')
     @mock.patch.object(zvmclient.XCATClient, 'get_vm_list')
     def test_private_get_inspect_data_cache_miss_multi(self, get_vm_list,
                                                         image_perform_query,
                                                         cache_enabled,
-                                                        get_ps, cache_get):
+                                                        get_ps, cache_get,
+                                                        start_collector):
         cache_get.side_effect = [{
             'userid': 'USERID1',
             'guest_cpus': '1',
@@ -183,21 +191,9 @@ class SDKMonitorTestCase(base.SDKTestCase):
             'used_memory': '290232 KB',
             'max_memory': '2097152 KB',
             }, None]
-        get_ps.return_value = 'on'
+        get_ps.return_value = ({'userid2': 'on'}, {})
         cache_enabled.return_value = True
         image_perform_query.return_value = {
-            'USERID1': {
-                'userid': 'USERID1',
-                'guest_cpus': '1',
-                'used_cpu_time': '7185838 uS',
-                'elapsed_cpu_time': '35232895 uS',
-                'min_cpu_count': '2',
-                'max_cpu_limit': '10000',
-                'samples_cpu_in_use': '0',
-                'samples_cpu_delay': '0',
-                'used_memory': '390232 KB',
-                'max_memory': '3097152 KB',
-                },
             'USERID2': {
                 'userid': 'USERID2',
                 'guest_cpus': '4',
@@ -211,12 +207,11 @@ class SDKMonitorTestCase(base.SDKTestCase):
                 'max_memory': '2097152 KB',
                 }
             }
-        get_vm_list.return_value = ['userid1', 'userid2']
         rdata = self._monitor._get_inspect_data('cpumem',
                                                 ['userid1', 'userid2'])
-        get_ps.assert_called_once_with('userid2')
-        get_vm_list.assert_called_once_with()
-        image_perform_query.assert_called_once_with(['userid1', 'userid2'])
+        get_ps.assert_called_once_with(['userid2'])
+        get_vm_list.assert_not_called()
+        image_perform_query.assert_called_once_with(['userid2'])
         self.assertEqual(sorted(rdata.keys()), sorted(['USERID1', 'USERID2']))
         self.assertEqual(sorted(rdata['USERID1'].keys()),
                          sorted(['userid', 'guest_cpus',
@@ -226,14 +221,15 @@ class SDKMonitorTestCase(base.SDKTestCase):
                                  'samples_cpu_delay',
                                  'used_memory', 'max_memory']))
         self.assertEqual(rdata['USERID1']['guest_cpus'], '1')
-        self.assertEqual(rdata['USERID1']['used_cpu_time'], '7185838 uS')
-        self.assertEqual(rdata['USERID1']['used_memory'], '390232 KB')
+        self.assertEqual(rdata['USERID1']['used_cpu_time'], '6185838 uS')
+        self.assertEqual(rdata['USERID1']['used_memory'], '290232 KB')
+        self.assertEqual(rdata['USERID2']['guest_cpus'], '4')
         self.assertEqual(
         self._monitor._cache._cache['cpumem']['data']['USERID2']['guest_cpus'],
         '4')
 
     @mock.patch.object(monitor.MeteringCache, 'get')
-    @mock.patch.object(zvmclient.XCATClient, 'get_power_state')
+    @mock.patch.object(powerstate.PowerStatePoller, 'query_power_states')
     @mock.patch.object(monitor.ZVMMonitor, '_cache_enabled')
     @mock.patch.object(zvmclient.XCATClient, 'image_performance_query')
     @mock.patch.object(zvmclient.XCATClient, 'get_vm_list')
@@ -242,7 +238,7 @@ class SDKMonitorTestCase(base.SDKTestCase):
                                                         cache_enabled,
                                                         get_ps, cache_get):
         cache_get.return_value = None
-        get_ps.return_value = 'on'
+        get_ps.return_value = ({'userid1': 'on'}, {})
         cache_enabled.return_value = False
         image_perform_query.return_value = {
             'USERID1': {
@@ -260,7 +256,7 @@ class SDKMonitorTestCase(base.SDKTestCase):
             }
         rdata = self._monitor._get_inspect_data('cpumem',
                                                 ['userid1'])
-        get_ps.assert_called_once_with('userid1')
+        get_ps.assert_called_once_with(['userid1'])
         get_vm_list.assert_not_called()
         image_perform_query.assert_called_once_with(['userid1'])
         self.assertEqual(rdata.keys(), ['USERID1'])
@@ -278,7 +274,7 @@ class SDKMonitorTestCase(base.SDKTestCase):
         self._monitor._cache._cache['cpumem']['data'].keys(), [])
 
     @mock.patch.object(monitor.MeteringCache, 'get')
-    @mock.patch.object(zvmclient.XCATClient, 'get_power_state')
+    @mock.patch.object(powerstate.PowerStatePoller, 'query_power_states')
     @mock.patch.object(monitor.ZVMMonitor, '_cache_enabled')
     @mock.patch.object(zvmclient.XCATClient, 'image_performance_query')
     @mock.patch.object(zvmclient.XCATClient, 'get_vm_list')
@@ -287,18 +283,18 @@ class SDKMonitorTestCase(base.SDKTestCase):
                                                         cache_enabled,
                                                         get_ps, cache_get):
         cache_get.return_value = None
-        get_ps.return_value = 'off'
+        get_ps.return_value = ({'userid1': 'off'}, {})
         cache_enabled.return_value = True
         rdata = self._monitor._get_inspect_data('cpumem',
                                                 ['userid1'])
-        get_ps.assert_called_once_with('userid1')
+        get_ps.assert_called_once_with(['userid1'])
         cache_enabled.assert_not_called()
         get_vm_list.assert_not_called()
         image_perform_query.assert_not_called()
         self.assertEqual(rdata, {})
 
     @mock.patch.object(monitor.MeteringCache, 'get')
-    @mock.patch.object(zvmclient.XCATClient, 'get_power_state')
+    @mock.patch.object(powerstate.PowerStatePoller, 'query_power_states')
     @mock.patch.object(monitor.ZVMMonitor, '_cache_enabled')
     @mock.patch.object(zvmclient.XCATClient, 'image_performance_query')
     @mock.patch.object(zvmclient.XCATClient, 'get_vm_list')
@@ -307,16 +303,44 @@ class SDKMonitorTestCase(base.SDKTestCase):
                                                         cache_enabled,
                                                         get_ps, cache_get):
         cache_get.return_value = None
-        get_ps.side_effect = exception.ZVMVirtualMachineNotExist(msg='msg')
+        get_ps.return_value = ({}, {})
         cache_enabled.return_value = True
         rdata = self._monitor._get_inspect_data('cpumem',
                                                 ['userid1'])
-        get_ps.assert_called_once_with('userid1')
+        get_ps.assert_called_once_with(['userid1'])
         cache_enabled.assert_not_called()
         get_vm_list.assert_not_called()
         image_perform_query.assert_not_called()
         self.assertEqual(rdata, {})
 
+    @mock.patch.object(monitor.MeteringCache, 'get')
+    @mock.patch.object(powerstate.PowerStatePoller, 'query_power_states')
+    @mock.patch.object(zvmclient.XCATClient, 'image_performance_query')
+    def test_private_get_inspect_data_query_not_exist(self,
+                                                      image_perform_query,
+                                                      get_ps, cache_get):
+        cache_get.return_value = None
+        get_ps.return_value = ({}, {'userid1':
+                                    exception.ZVMVirtualMachineNotExist(
+                                        zvm_host='fakehost',
+                                        userid='userid1')})
+        rdata = self._monitor._get_inspect_data('cpumem', ['userid1'])
+        image_perform_query.assert_not_called()
+        self.assertEqual(rdata, {})
+
+    @mock.patch.object(monitor.MeteringCache, 'get')
+    @mock.patch.object(powerstate.PowerStatePoller, 'query_power_states')
+    @mock.patch.object(zvmclient.XCATClient, 'image_performance_query')
+    def test_private_get_inspect_data_query_failed(self, image_perform_query,
+                                                   get_ps, cache_get):
+        cache_get.return_value = None
+        get_ps.return_value = ({'userid1': 'on'}, {'userid2':
+                               exception.ZVMXCATInternalError(msg='fake')})
+        self.assertRaises(exception.ZVMXCATInternalError,
+                          self._monitor._get_inspect_data, 'cpumem',
+                          ['userid1', 'userid2'])
+        image_perform_query.assert_not_called()
+
     @mock.patch.object(monitor.ZVMMonitor, '_get_inspect_data')
     def test_inspect_cpus_single(self, _get_inspect_data):
         _get_inspect_data.return_value = {
@@ -463,3 +487,57 @@ class SDKMonitorTestCase(base.SDKTestCase):
         self.assertEqual(rdata['USERID1']['elapsed_cpu_time_us'], 35232895)
         self.assertEqual(rdata['USERID1']['min_cpu_count'], 2)
         self.assertEqual(rdata['USERID1']['max_cpu_limit'], 10000)
+
+
+class SDKMeteringCollectorTestCase(base.SDKTestCase):
+    def setUp(self):
+        super(SDKMeteringCollectorTestCase, self).setUp()
+        self._client = mock.Mock()
+        self._cache = monitor.MeteringCache(('cpumem', 'vnics'))
+        self._collector = monitor.MeteringCollector(self._client,
+                                                    self._cache,
+                                                    ('cpumem',))
+
+    def test_refresh(self):
+        self._client.get_vm_list.return_value = ['userid1']
+        self._client.image_performance_query.return_value = {
+            'USERID1': {'userid': 'USERID1', 'guest_cpus': '1'}}
+        self.assertIsNone(self._collector.stats()['cache_age'])
+        self._collector.refresh()
+        self._client.image_performance_query.assert_called_once_with(
+            ['userid1'])
+        self.assertEqual('1', self._cache.get('cpumem',
+                                              'userid1')['guest_cpus'])
+        stats = self._collector.stats()
+        self.assertEqual(1, stats['refresh_count'])
+        self.assertFalse(stats['refreshing'])
+        self.assertIsNotNone(stats['refresh_duration'])
+        self.assertTrue(stats['cache_age'] < 60)
+        self.assertIsNone(stats['last_error'])
+
+    def test_refresh_failed_keeps_data(self):
+        self._cache.refresh('cpumem', {'USERID1': {'userid': 'USERID1'}})
+        self._client.get_vm_list.side_effect = exception.ZVMXCATRequestFailed(
+            xcatserver='xcat', msg='fake')
+        self._collector.refresh()
+        self.assertIsNotNone(self._cache.get('cpumem', 'userid1'))
+        self.assertIn('fake', self._collector.stats()['last_error'])
+
+    def test_stale_data_served(self):
+        self._cache.refresh('cpumem', {'USERID1': {'userid': 'USERID1'}})
+        expiration = self._cache._cache['cpumem']['expiration']
+        with mock.patch.object(time, 'time') as fake_time:
+            fake_time.return_value = expiration + 10
+            self.assertIsNone(self._cache.get('cpumem', 'userid1'))
+            self.assertIsNotNone(self._cache.get('cpumem', 'userid1',
+                                                 max_stale=60))
+
+    def test_start_runs_in_background(self):
+        refreshed = threading.Event()
+        self._client.get_vm_list.side_effect = lambda: refreshed.set() or []
+        self._client.image_performance_query.return_value = {}
+        self._collector.start()
+        self.assertTrue(refreshed.wait(5))
+        self._collector.stop()
+        self._collector._thread.join(5)
+        self.assertTrue(self._collector._thread.daemon)
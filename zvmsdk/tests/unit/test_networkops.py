@@ -74,6 +74,13 @@ class SDKNetworkOpsTestCase(base.SDKTestCase):
         self.networkops.grant_user_to_vswitch("vswitch_name", "userid")
         grant_user.assert_called_with("vswitch_name", "userid")
 
+    @mock.patch.object(zvmclient.XCATClient, 'grant_users_to_vswitch')
+    def test_grant_users_to_vswitch(self, grant_users):
+        self.networkops.grant_users_to_vswitch("vswitch_name",
+                                               ["userid1", "userid2"])
+        grant_users.assert_called_with("vswitch_name",
+                                       ["userid1", "userid2"])
+
     @mock.patch.object(zvmclient.XCATClient, 'revoke_user_from_vswitch')
     def test_revoke_user_from_vswitch(self, revoke_user):
         self.networkops.revoke_user_from_vswitch("vswitch_name", "userid")
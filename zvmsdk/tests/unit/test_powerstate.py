@@ -0,0 +1,137 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import mock
+import time
+
+from zvmsdk import config
+from zvmsdk import exception
+from zvmsdk import powerstate
+from zvmsdk.tests.unit import base
+
+
+CONF = config.CONF
+
+
+class SDKPowerStatePollerTestCase(base.SDKTestCase):
+    def setUp(self):
+        super(SDKPowerStatePollerTestCase, self).setUp()
+        self._client = mock.Mock()
+        self._poller = powerstate.PowerStatePoller(self._client)
+
+    def _waiter(self, userid, state='off', timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        waiter = powerstate.PowerStateWaiter(userid, state, deadline)
+        self._poller._waiters.append(waiter)
+        return waiter
+
+    def test_poll(self):
+        self._client.get_power_states.return_value = {'user1': 'off',
+                                                      'user2': 'on'}
+        waiter1 = self._waiter('USER1')
+        waiter2 = self._waiter('user2')
+        waiter3 = self._waiter('user2', timeout=-1)
+        self._poller.poll(list(self._poller._waiters))
+
+        # one query for all the guests
+        self._client.get_power_states.assert_called_once_with(
+            ['USER1', 'user2'])
+        self.assertTrue(waiter1.done())
+        self.assertTrue(waiter1.wait(0))
+        self.assertFalse(waiter2.done())
+        self.assertTrue(waiter3.done())
+        self.assertFalse(waiter3.wait(0))
+        self.assertEqual([waiter2], self._poller._waiters)
+
+    def test_poll_backoff(self):
+        self._client.get_power_states.return_value = {'user1': 'on'}
+        self._waiter('user1')
+        with mock.patch.dict(CONF.zvm, {'power_poll_min_interval': 1,
+                                        'power_poll_max_interval': 5}):
+            self._poller._interval = 1
+            intervals = []
+            for i in range(4):
+                self._poller.poll(list(self._poller._waiters))
+                intervals.append(self._poller._interval)
+            self.assertEqual([2, 4, 5, 5], intervals)
+            self._client.get_power_states.return_value = {'user1': 'off'}
+            self._poller.poll(list(self._poller._waiters))
+            self.assertEqual(1, self._poller._interval)
+
+    def test_poll_query_one_by_one(self):
+        self._client.get_power_states.side_effect = (
+            exception.ZVMXCATInternalError(msg='fake'))
+        self._client.get_power_state.side_effect = [
+            'off', exception.ZVMXCATInternalError(msg='fake')]
+        waiter1 = self._waiter('user1')
+        waiter2 = self._waiter('user2')
+        self._poller.poll(list(self._poller._waiters))
+        self.assertTrue(waiter1.done())
+        self.assertIsNone(waiter1.error)
+        # the failed query finishes the waiter with its error
+        self.assertTrue(waiter2.done())
+        self.assertFalse(waiter2.wait(0))
+        self.assertIsInstance(waiter2.error,
+                              exception.ZVMXCATInternalError)
+
+    def test_poll_query_failed(self):
+        self._client.get_power_states.side_effect = (
+            exception.ZVMXCATInternalError(msg='fake'))
+        waiter = self._waiter('user1')
+        self._poller.poll(list(self._poller._waiters))
+        self.assertFalse(self._client.get_power_state.called)
+        self.assertTrue(waiter.done())
+        self.assertIsInstance(waiter.error, exception.ZVMXCATInternalError)
+
+    def test_watch(self):
+        self._client.get_power_states.return_value = {'user1': 'off'}
+        with mock.patch.dict(CONF.zvm, {'power_poll_min_interval': 0}):
+            waiter = self._poller.watch('user1', 'off', 60)
+            self.assertTrue(waiter.wait(5))
+
+    def test_watch_callback(self):
+        self._client.get_power_states.return_value = {'user1': 'on'}
+        called = []
+        with mock.patch.dict(CONF.zvm, {'power_poll_min_interval': 0}):
+            waiter = self._poller.watch('user1', 'on', 60,
+                                        callback=called.append)
+            self.assertTrue(waiter.wait(5))
+        self.assertEqual([waiter], called)
+        # called right away once done
+        waiter.add_done_callback(called.append)
+        self.assertEqual([waiter, waiter], called)
+
+    def test_get_power_states(self):
+        self._client.get_power_states.return_value = {'user1': 'on'}
+        with mock.patch.dict(CONF.zvm, {'power_poll_min_interval': 60}):
+            self.assertEqual({'user1': 'on'},
+                             self._poller.get_power_states(['user1', 'user2']))
+            # recent states are not queried again
+            self.assertEqual({'user1': 'on'},
+                             self._poller.get_power_states(['user1']))
+        self.assertEqual(1, self._client.get_power_states.call_count)
+
+    def test_query_power_states(self):
+        self._client.get_power_states.side_effect = (
+            exception.ZVMXCATInternalError(msg='fake'))
+        self._client.get_power_state.side_effect = [
+            'off', exception.ZVMXCATInternalError(msg='fake')]
+        with mock.patch.dict(CONF.zvm, {'power_poll_min_interval': 0}):
+            states, errors = self._poller.query_power_states(['user1',
+                                                              'user2'])
+        self.assertEqual({'user1': 'off'}, states)
+        self.assertEqual(['user2'], list(errors))
+        self.assertIsInstance(errors['user2'],
+                              exception.ZVMXCATInternalError)
@@ -0,0 +1,98 @@
+# Copyright 2017 IBM Corp.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import mock
+import time
+
+from zvmsdk import client as zvmclient
+from zvmsdk import tablecache
+from zvmsdk import utils as zvmutils
+from zvmsdk.tests.unit import base
+
+
+class SDKTableCacheTestCase(base.SDKTestCase):
+    def setUp(self):
+        super(SDKTableCacheTestCase, self).setUp()
+        self._cache = tablecache.XCATTableCache(ttl=60)
+        self._xcat_url = zvmutils.get_xcat_url()
+
+    def _fake_switch_table(self):
+        return {'data': [[
+            '#node,switch,port,vlan,interface,comments,disable',
+            '"node1","sw1","port1",,"1000","zhcp,comment",',
+            '"node1","sw2","port2",,"1003",,',
+            '"node2","sw1","port3",,"1000",,']]}
+
+    def test_table_parse_and_index(self):
+        table = tablecache.XCATTable(
+            'switch', self._fake_switch_table()['data'][0],
+            ('node', 'port'))
+        self.assertEqual(3, len(table.rows))
+        rows = table.lookup('node', 'node1')
+        self.assertEqual(['port1', 'port2'], [r['port'] for r in rows])
+        self.assertEqual('zhcp,comment', rows[0]['comments'])
+        self.assertIsNone(rows[1]['comments'])
+        self.assertEqual('node2', table.lookup('port', 'port3')[0]['node'])
+        # not indexed column
+        self.assertEqual(2, len(table.lookup('switch', 'sw1')))
+        self.assertEqual([], table.lookup('node', 'node3'))
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_get_table_cached(self, xrequest):
+        xrequest.return_value = self._fake_switch_table()
+        table1 = self._cache.get_table('switch')
+        table2 = self._cache.get_table('switch')
+        self.assertIs(table1, table2)
+        xrequest.assert_called_once_with('GET',
+                                         self._xcat_url.tabdump('/switch'),
+                                         coalesce=True)
+
+    @mock.patch.object(time, 'time')
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_get_table_expired(self, xrequest, fake_time):
+        xrequest.return_value = self._fake_switch_table()
+        fake_time.return_value = 1000
+        self._cache.get_table('switch')
+        fake_time.return_value = 1061
+        self._cache.get_table('switch')
+        self.assertEqual(2, xrequest.call_count)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_invalidate(self, xrequest):
+        xrequest.return_value = self._fake_switch_table()
+        self._cache.get_table('switch')
+        self._cache.invalidate('mac')
+        self._cache.get_table('switch')
+        self.assertEqual(1, xrequest.call_count)
+        self._cache.invalidate('switch')
+        self._cache.get_table('switch')
+        self.assertEqual(2, xrequest.call_count)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_lookup_reload_on_miss(self, xrequest):
+        new_table = self._fake_switch_table()
+        new_table['data'][0].append('"node3","sw1","port4",,"1000",,')
+        xrequest.side_effect = [self._fake_switch_table(), new_table]
+        rows = self._cache.lookup('switch', 'port', 'port4')
+        self.assertEqual('node3', rows[0]['node'])
+        self.assertEqual(2, xrequest.call_count)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_client_write_invalidates_table(self, xrequest):
+        client = zvmclient.XCATClient()
+        with mock.patch.object(client._table_cache,
+                               'invalidate') as invalidate:
+            client._add_switch_table_record('node1', 'port1', '1000')
+            invalidate.assert_called_once_with('switch')
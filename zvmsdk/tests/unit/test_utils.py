@@ -7,7 +7,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import atexit
+import errno
+import mock
+import socket
+import threading
+import time
+
+from six.moves import http_client as httplib
+
 import zvmsdk.utils as zvmutils
+from zvmsdk import exception
 from zvmsdk.tests.unit import base
 
 
@@ -16,3 +26,439 @@ class ZVMUtilsTestCases(base.SDKTestCase):
         self.assertEqual(2355.2, zvmutils.convert_to_mb('2.3G'))
         self.assertEqual(20, zvmutils.convert_to_mb('20M'))
         self.assertEqual(1153433.6, zvmutils.convert_to_mb('1.1T'))
+
+    def test_translate_xcat_resp(self):
+        rawdata = ('zhcp: Total: 406105.3 G\n'
+                   'zhcp: Used: 367262.6 G \n'
+                   'zhcp: nothing here\n'
+                   'zhcp: Free: 38842.7 G')
+        keywords = {'disk_total': 'Total:',
+                    'disk_used': 'Used:',
+                    'disk_available': 'Free:'}
+        self.assertEqual({'disk_total': '406105.3 G',
+                          'disk_used': '367262.6 G',
+                          'disk_available': '38842.7 G'},
+                         zvmutils.translate_xcat_resp(rawdata, keywords))
+
+    def test_translate_xcat_resp_keyword_variants(self):
+        rawdata = ('zhcp: Samples CPU in use: "1"\n'
+                   'zhcp: ,Samples CPU delay: "2"\n'
+                   'zhcp: Max memory: "3 KB"\n'
+                   'zhcp: Used memory: "4 KB" Max memory: "5 KB"')
+        keywords = {'samples_cpu_in_use': 'Samples CPU in use:',
+                    'samples_cpu_delay': ',Samples CPU delay:',
+                    'used_memory': 'Used memory:',
+                    'max_memory': ' Max memory:'}
+        data = zvmutils.translate_xcat_resp(rawdata, keywords)
+        self.assertEqual({'samples_cpu_in_use': '"1"',
+                          'samples_cpu_delay': '"2"',
+                          'max_memory': '"3 KB"',
+                          'used_memory': '"4 KB" Max memory: "5 KB"'}, data)
+        # the regex is compiled once per keywords
+        self.assertIn(tuple(sorted(keywords.items())),
+                      zvmutils._KEYWORD_PATTERNS)
+
+    def test_translate_xcat_resp_no_match(self):
+        self.assertRaises(exception.ZVMInvalidXCATResponseDataError,
+                          zvmutils.translate_xcat_resp,
+                          'zhcp: nothing', {'total': 'Total:'})
+
+    def test_run_pipeline(self):
+        done = []
+        lock = threading.Lock()
+
+        def _stage(name):
+            def _run(item):
+                if item == 'bad' and name == 'second':
+                    raise exception.ZVMException(msg='fake')
+                with lock:
+                    done.append((name, item))
+            return _run
+
+        stages = [('first', _stage('first'), 2),
+                  ('second', _stage('second'), 2),
+                  ('third', _stage('third'), 1)]
+        results = zvmutils.run_pipeline(['a', 'bad', 'b'], stages)
+
+        self.assertIsNone(results[0])
+        self.assertEqual('second', results[1][0])
+        self.assertIsInstance(results[1][1], exception.ZVMException)
+        self.assertIsNone(results[2])
+        self.assertEqual(7, len(done))
+        self.assertNotIn(('third', 'bad'), done)
+        for item in ('a', 'b'):
+            self.assertTrue(done.index(('first', item)) <
+                            done.index(('second', item)) <
+                            done.index(('third', item)))
+
+    @mock.patch.object(zvmutils, 'xdsh')
+    def test_xdsh_batch(self, xdsh):
+        xdsh.return_value = {'data': [[
+            'zhcp: out1\nzhcp: @@XDSH_RC@@ 0 0\n'
+            'zhcp: out2\nzhcp: more\nzhcp: @@XDSH_RC@@ 1 0']]}
+        outputs = zvmutils.xdsh_batch('zhcp', ['cmd1', 'cmd2 -a'])
+        self.assertEqual(['out1', 'out2\nmore'], outputs)
+        script = xdsh.call_args[0][1]
+        self.assertTrue(script.startswith(
+            'cmd1 2>&1; rc=$?; echo "@@XDSH_RC@@ 0 $rc"; '
+            '[ $rc -eq 0 ] || exit 0; cmd2 -a 2>&1;'))
+
+    @mock.patch.object(zvmutils, 'xdsh')
+    def test_xdsh_batch_stop_on_error(self, xdsh):
+        xdsh.return_value = {'data': [[
+            'zhcp: Failed\nzhcp: @@XDSH_RC@@ 0 8']]}
+        self.assertRaisesRegexp(exception.ZVMXCATInternalError,
+                                '"cmd1" failed with 8: Failed',
+                                zvmutils.xdsh_batch, 'zhcp',
+                                ['cmd1', 'cmd2'])
+
+    @mock.patch.object(zvmutils, 'xdsh')
+    def test_xdsh_batch_not_all_run(self, xdsh):
+        xdsh.return_value = {'data': [['zhcp: @@XDSH_RC@@ 0 0']]}
+        self.assertRaisesRegexp(exception.ZVMXCATInternalError,
+                                '"cmd2" was not run',
+                                zvmutils.xdsh_batch, 'zhcp',
+                                ['cmd1', 'cmd2'], stop_on_error=False)
+
+    def test_run_pipeline_base_exception(self):
+        def _interrupted(item):
+            if item == 'bad':
+                raise KeyboardInterrupt()
+
+        results = zvmutils.run_pipeline(['a', 'bad'],
+                                        [('first', _interrupted, 2),
+                                         ('second', lambda item: None, 1)])
+        self.assertIsNone(results[0])
+        self.assertEqual('first', results[1][0])
+        self.assertIsInstance(results[1][1], KeyboardInterrupt)
+
+    def test_run_pipeline_no_item(self):
+        self.assertEqual([], zvmutils.run_pipeline([], [('s', None, 1)]))
+
+
+class XCATConnectionPoolTestCases(base.SDKTestCase):
+    def setUp(self):
+        super(XCATConnectionPoolTestCases, self).setUp()
+        self._pool = zvmutils.XCATConnectionPool('fakehost', 443, None,
+                                                 pool_size=2,
+                                                 idle_timeout=60)
+
+    @mock.patch.object(zvmutils, 'HTTPSClientAuthConnection')
+    def test_connection_reused(self, conn_cls):
+        conn_cls.return_value = mock.Mock(sock=None)
+        with self._pool.connection() as conn1:
+            pass
+        with self._pool.connection() as conn2:
+            pass
+        self.assertIs(conn1, conn2)
+        conn_cls.assert_called_once_with('fakehost', 443, None,
+                                         timeout=None)
+
+    @mock.patch.object(zvmutils, 'HTTPSClientAuthConnection')
+    def test_connection_discarded_on_error(self, conn_cls):
+        conn = mock.Mock(sock=None)
+        conn_cls.return_value = conn
+
+        def _use_conn():
+            with self._pool.connection():
+                raise exception.ZVMXCATRequestFailed(msg='fake')
+
+        self.assertRaises(exception.ZVMXCATRequestFailed, _use_conn)
+        conn.close.assert_called_once_with()
+        self.assertEqual(0, len(self._pool._idle))
+
+    @mock.patch.object(time, 'time')
+    @mock.patch.object(zvmutils, 'HTTPSClientAuthConnection')
+    def test_idle_connection_evicted(self, conn_cls, fake_time):
+        old_conn = mock.Mock(sock=None)
+        new_conn = mock.Mock(sock=None)
+        conn_cls.side_effect = [old_conn, new_conn]
+        fake_time.return_value = 1000
+        self._pool.put(self._pool.get())
+        fake_time.return_value = 1061
+        self.assertIs(new_conn, self._pool.get())
+        old_conn.close.assert_called_once_with()
+
+    @mock.patch('select.select')
+    @mock.patch.object(zvmutils, 'HTTPSClientAuthConnection')
+    def test_broken_connection_evicted(self, conn_cls, fake_select):
+        broken_conn = mock.Mock(sock='fakesock')
+        new_conn = mock.Mock(sock=None)
+        conn_cls.side_effect = [broken_conn, new_conn]
+        # closed by peer, idle socket becomes readable
+        fake_select.return_value = (['fakesock'], [], [])
+        self._pool.put(self._pool.get())
+        self.assertIs(new_conn, self._pool.get())
+        broken_conn.close.assert_called_once_with()
+
+    @mock.patch.object(zvmutils, 'HTTPSClientAuthConnection')
+    def test_pool_bounded(self, conn_cls):
+        conn_cls.side_effect = lambda *args, **kwargs: mock.Mock(sock=None)
+        self._pool.get()
+        self._pool.get()
+        self.assertFalse(self._pool._slots.acquire(False))
+
+
+class XCATConnectionTestCases(base.SDKTestCase):
+    def _fake_response(self):
+        res = mock.Mock(status=200, reason='OK')
+        res.read.return_value = '{"data": []}'
+        return res
+
+    def test_request_reconnect_on_broken_pipe(self):
+        conn = mock.Mock(sock='fakesock')
+        conn.request.side_effect = [socket.error(errno.EPIPE, 'Broken pipe'),
+                                    None]
+        conn.getresponse.return_value = self._fake_response()
+        resp = zvmutils.XCATConnection(conn).request('GET', '/fakeurl')
+        self.assertEqual(200, resp['status'])
+        self.assertEqual(2, conn.request.call_count)
+        conn.close.assert_called_once_with()
+
+    def test_request_reconnect_on_bad_status_line(self):
+        conn = mock.Mock(sock='fakesock')
+        conn.getresponse.side_effect = [httplib.BadStatusLine("''"),
+                                        self._fake_response()]
+        resp = zvmutils.XCATConnection(conn).request('GET', '/fakeurl')
+        self.assertEqual(200, resp['status'])
+        self.assertEqual(2, conn.request.call_count)
+
+    def test_request_reconnect_post_not_sent(self):
+        conn = mock.Mock(sock='fakesock')
+        conn.request.side_effect = [socket.error(errno.ECONNRESET, 'reset'),
+                                    None]
+        conn.getresponse.return_value = self._fake_response()
+        conn.getresponse.return_value.status = 201
+        resp = zvmutils.XCATConnection(conn).request('POST', '/fakeurl')
+        self.assertEqual(201, resp['status'])
+        self.assertEqual(2, conn.request.call_count)
+
+    def test_request_no_retry_post_sent(self):
+        conn = mock.Mock(sock='fakesock')
+        conn.getresponse.side_effect = socket.error(errno.ECONNRESET, 'reset')
+        for method in ('POST', 'PUT', 'DELETE'):
+            conn.request.reset_mock()
+            self.assertRaises(exception.ZVMXCATRequestFailed,
+                              zvmutils.XCATConnection(conn).request,
+                              method, '/fakeurl')
+            conn.request.assert_called_once_with(method, '/fakeurl',
+                                                 None, {})
+
+    def test_request_no_retry_on_new_connection(self):
+        conn = mock.Mock(sock=None)
+        conn.request.side_effect = socket.error(errno.ECONNRESET, 'reset')
+        self.assertRaises(exception.ZVMXCATRequestFailed,
+                          zvmutils.XCATConnection(conn).request,
+                          'GET', '/fakeurl')
+        conn.request.assert_called_once_with('GET', '/fakeurl', None, {})
+
+    @mock.patch.object(zvmutils, 'get_xcat_conn_pool')
+    def test_xcat_request_use_pool(self, get_pool):
+        conn = mock.Mock(sock=None)
+        conn.getresponse.return_value = self._fake_response()
+        get_pool.return_value.connection.return_value.__enter__ = \
+            mock.Mock(return_value=conn)
+        get_pool.return_value.connection.return_value.__exit__ = \
+            mock.Mock(return_value=False)
+        zvmutils.xcat_request('GET', '/fakeurl')
+        conn.request.assert_called_once_with('GET', '/fakeurl', None, {})
+
+
+class HTTPSClientAuthConnectionTestCases(base.SDKTestCase):
+    def setUp(self):
+        super(HTTPSClientAuthConnectionTestCases, self).setUp()
+        zvmutils._SSL_CONTEXTS.clear()
+
+    @mock.patch('ssl.SSLContext')
+    def test_get_ssl_context_cached(self, ssl_context):
+        ctx1 = zvmutils.get_ssl_context('/fake/ca')
+        ctx2 = zvmutils.get_ssl_context('/fake/ca')
+        self.assertIs(ctx1, ctx2)
+        ssl_context.assert_called_once_with(mock.ANY)
+        ctx1.load_verify_locations.assert_called_once_with('/fake/ca')
+        zvmutils.get_ssl_context(None)
+        self.assertEqual(2, ssl_context.call_count)
+
+    @mock.patch.object(zvmutils, 'get_ssl_context')
+    @mock.patch('socket.create_connection')
+    def test_connect_shared_context(self, create_conn, get_ctx):
+        context = get_ctx.return_value
+        for i in range(2):
+            conn = zvmutils.HTTPSClientAuthConnection('fakehost', 443, None)
+            conn.connect()
+            self.assertIs(context.wrap_socket.return_value, conn.sock)
+        context.wrap_socket.assert_called_with(create_conn.return_value)
+        self.assertEqual(2, context.wrap_socket.call_count)
+        get_ctx.assert_called_with(None, None, None)
+
+
+class SingleFlightTestCases(base.SDKTestCase):
+    def setUp(self):
+        super(SingleFlightTestCases, self).setUp()
+        self._flight = zvmutils.SingleFlight()
+        self._started = threading.Event()
+        self._release = threading.Event()
+
+    def _slow_call(self, result):
+        self._started.set()
+        self._release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _wait_for_waiters(self, key, num):
+        for i in range(500):
+            call = self._flight._calls.get(key)
+            if call is not None and call.waiters == num:
+                return
+            time.sleep(0.01)
+        self.fail("waiters never joined the in-flight call")
+
+    def _run_concurrently(self, func, num):
+        results = []
+
+        def _call():
+            try:
+                results.append(self._flight.do('key', func))
+            except Exception as err:
+                results.append(err)
+
+        threads = [threading.Thread(target=_call) for i in range(num)]
+        threads[0].start()
+        self._started.wait(5)
+        for t in threads[1:]:
+            t.start()
+        self._wait_for_waiters('key', num - 1)
+        self._release.set()
+        for t in threads:
+            t.join(5)
+        return results
+
+    def test_concurrent_calls_share_result(self):
+        func = mock.Mock(side_effect=lambda: self._slow_call({'data': [1]}))
+        results = self._run_concurrently(func, 3)
+        func.assert_called_once_with()
+        self.assertEqual([{'data': [1]}] * 3, results)
+        # each caller gets its own copy
+        self.assertIsNot(results[0], results[1])
+        self.assertIsNot(results[1], results[2])
+        self.assertEqual({}, self._flight._calls)
+
+    def test_concurrent_calls_share_error(self):
+        error = exception.ZVMXCATRequestFailed(xcatserver='xcat',
+                                               msg='failed')
+        func = mock.Mock(side_effect=lambda: self._slow_call(error))
+        results = self._run_concurrently(func, 2)
+        func.assert_called_once_with()
+        self.assertEqual([error, error], results)
+        self.assertEqual({}, self._flight._calls)
+
+    def test_sequential_calls_not_cached(self):
+        func = mock.Mock(return_value='result')
+        self._flight.do('key', func)
+        self._flight.do('key', func)
+        self.assertEqual(2, func.call_count)
+
+    def test_fence(self):
+        results = []
+        leader = threading.Thread(target=lambda: results.append(
+            self._flight.do('key', lambda: self._slow_call('old'))))
+        leader.start()
+        self._started.wait(5)
+        self._flight.fence()
+        # a caller after the fence doesn't join the running call
+        func = mock.Mock(return_value='new')
+        self.assertEqual('new', self._flight.do('key', func))
+        self._release.set()
+        leader.join(5)
+        self.assertEqual(['old'], results)
+        self.assertEqual({}, self._flight._calls)
+
+    @mock.patch.object(zvmutils, '_xcat_request')
+    def test_xcat_request_get_coalesced(self, xrequest):
+        xrequest.return_value = {'data': []}
+        with mock.patch.object(zvmutils._GET_SINGLE_FLIGHT, 'do') as do:
+            zvmutils.xcat_request('GET', '/url', ['stat'], coalesce=True)
+            do.assert_called_once_with(('/url', '["stat"]', 'null',
+                                        id(None)),
+                                       zvmutils._xcat_request, 'GET',
+                                       '/url', ['stat'], None, None)
+            # not coalesced unless asked
+            zvmutils.xcat_request('GET', '/url', ['stat'])
+            do.assert_called_once()
+        xrequest.assert_called_once_with('GET', '/url', ['stat'], None, None)
+
+    @mock.patch.object(zvmutils, '_xcat_request')
+    def test_xcat_request_write_fences(self, xrequest):
+        with mock.patch.object(zvmutils._GET_SINGLE_FLIGHT, 'fence') as fence:
+            zvmutils.xcat_request('GET', '/url')
+            self.assertFalse(fence.called)
+            xrequest.side_effect = exception.ZVMXCATRequestFailed(msg='fake')
+            self.assertRaises(exception.ZVMXCATRequestFailed,
+                              zvmutils.xcat_request, 'PUT', '/url', ['on'])
+            fence.assert_called_once_with()
+
+
+class DebouncerTestCases(base.SDKTestCase):
+    def setUp(self):
+        super(DebouncerTestCases, self).setUp()
+        self._ran = threading.Event()
+        self._func = mock.Mock(side_effect=self._ran.set, __name__='func')
+
+    def test_requests_coalesced(self):
+        debouncer = zvmutils.Debouncer(self._func, 0.05)
+        for i in range(5):
+            debouncer.request()
+        self.assertTrue(self._ran.wait(5))
+        time.sleep(0.1)
+        self._func.assert_called_once_with()
+
+    def test_flush(self):
+        debouncer = zvmutils.Debouncer(self._func, 3600)
+        self.assertFalse(debouncer.flush())
+        debouncer.request()
+        debouncer.request()
+        self.assertTrue(debouncer.flush())
+        self.assertFalse(debouncer.flush())
+        self._func.assert_called_once_with()
+        self.assertIsNone(debouncer._timer)
+
+    def test_flush_failed(self):
+        self._func.side_effect = exception.ZVMNetworkError(msg='fake')
+        debouncer = zvmutils.Debouncer(self._func, 3600)
+        debouncer.request()
+        self.assertRaises(exception.ZVMNetworkError, debouncer.flush)
+        # still pending
+        self._func.side_effect = None
+        self.assertTrue(debouncer.flush())
+
+    def test_delayed_failure_reported(self):
+        self._func.side_effect = exception.ZVMNetworkError(msg='fake')
+        debouncer = zvmutils.Debouncer(self._func, 3600)
+        debouncer.request()
+        debouncer._timer.cancel()
+        debouncer._expire()
+        self.assertIsInstance(debouncer.last_error, exception.ZVMNetworkError)
+        # the next request runs it now and raises if it fails again
+        self.assertRaises(exception.ZVMNetworkError, debouncer.request)
+        self.assertIsNone(debouncer._timer)
+        self._func.side_effect = None
+        debouncer.request()
+        self.assertIsNone(debouncer.last_error)
+        self.assertEqual(3, self._func.call_count)
+
+    @mock.patch.object(atexit, 'register')
+    def test_flush_at_exit(self, register):
+        debouncer = zvmutils.Debouncer(self._func, 3600)
+        debouncer.request()
+        debouncer.request()
+        register.assert_called_once_with(debouncer._flush_at_exit)
+        debouncer._timer.cancel()
+        debouncer._flush_at_exit()
+        self._func.assert_called_once_with()
+
+    def test_no_window(self):
+        debouncer = zvmutils.Debouncer(self._func, 0)
+        debouncer.request()
+        debouncer.request()
+        self.assertEqual(2, self._func.call_count)
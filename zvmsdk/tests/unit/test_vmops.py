@@ -19,6 +19,8 @@ import zvmsdk.utils as zvmutils
 
 from zvmsdk.config import CONF
 from zvmsdk import exception
+from zvmsdk import imagestore
+from zvmsdk import powerstate
 from zvmsdk import vmops
 from zvmsdk.tests.unit import base
 
@@ -28,6 +30,10 @@ class SDKVMOpsTestCase(base.SDKTestCase):
         super(SDKVMOpsTestCase, self).setUp()
         self.vmops = vmops.get_vmops()
         self.xcat_url = zvmutils.get_xcat_url()
+        self._store = imagestore.ImageStore(':memory:')
+        patcher = mock.patch.object(imagestore, '_IMAGE_STORE', self._store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_get_power_state(self, xrequest):
@@ -38,6 +44,11 @@ class SDKVMOpsTestCase(base.SDKTestCase):
         self.vmops.get_power_state('cbi00063')
         xrequest.assert_called_with('GET', url, body)
 
+    @mock.patch.object(zvmclient.XCATClient, 'get_power_states')
+    def test_get_power_states(self, get_power_states):
+        self.vmops.get_power_states(['cbi00063', 'cbi00064'])
+        get_power_states.assert_called_once_with(['cbi00063', 'cbi00064'])
+
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_is_reachable(self, xrequest):
         xrequest.return_value = {
@@ -64,6 +75,34 @@ class SDKVMOpsTestCase(base.SDKTestCase):
         create_vm.assert_called_once_with(userid, cpu, memory, disk_list,
                                           user_profile)
 
+    @mock.patch('zvmsdk.client.XCATClient.create_vms')
+    def test_create_vms(self, create_vms):
+        create_vms.return_value = [
+            None, ('add_disks', exception.ZVMException(msg='fake'))]
+        specs = [{'userid': 'user1', 'vcpus': 1, 'memory': 1024},
+                 {'userid': 'user2', 'vcpus': 2, 'memory': 2048,
+                  'disk_list': [{'size': '1g'}], 'user_profile': 'prof'}]
+        results = self.vmops.create_vms(specs)
+        create_vms.assert_called_once_with([
+            {'userid': 'user1', 'cpu': 1, 'memory': 1024, 'disk_list': [],
+             'profile': CONF.zvm.user_profile},
+            {'userid': 'user2', 'cpu': 2, 'memory': 2048,
+             'disk_list': [{'size': '1g'}], 'profile': 'prof'}])
+        self.assertEqual({'created': True}, results['user1'])
+        self.assertEqual({'created': False, 'stage': 'add_disks',
+                          'error': 'ZVMException happened: fake'},
+                         results['user2'])
+
+    @mock.patch('zvmsdk.client.XCATClient.delete_vms')
+    def test_delete_vms(self, delete_vms):
+        delete_vms.return_value = [None, exception.ZVMException(msg='fake')]
+        results = self.vmops.delete_vms(['user1', 'user2'])
+        delete_vms.assert_called_once_with(['user1', 'user2'])
+        self.assertEqual({'user1': {'deleted': True},
+                          'user2': {'deleted': False,
+                                    'error': 'ZVMException happened: fake'}},
+                         results)
+
     @mock.patch('zvmsdk.client.XCATClient.process_additional_minidisks')
     def test_guest_config_minidisks(self, process_additional_minidisks):
         userid = 'userid'
@@ -73,11 +112,21 @@ class SDKVMOpsTestCase(base.SDKTestCase):
         self.vmops.guest_config_minidisks(userid, disk_list)
         process_additional_minidisks.assert_called_once_with(userid, disk_list)
 
-    @mock.patch('zvmsdk.client.XCATClient.get_power_state')
-    def test_is_powered_off(self, check_stat):
-        check_stat.return_value = 'off'
+    @mock.patch.object(powerstate.PowerStatePoller, 'get_power_states')
+    def test_is_powered_off(self, get_power_states):
+        get_power_states.return_value = {'cbi00063': 'off'}
         ret = self.vmops.is_powered_off('cbi00063')
         self.assertEqual(True, ret)
+        get_power_states.assert_called_once_with(['cbi00063'])
+
+    @mock.patch('zvmsdk.client.XCATClient.get_power_state')
+    @mock.patch.object(powerstate.PowerStatePoller, 'get_power_states')
+    def test_is_powered_off_unknown(self, get_power_states, check_stat):
+        get_power_states.return_value = {}
+        check_stat.side_effect = exception.ZVMVirtualMachineNotExist(
+            msg='fake')
+        self.assertRaises(exception.ZVMVirtualMachineNotExist,
+                          self.vmops.is_powered_off, 'cbi00063')
 
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_capture_instance(self, xrequest):
@@ -105,6 +154,29 @@ class SDKVMOpsTestCase(base.SDKTestCase):
 
         xrequest.assert_called_with('DELETE', url)
 
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_delete_image_alias(self, xrequest):
+        self._store.add('digest1', 'rhel7.2-s390x-netboot-img1')
+        self._store.add_alias('rhel7.2-s390x-netboot-img2', 'digest1')
+        self.vmops.delete_image('rhel7.2-s390x-netboot-img2')
+
+        self.assertFalse(xrequest.called)
+        self.assertEqual('rhel7.2-s390x-netboot-img1',
+                         self._store.lookup('digest1'))
+        self.assertEqual('rhel7.2-s390x-netboot-img2',
+                         self._store.resolve('rhel7.2-s390x-netboot-img2'))
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_delete_image_with_aliases(self, xrequest):
+        self._store.add('digest1', 'rhel7.2-s390x-netboot-img1')
+        self._store.add_alias('rhel7.2-s390x-netboot-img2', 'digest1')
+        self.assertRaises(exception.ZVMImageError, self.vmops.delete_image,
+                          'rhel7.2-s390x-netboot-img1')
+
+        self.assertFalse(xrequest.called)
+        self.assertEqual('rhel7.2-s390x-netboot-img1',
+                         self._store.resolve('rhel7.2-s390x-netboot-img2'))
+
     @mock.patch('zvmsdk.client.XCATClient.get_image_performance_info')
     @mock.patch('zvmsdk.vmops.VMOps.get_power_state')
     def test_get_info(self, gps, gipi):
@@ -173,6 +245,15 @@ class SDKVMOpsTestCase(base.SDKTestCase):
         deploy_image_to_vm.assert_called_with('fakevm', 'fakeimg',
                                               '/test/transport.tgz', None)
 
+    @mock.patch('zvmsdk.client.XCATClient.guest_deploy')
+    def test_guest_deploy_alias(self, deploy_image_to_vm):
+        self._store.add('digest1', 'rhel7.2-s390x-netboot-img1')
+        self._store.add_alias('rhel7.2-s390x-netboot-img2', 'digest1')
+        self.vmops.guest_deploy('fakevm', 'rhel7.2-s390x-netboot-img2')
+        deploy_image_to_vm.assert_called_with('fakevm',
+                                              'rhel7.2-s390x-netboot-img1',
+                                              None, None)
+
     @mock.patch.object(zvmclient.XCATClient, 'get_user_direct')
     def test_get_definition_info(self, get_user_direct):
         get_user_direct.return_value = [
@@ -188,25 +269,55 @@ class SDKVMOpsTestCase(base.SDKTestCase):
         self.vmops.delete_vm(userid)
         delete_vm.assert_called_once_with(userid)
 
+    @mock.patch.object(powerstate.PowerStatePoller, 'watch')
     @mock.patch.object(zvmclient.XCATClient, 'guest_stop')
-    def test_guest_stop(self, gs):
+    def test_guest_stop(self, gs, watch):
         userid = 'userid'
         self.vmops.guest_stop(userid, 0, 10)
         gs.assert_called_once_with(userid)
+        self.assertFalse(watch.called)
 
-    @mock.patch.object(zvmclient.XCATClient, 'get_power_state')
+    @mock.patch.object(powerstate.PowerStatePoller, 'watch')
     @mock.patch.object(zvmclient.XCATClient, 'guest_stop')
-    def test_guest_stop_with_retry(self, gs, gps):
+    def test_guest_stop_with_timeout(self, gs, watch):
         userid = 'userid'
-        gps.return_value = u'off'
+        waiter = watch.return_value
+        waiter.wait.return_value = True
+        waiter.error = None
+        waiter.reached = True
         self.vmops.guest_stop(userid, 60, 10)
         gs.assert_called_once_with(userid)
-        gps.assert_called_once_with(userid)
+        watch.assert_called_once_with(userid, 'off', 60)
+        waiter.wait.assert_called_once_with(60)
 
-    @mock.patch.object(zvmclient.XCATClient, 'get_power_state')
+    @mock.patch.object(powerstate.PowerStatePoller, 'watch')
     @mock.patch.object(zvmclient.XCATClient, 'guest_stop')
-    def test_guest_stop_timeout(self, gs, gps):
+    def test_guest_stop_timeout(self, gs, watch):
         userid = 'userid'
-        gps.return_value = u'on'
-        self.vmops.guest_stop(userid, 1, 1)
-        gps.assert_called_once_with(userid)
+        waiter = watch.return_value
+        waiter.wait.return_value = False
+        waiter.error = None
+        waiter.reached = False
+        self.vmops.guest_stop(userid, 60, 10)
+        # not signaled again before the timeout
+        gs.assert_called_once_with(userid)
+        waiter.wait.assert_called_once_with(60)
+
+    @mock.patch.object(powerstate.PowerStatePoller, 'watch')
+    @mock.patch.object(zvmclient.XCATClient, 'guest_stop')
+    def test_guest_stop_query_failed(self, gs, watch):
+        waiter = watch.return_value
+        waiter.wait.return_value = True
+        waiter.error = exception.ZVMXCATInternalError(msg='fake')
+        waiter.reached = False
+        self.assertRaises(exception.ZVMXCATInternalError,
+                          self.vmops.guest_stop, 'userid', 60, 10)
+        gs.assert_called_once_with('userid')
+
+    @mock.patch.object(powerstate.PowerStatePoller, 'watch')
+    @mock.patch.object(zvmclient.XCATClient, 'guest_stop')
+    def test_guest_stop_async(self, gs, watch):
+        waiter = self.vmops.guest_stop_async('userid', 60)
+        gs.assert_called_once_with('userid')
+        watch.assert_called_once_with('userid', 'off', 60)
+        self.assertIs(watch.return_value, waiter)
@@ -17,12 +17,17 @@ import mock
 import os
 import shutil
 import tarfile
+import tempfile
 import xml
 
 
 from zvmsdk import client as zvmclient
 from zvmsdk import constants as const
+from zvmsdk import dirmaint
 from zvmsdk import exception
+from zvmsdk import imagebundle
+from zvmsdk import inventory
+from zvmsdk import tablecache
 from zvmsdk import utils as zvmutils
 from zvmsdk import config
 from zvmsdk.tests.unit import base
@@ -35,10 +40,14 @@ class SDKZVMClientTestCase(base.SDKTestCase):
         super(SDKZVMClientTestCase, self).setUp()
         self._zvmclient = zvmclient.get_zvmclient()
         self._xcat_url = zvmutils.get_xcat_url()
+        tablecache.get_table_cache().invalidate()
+        zvmclient.get_identity_cache().invalidate()
+        inventory.get_inventory().clear()
 
     def test_get_zvmclient(self):
         if CONF.zvm.client_type == 'xcat':
             self.assertTrue(isinstance(self._zvmclient, zvmclient.XCATClient))
+            self.assertIs(self._zvmclient, zvmclient.get_zvmclient())
 
 
 class SDKXCATCientTestCases(SDKZVMClientTestCase):
@@ -80,6 +89,49 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         power_state.assert_called_once_with(fake_userid, 'GET', 'stat')
         self.assertEqual('on', ret)
 
+    @mock.patch.object(zvmclient.XCATClient, '_power_state')
+    def test_get_power_states(self, power_state):
+        power_state.return_value = {'info': [['user1: on',
+                                              'USER2: off']],
+                                    'node': [],
+                                    'errocode': [],
+                                    'data': []}
+        ret = self._zvmclient.get_power_states(['USER1', 'user2'])
+
+        power_state.assert_called_once_with('USER1,user2', 'GET', 'stat')
+        self.assertEqual({'USER1': 'on', 'user2': 'off'}, ret)
+
+    @mock.patch.object(const, 'XCAT_NODERANGE_MAX_LEN', 12)
+    @mock.patch.object(zvmclient.XCATClient, '_power_state')
+    def test_get_power_states_split_noderange(self, power_state):
+        power_state.side_effect = [{'info': [['user1: on\nuser2: on']]},
+                                   {'info': [['user3: off']]}]
+        ret = self._zvmclient.get_power_states(['user1', 'user2', 'user3'])
+
+        power_state.assert_has_calls([mock.call('user1,user2', 'GET', 'stat'),
+                                      mock.call('user3', 'GET', 'stat')])
+        self.assertEqual({'user1': 'on', 'user2': 'on', 'user3': 'off'}, ret)
+
+    @mock.patch.object(zvmclient.XCATClient, '_power_state')
+    def test_get_power_states_unknown_guest(self, power_state):
+        not_exist = exception.ZVMVirtualMachineNotExist(zvm_host='fakehost',
+                                                        userid='user2')
+
+        def _fake_power_state(noderange, method, state):
+            if 'user2' in noderange:
+                raise not_exist
+            return {'info': [['%s: on' % noderange]]}
+
+        power_state.side_effect = _fake_power_state
+        ret = self._zvmclient.get_power_states(['user1', 'user2', 'user3'])
+
+        power_state.assert_has_calls([
+            mock.call('user1,user2,user3', 'GET', 'stat'),
+            mock.call('user1', 'GET', 'stat'),
+            mock.call('user2', 'GET', 'stat'),
+            mock.call('user3', 'GET', 'stat')])
+        self.assertEqual({'user1': 'on', 'user3': 'on'}, ret)
+
     def _fake_host_rinv_info(self):
         fake_host_rinv_info = ["fakenode: z/VM Host: FAKENODE\n"
                                "fakenode: zHCP: fakehcp.fake.com\n"
@@ -113,12 +165,13 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         _construct_zhcp_info.return_value = fake_zhcp_info
         host_info = self._zvmclient.get_host_info()
         self.assertEqual(host_info['zvm_host'], "FAKENODE")
-        self.assertEqual(self._zvmclient._zhcp_info, fake_zhcp_info)
+        self.assertEqual(zvmclient.get_identity_cache().peek('zhcp_info'),
+                         fake_zhcp_info)
         url = "/xcatws/nodes/" + CONF.zvm.host +\
                 "/inventory?userName=" + CONF.xcat.username +\
                 "&password=" + CONF.xcat.password +\
                 "&format=json"
-        xrequest.assert_called_once_with('GET', url)
+        xrequest.assert_called_once_with('GET', url, coalesce=True)
         _construct_zhcp_info.assert_called_once_with("fakehcp.fake.com")
 
     @mock.patch.object(zvmutils, 'xcat_request')
@@ -174,7 +227,7 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         url = "/xcatws/tables/zvm?userName=" +\
                 CONF.xcat.username + "&password=" +\
                 CONF.xcat.password + "&format=json"
-        xrequest.assert_called_once_with("GET", url)
+        xrequest.assert_called_once_with("GET", url, coalesce=True)
 
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_delete_mac(self, xrequest):
@@ -291,6 +344,40 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         self.assertEqual(pi_info['FAKEVM']['userid'], "FAKEVM")
         self.assertEqual(pi_info['FAKEVM']['max_memory'], "8388608 KB")
 
+    @mock.patch.object(zvmclient.XCATClient, '_image_performance_query')
+    def test_image_performance_query_chunked(self, query):
+        query.side_effect = lambda uids: dict((u.upper(), {'userid': u})
+                                              for u in uids)
+        uids = ['user%d' % i for i in range(5)]
+        with mock.patch.dict(CONF.monitor, {'perf_query_chunk_size': 2}):
+            pi_info = self._zvmclient.image_performance_query(uids)
+        self.assertEqual(3, query.call_count)
+        query.assert_any_call(['user0', 'user1'])
+        query.assert_any_call(['user4'])
+        self.assertEqual(sorted(u.upper() for u in uids),
+                         sorted(pi_info.keys()))
+
+    @mock.patch.object(zvmclient.XCATClient, '_image_performance_query')
+    def test_image_performance_query_chunk_failed(self, query):
+        def _query(uids):
+            if 'user2' in uids:
+                raise exception.ZVMXCATInternalError(msg='fake')
+            return dict((u.upper(), {'userid': u}) for u in uids)
+
+        query.side_effect = _query
+        uids = ['user%d' % i for i in range(4)]
+        with mock.patch.dict(CONF.monitor, {'perf_query_chunk_size': 2}):
+            pi_info = self._zvmclient.image_performance_query(uids)
+        self.assertEqual(['USER0', 'USER1'], sorted(pi_info.keys()))
+
+    @mock.patch.object(zvmclient.XCATClient, '_image_performance_query')
+    def test_image_performance_query_all_chunks_failed(self, query):
+        query.side_effect = exception.ZVMXCATInternalError(msg='fake')
+        with mock.patch.dict(CONF.monitor, {'perf_query_chunk_size': 1}):
+            self.assertRaises(exception.ZVMXCATInternalError,
+                              self._zvmclient.image_performance_query,
+                              ['user1', 'user2'])
+
     @mock.patch('zvmsdk.utils.xdsh')
     def test_image_performance_query_multiple(self, dsh):
         dsh.return_value = {
@@ -393,9 +480,9 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_create_nic(self, xrequest, _delete_mac,
                          _add_mac, _add_switch):
-        self._zvmclient._create_nic("fakenode", "fake_nic",
-                                    "00:00:00:12:34:56", "fake_vdev",
-                                    "fakehcp")
+        self._zvmclient._create_nics("fakenode", [("fake_nic",
+                                     "00:00:00:12:34:56", "fake_vdev")],
+                                     "fakehcp")
         _delete_mac.assert_called_once_with("fakenode")
         _add_mac.assert_called_once_with("fakenode", "fake_vdev",
                                          "00:00:00:12:34:56", "fakehcp")
@@ -411,6 +498,35 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
 
         xrequest.assert_called_once_with("PUT", url, body)
 
+    @mock.patch.object(zvmclient.XCATClient, '_add_switch_table_record')
+    @mock.patch.object(zvmclient.XCATClient, '_add_mac_table_record')
+    @mock.patch.object(zvmclient.XCATClient, '_delete_mac')
+    @mock.patch.object(zvmclient.XCATClient, '_get_hcp_info')
+    @mock.patch.object(zvmclient.XCATClient, '_preset_vm_network')
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_create_nic_multiple(self, xrequest, preset, get_hcp_info,
+                                 _delete_mac, _add_mac, _add_switch):
+        get_hcp_info.return_value = {'nodename': 'fakehcp'}
+        nic_info = [{'nic_id': 'nic1', 'mac_addr': '00:00:00:12:34:56'},
+                    {'nic_id': 'nic2', 'mac_addr': '00:00:00:ab:cd:ef'}]
+        with mock.patch.dict(CONF.zvm, {'default_nic_vdev': '1000'}):
+            self._zvmclient.create_nic("fakenode", nic_info,
+                                       ip_addr="fakeip")
+
+        _delete_mac.assert_called_once_with("fakenode")
+        _add_mac.assert_called_once_with(
+            "fakenode", "1000",
+            "00:00:00:12:34:56!fakenode|00:00:00:ab:cd:ef!fakenode-1003",
+            "fakehcp")
+        _add_switch.assert_any_call("fakenode", "nic1", "1000", "fakehcp")
+        _add_switch.assert_any_call("fakenode", "nic2", "1003", "fakehcp")
+        commands = ' '.join((
+            'Image_Definition_Update_DM -T %userid%',
+            '-k \'NICDEF=VDEV=1000 TYPE=QDIO MACID=123456\'',
+            '-k \'NICDEF=VDEV=1003 TYPE=QDIO MACID=abcdef\''))
+        xrequest.assert_called_once_with(
+            "PUT", self._xcat_url.chvm('/fakenode'), ['--smcli', commands])
+
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_add_mac_table_record(self, xrequest):
         xrequest.return_value = {"data": ["fakereturn"]}
@@ -498,6 +614,21 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
              'osimage=sles12-s390x-netboot-0a0c576a_157f_42c8_2a254d8b77fc',
              'transport=/tmp/transport.tgz'])
 
+    @mock.patch.object(zvmutils, 'xcat_request')
+    @mock.patch.object(zvmclient.XCATClient, '_makehost')
+    @mock.patch.object(zvmclient.XCATClient, '_update_vm_info')
+    def test_guest_deploy_flushes_makehosts(self, _update_vm_info, makehost,
+                                            xrequest):
+        calls = []
+        makehost.side_effect = lambda: calls.append('makehosts')
+        xrequest.side_effect = lambda *args: calls.append(args[0])
+        client = zvmclient.XCATClient()
+        with mock.patch.object(client._makehosts, 'window', 3600):
+            client._makehosts.request()
+            client.guest_deploy('testnode',
+                                'sles12-s390x-netboot-0a0c576a_157f_42c8')
+        self.assertEqual(['makehosts', 'PUT'], calls)
+
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_private_power_state(self, xreq):
         expt = {'info': [[u'fakeid: on\n']]}
@@ -599,7 +730,7 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         fake_url = self._xcat_url.tabdump('/zvm')
 
         self._zvmclient.get_tabdump_info()
-        xrequest.assert_called_once_with('GET', fake_url)
+        xrequest.assert_called_once_with('GET', fake_url, coalesce=True)
 
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_do_capture(self, xrequest):
@@ -612,8 +743,24 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         self._zvmclient.do_capture(fake_nodename, fake_profile)
         xrequest.assert_called_once_with('POST', fake_url, fake_body)
 
-    def test_check_space_imgimport_xcat(self):
-        pass
+    @mock.patch.object(zvmutils, 'xdsh')
+    def test_get_free_space_xcat(self, xdsh):
+        xdsh.return_value = {'data': [[
+            'xcat: Filesystem 1024-blocks Used Available Capacity Mounted '
+            'on\nxcat: /dev/dasdb1 20642428 10285784 9307788 53% /install']]}
+        self.assertEqual(9307788 * 1024,
+                         self._zvmclient.get_free_space_xcat('xcat'))
+        xdsh.assert_called_once_with('xcat', '/bin/df -P -k /install')
+
+    @mock.patch.object(zvmclient.XCATClient, 'get_free_space_xcat')
+    @mock.patch.object(os.path, 'getsize')
+    def test_check_space_imgimport_xcat(self, getsize, get_free_space):
+        getsize.return_value = 2 * 1024 ** 3
+        get_free_space.return_value = 3 * 1024 ** 3
+        self._zvmclient.check_space_imgimport_xcat('/tmp/img.tar', 1, 'xcat')
+        self.assertRaises(exception.ZVMImageError,
+                          self._zvmclient.check_space_imgimport_xcat,
+                          '/tmp/img.tar', 2, 'xcat')
 
     def test_export_image(self):
         pass
@@ -636,14 +783,68 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         self._zvmclient.image_import(image_bundle_package, image_profile)
         xrequest.assert_called_once_with('POST', fake_url, fake_body)
 
+    @mock.patch.object(zvmutils, 'xcat_request')
+    @mock.patch.object(zvmutils, 'get_host')
+    @mock.patch.object(os, 'remove')
+    def test_image_import_compressed(self, remove_file, get_host, xrequest):
+        get_host.return_value = 'root@10.0.0.1'
+        fake_url = self._xcat_url.imgimport()
+        fake_body = ['osimage=/tmp/asdfe.tgz',
+                     'profile=imagep_prooooffffille',
+                     'remotehost=root@10.0.0.1']
+
+        self._zvmclient.image_import('/tmp/asdfe.tgz',
+                                     'imagep_prooooffffille',
+                                     compressed=True)
+        xrequest.assert_called_once_with('POST', fake_url, fake_body)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    @mock.patch.object(imagebundle, 'remove_remote')
+    @mock.patch.object(os, 'remove')
+    def test_image_import_streamed(self, remove_file, remove_remote,
+                                   xrequest):
+        image_bundle_package = '/install/tmp/asdfe'
+        image_profile = 'imagep_prooooffffille'
+        fake_url = self._xcat_url.imgimport()
+        fake_body = ['osimage=%s' % image_bundle_package,
+                     'profile=%s' % image_profile,
+                     'nozip']
+
+        with mock.patch.dict(CONF.xcat, {'bundle_stream_target':
+                                         'root@xcat:/install/tmp'}):
+            self._zvmclient.image_import(image_bundle_package, image_profile,
+                                         streamed=True)
+        xrequest.assert_called_once_with('POST', fake_url, fake_body)
+        remove_remote.assert_called_once_with('root@xcat',
+                                              image_bundle_package)
+        self.assertFalse(remove_file.called)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    @mock.patch.object(zvmutils, 'get_host')
+    @mock.patch.object(os, 'remove')
+    def test_image_import_failed(self, remove_file, get_host, xrequest):
+        get_host.return_value = 'root@10.0.0.1'
+        xrequest.side_effect = exception.ZVMXCATInternalError(msg='fake')
+
+        self.assertRaises(exception.ZVMImageError,
+                          self._zvmclient.image_import, '/tmp/asdfe',
+                          'imagep_prooooffffille')
+        remove_file.assert_called_once_with('/tmp/asdfe')
+
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_get_vm_nic_switch_info(self, xrequest):
+        xrequest.return_value = {"data": [[
+            '#node,switch,port,vlan,interface,comments,disable',
+            '"fakenode","fakesw1","port1",,"1000","fakehcp",',
+            '"fakenode","fakesw2","port2",,"1003","fakehcp",',
+            '"othernode","fakesw1","port3",,"1000","fakehcp",']]}
         url = "/xcatws/tables/switch?userName=" +\
                 CONF.xcat.username +\
                "&password=" + CONF.xcat.password +\
                "&format=json"
-        self._zvmclient.get_vm_nic_switch_info("fakenode")
-        xrequest.assert_called_with('GET', url)
+        info = self._zvmclient.get_vm_nic_switch_info("fakenode")
+        xrequest.assert_called_with('GET', url, coalesce=True)
+        self.assertEqual({'1000': 'fakesw1', '1003': 'fakesw2'}, info)
 
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_add_host_table_record(self, xrequest):
@@ -679,14 +880,26 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         self.assertRaises(exception.ZVMNetworkError,
                           self._zvmclient._makehost)
 
-    @mock.patch.object(zvmclient.XCATClient, '_makehost')
     @mock.patch.object(zvmclient.XCATClient, '_add_host_table_record')
     @mock.patch.object(zvmclient.XCATClient, '_config_xcat_mac')
-    def test_preset_vm_network(self, config_mac, add_host, makehost):
-        self._zvmclient._preset_vm_network("fakeid", "fakeip")
+    def test_preset_vm_network(self, config_mac, add_host):
+        with mock.patch.object(self._zvmclient, '_makehosts') as makehosts:
+            self._zvmclient._preset_vm_network("fakeid", "fakeip")
+            makehosts.request.assert_called_once_with()
         config_mac.assert_called_with("fakeid")
         add_host.assert_called_with("fakeid", "fakeip", "fakeid")
-        makehost.assert_called_with()
+
+    @mock.patch.object(zvmclient.XCATClient, '_makehost')
+    @mock.patch.object(zvmclient.XCATClient, '_add_host_table_record')
+    @mock.patch.object(zvmclient.XCATClient, '_config_xcat_mac')
+    def test_preset_vm_network_flush(self, config_mac, add_host, makehost):
+        client = zvmclient.XCATClient()
+        with mock.patch.object(client._makehosts, 'window', 3600):
+            for i in range(3):
+                client._preset_vm_network("fakeid%d" % i, "fakeip")
+            self.assertFalse(makehost.called)
+            client.flush_makehosts()
+            makehost.assert_called_once_with()
 
     @mock.patch.object(zvmclient.XCATClient, '_add_mac_table_record')
     def test_config_xcat_mac(self, add_mac):
@@ -701,55 +914,72 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
                "&password=" + CONF.xcat.password +\
                "&format=json"
         info = self._zvmclient._get_nic_ids()
-        xrequest.assert_called_with('GET', url)
+        xrequest.assert_called_with('GET', url, coalesce=True)
         self.assertEqual(info[0], "test2")
 
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_get_userid_from_node(self, xrequest):
-        xrequest.return_value = {"data": ["fake"]}
+        xrequest.return_value = {"data": [self._fake_vm_list()]}
         url = "/xcatws/tables/zvm?userName=" +\
                 CONF.xcat.username +\
                "&password=" + CONF.xcat.password +\
-               "&format=json" +\
-               "&col=node&value=fakenode&attribute=userid"
-        info = self._zvmclient._get_userid_from_node("fakenode")
-        xrequest.assert_called_with('GET', url)
-        self.assertEqual(info, xrequest.return_value['data'][0][0])
+               "&format=json"
+        info = self._zvmclient._get_userid_from_node("os000001")
+        xrequest.assert_called_once_with('GET', url, coalesce=True)
+        self.assertEqual("OS000001", info)
+        # second lookup is served from cache
+        info = self._zvmclient._get_userid_from_node("fakehcp")
+        self.assertEqual("HCP", info)
+        xrequest.assert_called_once_with('GET', url, coalesce=True)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_get_userid_from_node_not_found(self, xrequest):
+        xrequest.return_value = {"data": [self._fake_vm_list()]}
+        self.assertRaises(exception.ZVMInvalidXCATResponseDataError,
+                          self._zvmclient._get_userid_from_node, "fakeuser")
+        # the table is reloaded once to catch rows added by others
+        self.assertEqual(2, xrequest.call_count)
 
     @mock.patch.object(zvmclient.XCATClient, '_get_userid_from_node')
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_get_nic_settings(self, xrequest, get_userid_from_node):
-        xrequest.return_value = {"data": [["fake"]]}
+        xrequest.return_value = {"data": [[
+            '#node,switch,port,vlan,interface,comments,disable',
+            '"fake","fakesw1","fakeport",,"1000","fakehcp",']]}
         url = "/xcatws/tables/switch?userName=" +\
                 CONF.xcat.username +\
                "&password=" + CONF.xcat.password +\
-               "&format=json" +\
-               "&col=port&value=fakeport&attribute=node"
+               "&format=json"
         self._zvmclient._get_nic_settings("fakeport")
-        xrequest.assert_called_once_with('GET', url)
+        xrequest.assert_called_once_with('GET', url, coalesce=True)
         get_userid_from_node.assert_called_once_with("fake")
+        self.assertEqual("fakesw1", self._zvmclient._get_nic_settings(
+            "fakeport", field="switch"))
 
     @mock.patch.object(zvmclient.XCATClient, '_get_nic_settings')
     def test_get_node_from_port(self, get_nic_settings):
         self._zvmclient._get_node_from_port("fakeport")
         get_nic_settings.assert_called_with("fakeport", get_node=True)
 
-    @mock.patch.object(zvmutils, 'xcat_request')
-    def test_grant_user_to_vswitch(self, xrequest):
-        url = "/xcatws/nodes/" + CONF.xcat.zhcp_node +\
-              "/dsh?userName=" + CONF.xcat.username +\
-              "&password=" + CONF.xcat.password +\
-              "&format=json"
+    @mock.patch.object(zvmutils, 'xdsh_batch')
+    def test_grant_user_to_vswitch(self, xdsh_batch):
         commands = '/opt/zhcp/bin/smcli Virtual_Network_Vswitch_Set_Extended'
         commands += " -T fakeuserid"
         commands += " -k switch_name=fakevs"
         commands += " -k grant_userid=fakeuserid"
         commands += " -k persist=YES"
-        xdsh_commands = 'command=%s' % commands
-        body = [xdsh_commands]
 
         self._zvmclient.grant_user_to_vswitch("fakevs", "fakeuserid")
-        xrequest.assert_called_once_with("PUT", url, body)
+        xdsh_batch.assert_called_once_with(CONF.xcat.zhcp_node, [commands],
+                                           stop_on_error=False)
+
+    @mock.patch.object(zvmutils, 'xdsh_batch')
+    def test_grant_users_to_vswitch(self, xdsh_batch):
+        self._zvmclient.grant_users_to_vswitch("fakevs", ["user1", "user2"])
+        commands = xdsh_batch.call_args[0][1]
+        self.assertEqual(2, len(commands))
+        self.assertIn("-k grant_userid=user1", commands[0])
+        self.assertIn("-k grant_userid=user2", commands[1])
 
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_revoke_user_from_vswitch(self, xrequest):
@@ -768,53 +998,50 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         self._zvmclient.revoke_user_from_vswitch("fakevs", "fakeuserid")
         xrequest.assert_called_once_with("PUT", url, body)
 
-    @mock.patch.object(zvmutils, 'xcat_request')
-    def test_couple_nic(self, xrequest):
-        url = "/xcatws/nodes/" + CONF.xcat.zhcp_node +\
-              "/dsh?userName=" + CONF.xcat.username +\
-               "&password=" + CONF.xcat.password +\
-               "&format=json"
+    @mock.patch.object(zvmutils, 'xdsh_batch')
+    def test_couple_nic(self, xdsh_batch):
         commands = '/opt/zhcp/bin/smcli'
         commands += ' Virtual_Network_Adapter_Connect_Vswitch_DM'
         commands += " -T fakeuserid " + "-v fakecdev"
         commands += " -n fakevs"
-        xdsh_commands = 'command=%s' % commands
-        body1 = [xdsh_commands]
+        commands1 = commands
 
         commands = '/opt/zhcp/bin/smcli'
         commands += ' Virtual_Network_Adapter_Connect_Vswitch'
         commands += " -T fakeuserid " + "-v fakecdev"
         commands += " -n fakevs"
-        xdsh_commands = 'command=%s' % commands
-        body2 = [xdsh_commands]
+        commands2 = commands
 
         self._zvmclient._couple_nic("fakevs",
                                     "fakeuserid", "fakecdev", True)
-        xrequest.assert_any_call("PUT", url, body1)
-        xrequest.assert_any_call("PUT", url, body2)
+        xdsh_batch.assert_called_once_with(CONF.xcat.zhcp_node,
+                                           [commands1, commands2])
 
-    @mock.patch.object(zvmutils, 'xcat_request')
-    def test_uncouple_nic(self, xrequest):
-        url = "/xcatws/nodes/" + CONF.xcat.zhcp_node +\
-              "/dsh?userName=" + CONF.xcat.username +\
-               "&password=" + CONF.xcat.password +\
-               "&format=json"
+    @mock.patch.object(zvmutils, 'xdsh_batch')
+    def test_couple_nic_not_persist(self, xdsh_batch):
+        self._zvmclient._couple_nic("fakevs",
+                                    "fakeuserid", "fakecdev", False)
+        commands = xdsh_batch.call_args[0][1]
+        self.assertEqual(1, len(commands))
+        self.assertIn(' Virtual_Network_Adapter_Connect_Vswitch ',
+                      commands[0])
+
+    @mock.patch.object(zvmutils, 'xdsh_batch')
+    def test_uncouple_nic(self, xdsh_batch):
         commands = '/opt/zhcp/bin/smcli'
         commands += ' Virtual_Network_Adapter_Disconnect_DM'
         commands += " -T fakeuserid " + "-v fakecdev"
-        xdsh_commands = 'command=%s' % commands
-        body1 = [xdsh_commands]
+        commands1 = commands
 
         commands = '/opt/zhcp/bin/smcli'
         commands += ' Virtual_Network_Adapter_Disconnect'
         commands += " -T fakeuserid " + "-v fakecdev"
-        xdsh_commands = 'command=%s' % commands
-        body2 = [xdsh_commands]
+        commands2 = commands
 
         self._zvmclient._uncouple_nic("fakeuserid",
                                       "fakecdev", True)
-        xrequest.assert_any_call("PUT", url, body1)
-        xrequest.assert_any_call("PUT", url, body2)
+        xdsh_batch.assert_called_once_with(CONF.xcat.zhcp_node,
+                                           [commands1, commands2])
 
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_get_xcat_node_ip(self, xrequest):
@@ -826,7 +1053,7 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
                "&col=key&value=master&attribute=value"
 
         info = self._zvmclient._get_xcat_node_ip()
-        xrequest.assert_called_with("GET", url)
+        xrequest.assert_called_with("GET", url, coalesce=True)
         self.assertEqual(info, "fakeip")
 
     @mock.patch.object(zvmclient.XCATClient, '_get_xcat_node_ip')
@@ -893,6 +1120,31 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         self._zvmclient._get_zhcp_userid()
         get_userid_from_node.assert_called_with(CONF.xcat.zhcp_node)
 
+    @mock.patch.object(zvmclient.XCATClient, '_get_userid_from_node')
+    def test_get_zhcp_userid_shared(self, get_userid_from_node):
+        get_userid_from_node.return_value = 'fakeuserid'
+        self._zvmclient._get_zhcp_userid()
+        # another client reuses the looked up userid
+        self.assertEqual('fakeuserid',
+                         zvmclient.XCATClient()._get_zhcp_userid())
+        get_userid_from_node.assert_called_once_with(CONF.xcat.zhcp_node)
+
+    @mock.patch.object(zvmclient.XCATClient, '_get_xcat_node_name')
+    @mock.patch.object(zvmclient.XCATClient, '_get_userid_from_node')
+    @mock.patch.object(zvmclient.XCATClient, 'get_host_info')
+    def test_warm_identity_cache_refresh(self, get_host_info,
+                                         get_userid_from_node,
+                                         get_xcat_node_name):
+        identity = zvmclient.get_identity_cache()
+        identity.set('zhcp_info', {'nodename': 'oldzhcp'})
+        identity.set('zhcp_userid', 'olduserid')
+        get_userid_from_node.return_value = 'newuserid'
+        self._zvmclient.warm_identity_cache(refresh=True)
+        get_host_info.assert_called_once_with()
+        get_xcat_node_name.assert_called_once_with()
+        self.assertIsNone(identity.peek('zhcp_info'))
+        self.assertEqual('newuserid', identity.peek('zhcp_userid'))
+
     @mock.patch.object(zvmclient.XCATClient, '_get_zhcp_userid')
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_check_vswitch_status(self, xrequest, get_zhcp_userid):
@@ -997,6 +1249,16 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         xrequest.assert_called_once_with("GET", url)
         self.assertEqual(ret, image_list)
 
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_image_query_with_keyword_many(self, xrequest):
+        xrequest.return_value = {'info':
+            [[u'rhel7.2-s390x-netboot-image_uuid10  (osimage)',
+              u'rhel7.2-s390x-netboot-image_uuid1  (osimage)']]}
+
+        ret = self._zvmclient.image_query('image_uuid1')
+        self.assertEqual([u'rhel7.2-s390x-netboot-image_uuid10',
+                          u'rhel7.2-s390x-netboot-image_uuid1'], ret)
+
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_image_query_without_keyword(self, xrequest):
         xrequest.return_value = {'info':
@@ -1094,7 +1356,7 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
             'Return Code: 400\nReason Code: 4\n')
 
         self._zvmclient.delete_userid(fake_userid)
-        xrequest.assert_called_once_with('DELETE', fake_url)
+        xrequest.assert_called_once_with('DELETE', fake_url, None)
         delete_xcat_node.assert_called_once_with(fake_userid)
 
     @mock.patch.object(zvmclient.XCATClient, '_clean_network_resource')
@@ -1147,34 +1409,109 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         """
         pass
 
-    @mock.patch.object(os.path, 'exists')
-    @mock.patch.object(tarfile, 'open')
-    @mock.patch.object(tarfile.TarFile, 'add')
-    @mock.patch.object(tarfile.TarFile, 'close')
-    @mock.patch.object(shutil, 'copyfile')
-    @mock.patch.object(os, 'chdir')
-    def test_generate_image_bundle(self, change_dir,
-                                   copy_file, close_file,
-                                   add_file, tarfile_open,
-                                   file_exist):
+    def _prepare_bundle(self, time_stamp_dir):
+        tmp_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_path)
+        bundle_file_path = os.path.join(tmp_path, 'spawn_tmp', time_stamp_dir)
+        os.makedirs(bundle_file_path)
+        with open(os.path.join(bundle_file_path, 'manifest.xml'), 'w') as f:
+            f.write('<xcatimage/>')
+        image_file_path = os.path.join(tmp_path, 'test.img')
+        with open(image_file_path, 'wb') as f:
+            f.write(b'\x01' * 1000)
+        return tmp_path, bundle_file_path, image_file_path
+
+    @mock.patch.object(zvmutils.PathUtils, 'get_bundle_tmp_path')
+    def test_generate_image_bundle(self, get_bundle_path):
         time_stamp_dir = 'tmp_date_dir'
-        image_name = 'test'
-        spawn_path = '.'
-        spawn_path = spawn_path + '/' + time_stamp_dir
-        image_file_path = spawn_path + '/images/test.img'
-        change_dir.return_value = None
-        copy_file.return_value = None
-        close_file.return_value = None
-        add_file.return_value = None
-        tarfile_open.return_value = tarfile.TarFile
-        file_exist.return_value = True
-
-        self._zvmclient.generate_image_bundle(
+        spawn_path, bundle_file_path, image_file_path = self._prepare_bundle(
+            time_stamp_dir)
+        get_bundle_path.return_value = bundle_file_path
+
+        tar_file = self._zvmclient.generate_image_bundle(
                                     spawn_path, time_stamp_dir,
-                                    image_name, image_file_path)
-        tarfile_open.assert_called_once_with(spawn_path +
-                                             '/tmp_date_dir_test.tar',
-                                             mode='w')
+                                    'test', image_file_path)
+        self.assertEqual(spawn_path + '/tmp_date_dir_test.tar', tar_file)
+        with tarfile.open(tar_file) as tar:
+            self.assertEqual(['tmp_date_dir', 'tmp_date_dir/manifest.xml',
+                              'tmp_date_dir/test'], tar.getnames())
+            self.assertEqual(b'\x01' * 1000,
+                             tar.extractfile('tmp_date_dir/test').read())
+        self.assertFalse(os.path.exists(bundle_file_path))
+
+    @mock.patch.object(zvmutils.PathUtils, 'get_bundle_tmp_path')
+    def test_generate_image_bundle_gzip(self, get_bundle_path):
+        time_stamp_dir = 'tmp_date_dir'
+        spawn_path, bundle_file_path, image_file_path = self._prepare_bundle(
+            time_stamp_dir)
+        get_bundle_path.return_value = bundle_file_path
+
+        tar_file = self._zvmclient.generate_image_bundle(
+                                    spawn_path, time_stamp_dir,
+                                    'test', image_file_path, codec='gzip')
+        self.assertEqual(spawn_path + '/tmp_date_dir_test.tgz', tar_file)
+        with tarfile.open(tar_file, 'r:gz') as tar:
+            self.assertEqual(b'\x01' * 1000,
+                             tar.extractfile('tmp_date_dir/test').read())
+
+    @mock.patch.object(zvmutils.PathUtils, 'get_bundle_tmp_path')
+    def test_generate_image_bundle_failed(self, get_bundle_path):
+        time_stamp_dir = 'tmp_date_dir'
+        spawn_path, bundle_file_path, image_file_path = self._prepare_bundle(
+            time_stamp_dir)
+        get_bundle_path.return_value = bundle_file_path
+
+        self.assertRaises(exception.ZVMImageError,
+                          self._zvmclient.generate_image_bundle,
+                          spawn_path, time_stamp_dir, 'test',
+                          image_file_path + '.missing')
+        self.assertFalse(os.path.exists(spawn_path +
+                                        '/tmp_date_dir_test.tar'))
+
+    @mock.patch.object(imagebundle, 'RemoteFile')
+    @mock.patch.object(zvmutils.PathUtils, 'get_bundle_tmp_path')
+    def test_stream_image_bundle(self, get_bundle_path, remote_file):
+        time_stamp_dir = 'tmp_date_dir'
+        tmp_path, bundle_file_path, image_file_path = self._prepare_bundle(
+            time_stamp_dir)
+        get_bundle_path.return_value = bundle_file_path
+        # ssh is replaced by a local file
+        out_path = os.path.join(tmp_path, 'out.tar')
+        out = open(out_path, 'wb')
+        self.addCleanup(out.close)
+        remote_file.return_value.fileno.return_value = out.fileno()
+
+        with mock.patch.dict(CONF.xcat, {'bundle_stream_target':
+                                         'root@xcat:/install/tmp/'}):
+            tar_file = self._zvmclient.stream_image_bundle(
+                time_stamp_dir, 'test', image_file_path)
+        out.close()
+
+        self.assertEqual('/install/tmp/tmp_date_dir_test.tar', tar_file)
+        remote_file.assert_called_once_with('root@xcat', tar_file)
+        remote_file.return_value.close.assert_called_once_with()
+        with tarfile.open(out_path) as tar:
+            self.assertEqual(b'\x01' * 1000,
+                             tar.extractfile('tmp_date_dir/test').read())
+
+    @mock.patch.object(imagebundle, 'RemoteFile')
+    @mock.patch.object(zvmutils.PathUtils, 'get_bundle_tmp_path')
+    def test_stream_image_bundle_failed(self, get_bundle_path, remote_file):
+        time_stamp_dir = 'tmp_date_dir'
+        tmp_path, bundle_file_path, image_file_path = self._prepare_bundle(
+            time_stamp_dir)
+        get_bundle_path.return_value = bundle_file_path
+        remote_file.return_value.close.side_effect = IOError('broken pipe')
+        remote_file.return_value.fileno.return_value = os.open(
+            os.devnull, os.O_WRONLY)
+        self.addCleanup(os.close, remote_file.return_value.fileno())
+
+        with mock.patch.dict(CONF.xcat, {'bundle_stream_target':
+                                         'root@xcat:/install/tmp'}):
+            self.assertRaises(exception.ZVMImageError,
+                              self._zvmclient.stream_image_bundle,
+                              time_stamp_dir, 'test', image_file_path)
+        remote_file.return_value.abort.assert_called_once_with()
 
     @mock.patch.object(zvmclient.XCATClient, 'add_mdisks')
     @mock.patch.object(zvmutils, 'xcat_request')
@@ -1198,6 +1535,46 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         xrequest.assert_called_once_with('POST', url, body)
         add_mdisks.assert_called_once_with(user_id, disk_list)
 
+    @mock.patch.object(zvmclient.XCATClient, '_delete_host')
+    @mock.patch.object(zvmclient.XCATClient, '_delete_switch')
+    @mock.patch.object(zvmclient.XCATClient, '_delete_mac')
+    def test_clean_network_resource(self, delete_mac, delete_switch,
+                                    delete_host):
+        delete_mac.side_effect = exception.ZVMNetworkError(msg='fake')
+        self.assertRaises(exception.ZVMNetworkError,
+                          self._zvmclient._clean_network_resource, 'fakeuser')
+        # the other tables are cleaned anyway
+        delete_switch.assert_called_once_with('fakeuser')
+        delete_host.assert_called_once_with('fakeuser')
+
+    @mock.patch.object(zvmclient.XCATClient, 'delete_vm')
+    def test_delete_vms(self, delete_vm):
+        error = exception.ZVMXCATInternalError(msg='fake')
+        delete_vm.side_effect = [None, error, None]
+        with mock.patch.dict(CONF.zvm, {'bulk_delete_workers': 1}):
+            results = self._zvmclient.delete_vms(['user0', 'user1', 'user2'])
+        self.assertEqual([None, error, None], results)
+        self.assertEqual(3, delete_vm.call_count)
+
+    @mock.patch.object(zvmclient.XCATClient, 'add_mdisks')
+    @mock.patch.object(zvmclient.XCATClient, '_mkvm')
+    @mock.patch.object(zvmclient.XCATClient, 'prepare_for_spawn')
+    def test_create_vms(self, prepare_for_spawn, mkvm, add_mdisks):
+        disk_list = [{'size': '1g', 'is_boot_disk': True}]
+        vm_list = [{'userid': 'user%d' % i, 'cpu': 1, 'memory': 1024,
+                    'disk_list': disk_list if i else [],
+                    'profile': 'dfltprof'} for i in range(3)]
+        mkvm.side_effect = [None, exception.ZVMXCATInternalError(msg='fake'),
+                            None]
+        # one worker per stage keeps the guests in order
+        with mock.patch.dict(CONF.zvm, {'bulk_create_workers': 1}):
+            results = self._zvmclient.create_vms(vm_list)
+
+        self.assertEqual([None, ('create', mock.ANY), None], results)
+        self.assertEqual(3, prepare_for_spawn.call_count)
+        mkvm.assert_any_call('user0', 1, 1024, [], 'dfltprof')
+        add_mdisks.assert_called_once_with('user2', disk_list)
+
     @mock.patch.object(zvmclient.XCATClient, '_add_mdisk')
     def test_add_mdisks(self, add_mdisk):
         userid = 'fakeuser'
@@ -1227,25 +1604,19 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         self._zvmclient._add_mdisk(userid, disk, vdev),
         xrequest.assert_called_once_with('PUT', url, body)
 
-    @mock.patch.object(zvmutils, 'xcat_request')
-    def test_set_vswitch_port_vlan_id(self, xrequest):
-        url = "/xcatws/nodes/" + CONF.xcat.zhcp_node +\
-              "/dsh?userName=" + CONF.xcat.username +\
-              "&password=" + CONF.xcat.password +\
-              "&format=json"
+    @mock.patch.object(zvmutils, 'xdsh_batch')
+    def test_set_vswitch_port_vlan_id(self, xdsh_batch):
         commands = '/opt/zhcp/bin/smcli Virtual_Network_Vswitch_Set_Extended'
         commands += " -T userid"
         commands += ' -k grant_userid=userid'
         commands += " -k switch_name=vswitch_name"
         commands += " -k user_vlan_id=vlan_id"
         commands += " -k persist=YES"
-        xdsh_commands = 'command=%s' % commands
-        body = [xdsh_commands]
 
         self._zvmclient.set_vswitch_port_vlan_id("vswitch_name",
                                                  "userid",
                                                  "vlan_id")
-        xrequest.assert_called_once_with("PUT", url, body)
+        xdsh_batch.assert_called_once_with(CONF.xcat.zhcp_node, [commands])
 
     @mock.patch.object(zvmutils, 'xcat_request')
     def test_update_nic_definition(self, xrequest):
@@ -1263,3 +1634,48 @@ class SDKXCATCientTestCases(SDKZVMClientTestCase):
         self._zvmclient.update_nic_definition("node", "vdev",
                                               "mac", "vswitch")
         xrequest.assert_called_with("PUT", url, body)
+
+
+class SDKAsyncXCATClientTestCases(base.SDKTestCase):
+    def setUp(self):
+        super(SDKAsyncXCATClientTestCases, self).setUp()
+        self._aclient = zvmclient.AsyncXCATClient(max_workers=4)
+        self._xcat_url = zvmutils.get_xcat_url()
+
+    def tearDown(self):
+        self._aclient.close()
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_power_stat(self, xrequest):
+        xrequest.return_value = {'info': [['fakeuser: on']]}
+        res = self._aclient.power('fakeuser', 'stat')
+        self.assertEqual({'info': [['fakeuser: on']]}, res.get(5))
+        url = self._xcat_url.rpower('/fakeuser')
+        xrequest.assert_called_once_with('GET', url, ['stat'],
+                                         conn_pool=self._aclient._conn_pool)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_concurrent_requests(self, xrequest):
+        xrequest.side_effect = lambda method, url, body, conn_pool: url
+        results = [self._aclient.rmvm('user%d' % i) for i in range(10)]
+        urls = [r.get(5) for r in results]
+        self.assertEqual([self._xcat_url.rmvm('/user%d' % i)
+                          for i in range(10)], urls)
+
+    @mock.patch.object(zvmutils, 'xcat_request')
+    def test_error_raised_from_get(self, xrequest):
+        xrequest.side_effect = exception.ZVMXCATInternalError(msg='fake')
+        res = self._aclient.xdsh('fakenode', 'date')
+        self.assertRaises(exception.ZVMXCATInternalError, res.get, 5)
+        url = self._xcat_url.xdsh('/fakenode')
+        xrequest.assert_called_once_with('PUT', url,
+                                         ['command=date', 'options=-q'],
+                                         conn_pool=self._aclient._conn_pool)
+
+    @mock.patch.object(dirmaint, 'xcat_request')
+    def test_mkvm_limited(self, dm_request):
+        dm_request.return_value = {}
+        self._aclient.mkvm('fakeuser', ['profile=osdflt']).get(5)
+        url = self._xcat_url.mkvm('/fakeuser')
+        dm_request.assert_called_once_with('POST', url, ['profile=osdflt'],
+                                           conn_pool=self._aclient._conn_pool)
@@ -13,25 +13,32 @@
 #    under the License.
 
 
+import atexit
+import collections
 import contextlib
 import commands
+import copy
 import errno
 import functools
 import json
+import multiprocessing.pool
 import os
 import pwd
 import re
+import select
 import ssl
 import shutil
 import six
 import socket
 import stat
+import threading
 import time
 
 from six.moves import http_client as httplib
 
 from zvmsdk import config
 from zvmsdk import exception
+from zvmsdk import jsonutils
 from zvmsdk import log
 
 import constants as const
@@ -40,7 +47,14 @@ import constants as const
 CONF = config.CONF
 LOG = log.LOG
 _XCAT_URL = None
+_XCAT_CONN_POOL = None
+_XCAT_CONN_POOL_LOCK = threading.Lock()
+_SSL_CONTEXTS = {}
+_SSL_LOCK = threading.Lock()
+_KEYWORD_PATTERNS = {}
 _DEFAULT_MODE = stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO
+# requests sent again when the connection was dropped before the response
+_IDEMPOTENT_METHODS = ('GET', 'HEAD')
 
 
 class XCATUrl(object):
@@ -180,11 +194,16 @@ class XCATUrl(object):
 class XCATConnection(object):
     """Https requests to xCAT web service."""
 
-    def __init__(self):
-        """Initialize https connection to xCAT service."""
+    def __init__(self, conn=None):
+        """Initialize https connection to xCAT service.
+
+        :param conn: an established HTTPSClientAuthConnection to reuse,
+                     normally handed out by XCATConnectionPool. A new
+                     connection is created if not specified.
+        """
         self.port = 443
         self.host = CONF.xcat.server
-        self.conn = HTTPSClientAuthConnection(self.host, self.port,
+        self.conn = conn or HTTPSClientAuthConnection(self.host, self.port,
                         CONF.xcat.ca_file,
                         timeout=CONF.xcat.connection_timeout)
 
@@ -198,7 +217,7 @@ class XCATConnection(object):
 
         """
         if body is not None:
-            body = json.dumps(body)
+            body = jsonutils.dumps(body)
             headers = {'content-type': 'text/plain',
                        'content-length': len(body)}
 
@@ -214,23 +233,24 @@ class XCATConnection(object):
                    'headers': str(headers),
                    'body': body})
 
+        # A kept-alive connection may have been closed by xCAT server
+        # while it was idle, in that case reconnect and send it once more.
+        # A request dropped once sent may have been run by xCAT server,
+        # only the idempotent ones are sent again then.
+        reused = self.conn.sock is not None
         try:
-            self.conn.request(method, url, body, headers)
-        except socket.gaierror as err:
-            msg = ("Failed to connect xCAT server %(srv)s: %(err)s" %
-                   {'srv': self.host, 'err': err})
-            raise exception.ZVMXCATRequestFailed(msg)
-        except (socket.error, socket.timeout) as err:
-            msg = ("Communicate with xCAT server %(srv)s error: %(err)s" %
-                   {'srv': self.host, 'err': err})
-            raise exception.ZVMXCATRequestFailed(msg)
-
-        try:
-            res = self.conn.getresponse()
-        except Exception as err:
-            msg = ("Failed to get response from xCAT server %(srv)s: "
-                     "%(err)s" % {'srv': self.host, 'err': err})
-            raise exception.ZVMXCATRequestFailed(msg)
+            res = self._send_request(method, url, body, headers)
+        except _ConnectionDropped as err:
+            if not reused or (err.sent and
+                              method not in _IDEMPOTENT_METHODS):
+                raise exception.ZVMXCATRequestFailed(err.reason)
+            LOG.debug("Connection to xCAT server %s was dropped, "
+                      "reconnecting" % self.host)
+            self.conn.close()
+            try:
+                res = self._send_request(method, url, body, headers)
+            except _ConnectionDropped as err:
+                raise exception.ZVMXCATRequestFailed(err.reason)
 
         msg = res.read()
         resp = {
@@ -257,6 +277,139 @@ class XCATConnection(object):
 
         return resp
 
+    def _send_request(self, method, url, body, headers):
+        try:
+            self.conn.request(method, url, body, headers)
+        except socket.gaierror as err:
+            msg = ("Failed to connect xCAT server %(srv)s: %(err)s" %
+                   {'srv': self.host, 'err': err})
+            raise exception.ZVMXCATRequestFailed(msg)
+        except socket.timeout as err:
+            msg = ("Communicate with xCAT server %(srv)s error: %(err)s" %
+                   {'srv': self.host, 'err': err})
+            raise exception.ZVMXCATRequestFailed(msg)
+        except socket.error as err:
+            msg = ("Communicate with xCAT server %(srv)s error: %(err)s" %
+                   {'srv': self.host, 'err': err})
+            if err.errno in (errno.EPIPE, errno.ECONNRESET):
+                raise _ConnectionDropped(msg, sent=False)
+            raise exception.ZVMXCATRequestFailed(msg)
+
+        try:
+            return self.conn.getresponse()
+        except Exception as err:
+            msg = ("Failed to get response from xCAT server %(srv)s: "
+                     "%(err)s" % {'srv': self.host, 'err': err})
+            if (isinstance(err, httplib.BadStatusLine) or
+                    getattr(err, 'errno', None) in (errno.EPIPE,
+                                                    errno.ECONNRESET)):
+                raise _ConnectionDropped(msg, sent=True)
+            raise exception.ZVMXCATRequestFailed(msg)
+
+
+class _ConnectionDropped(Exception):
+    """Raised when xCAT server closed a kept-alive connection.
+
+    sent tells whether the request was sent in full before.
+    """
+
+    def __init__(self, reason, sent=False):
+        super(_ConnectionDropped, self).__init__(reason)
+        self.reason = reason
+        self.sent = sent
+
+
+class XCATConnectionPool(object):
+    """A bounded pool of persistent https connections to xCAT server.
+
+    At most pool_size connections are handed out at the same time, callers
+    beyond that wait until one is given back. Idle connections are closed
+    once they have not been used for idle_timeout seconds, or when they are
+    found closed by xCAT server.
+    """
+
+    def __init__(self, host, port, ca_file, timeout=None, pool_size=10,
+                 idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.ca_file = ca_file
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        # (connection, last used time), most recently used on the right
+        self._idle = collections.deque()
+
+    def _new_connection(self):
+        return HTTPSClientAuthConnection(self.host, self.port, self.ca_file,
+                                         timeout=self.timeout)
+
+    def _is_healthy(self, conn):
+        """Check whether an idle connection could still be used."""
+        if conn.sock is None:
+            # not connected yet or closed, httplib would reconnect it
+            return True
+        try:
+            readable = select.select([conn.sock], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return False
+        # nothing is expected from xCAT on an idle connection, being
+        # readable means it was closed by peer or is in a broken state
+        return not readable
+
+    def _evict_expired(self, now):
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn = self._idle.popleft()[0]
+            LOG.debug("Closing idle connection to xCAT server %s" % self.host)
+            conn.close()
+
+    def get(self):
+        """Get a connection, wait if pool_size connections are in use."""
+        self._slots.acquire()
+        try:
+            with self._lock:
+                self._evict_expired(time.time())
+                while self._idle:
+                    conn = self._idle.pop()[0]
+                    if self._is_healthy(conn):
+                        return conn
+                    conn.close()
+            return self._new_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def put(self, conn):
+        """Give back a connection that can be reused."""
+        with self._lock:
+            self._idle.append((conn, time.time()))
+        self._slots.release()
+
+    def discard(self, conn):
+        """Give back a connection that should not be reused."""
+        try:
+            conn.close()
+        finally:
+            self._slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.get()
+        try:
+            yield conn
+        except Exception:
+            self.discard(conn)
+            raise
+        else:
+            self.put(conn)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            while self._idle:
+                self._idle.popleft()[0].close()
+
 
 class HTTPSClientAuthConnection(httplib.HTTPSConnection):
     """For https://wiki.openstack.org/wiki/OSSN/OSSN-0033"""
@@ -277,25 +430,48 @@ class HTTPSClientAuthConnection(httplib.HTTPSConnection):
                       "not secure")
             self.use_ca = False
 
+    def _ssl_context(self):
+        if (self.ca_file is not None and
+            not os.path.exists(self.ca_file)):
+            LOG.warning(("the CA file %(ca_file) does not exist!"),
+                        {'ca_file': self.ca_file})
+            self.use_ca = False
+
+        ca_file = self.ca_file if self.use_ca else None
+        return get_ssl_context(ca_file, self.key_file, self.cert_file)
+
     def connect(self):
         sock = socket.create_connection((self.host, self.port), self.timeout)
         if self._tunnel_host:
             self.sock = sock
             self._tunnel()
 
-        if (self.ca_file is not None and
-            not os.path.exists(self.ca_file)):
-            LOG.warning(("the CA file %(ca_file) does not exist!"),
-                        {'ca_file': self.ca_file})
-            self.use_ca = False
+        self.sock = self._ssl_context().wrap_socket(sock)
 
-        if not self.use_ca:
-            self.sock = ssl.wrap_socket(sock, self.key_file, self.cert_file,
-                                        cert_reqs=ssl.CERT_NONE)
-        else:
-            self.sock = ssl.wrap_socket(sock, self.key_file, self.cert_file,
-                                        ca_certs=self.ca_file,
-                                        cert_reqs=ssl.CERT_REQUIRED)
+
+def get_ssl_context(ca_file=None, key_file=None, cert_file=None):
+    """Return the SSLContext shared by connections using the same files.
+
+    Building a context loads and parses the CA bundle and the client
+    certificate, so it is only done once per (ca_file, key_file, cert_file).
+    Each connection still does a full TLS handshake: resuming sessions
+    needs ssl.SSLSession, which is only there from python 3.6.
+    """
+    key = (ca_file, key_file, cert_file)
+    with _SSL_LOCK:
+        context = _SSL_CONTEXTS.get(key)
+        if context is None:
+            context = ssl.SSLContext(getattr(ssl, 'PROTOCOL_TLS',
+                                             ssl.PROTOCOL_SSLv23))
+            if cert_file is not None:
+                context.load_cert_chain(cert_file, key_file)
+            if ca_file is not None:
+                context.verify_mode = ssl.CERT_REQUIRED
+                context.load_verify_locations(ca_file)
+            else:
+                context.verify_mode = ssl.CERT_NONE
+            _SSL_CONTEXTS[key] = context
+        return context
 
 
 def get_xcat_url():
@@ -315,16 +491,209 @@ def remove_prefix_of_unicode(str_unicode):
     return str_unicode
 
 
-def xcat_request(method, url, body=None, headers=None):
+def get_xcat_conn_pool():
+    """Return the process wide xCAT connection pool.
+
+    None is returned if connection pooling is disabled by setting
+    connection_pool_size to 0.
+    """
+    global _XCAT_CONN_POOL
+
+    if CONF.xcat.connection_pool_size <= 0:
+        return None
+
+    with _XCAT_CONN_POOL_LOCK:
+        if _XCAT_CONN_POOL is None:
+            ca_file = CONF.xcat.ca_file
+            if ca_file is not None and os.path.exists(ca_file):
+                # build the shared ssl context before any connection is made
+                get_ssl_context(ca_file)
+            _XCAT_CONN_POOL = XCATConnectionPool(
+                CONF.xcat.server, 443, CONF.xcat.ca_file,
+                timeout=CONF.xcat.connection_timeout,
+                pool_size=CONF.xcat.connection_pool_size,
+                idle_timeout=CONF.xcat.connection_idle_timeout)
+    return _XCAT_CONN_POOL
+
+
+class _InFlightCall(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent identical calls into one.
+
+    The first caller of a key runs the function, callers of the same key
+    arriving while it runs wait for it and get a deep copy of its result,
+    or have its exception raised. Nothing is cached once the call is done.
+    After fence() the calls running are not joined any more, the next
+    caller of their key runs the function again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _InFlightCall()
+            else:
+                call.waiters += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            result = function(*args, **kwargs)
+        except Exception as err:
+            self._forget(key, call)
+            call.error = err
+            call.done.set()
+            raise
+
+        self._forget(key, call)
+        if call.waiters:
+            # waiters copy from a snapshot the leader's caller can't modify
+            call.result = copy.deepcopy(result)
+        call.done.set()
+        return result
+
+    def _forget(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def fence(self):
+        """Let no caller join the calls running now."""
+        with self._lock:
+            self._calls.clear()
+
+
+_GET_SINGLE_FLIGHT = SingleFlight()
+
+
+class Debouncer(object):
+    """Coalesce the requests to run a function made within a time window.
+
+    The first request starts a timer of window seconds, the function is
+    run once when it expires whatever the number of requests made
+    meanwhile. flush() runs it right away if it was requested since its
+    last run. With a window of 0 each request runs the function.
+
+    If a delayed run fails, the function stays requested and the next
+    request runs it right away, so its caller gets the error if it fails
+    again. last_error is the error of the last delayed run, None if it
+    went fine. The pending run is done at interpreter exit.
+    """
+
+    def __init__(self, function, window):
+        self._function = function
+        self.window = window
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._pending = False
+        self._timer = None
+        self._exit_flush = False
+        self.last_error = None
+
+    def request(self):
+        with self._lock:
+            self._pending = True
+            run_now = self.window <= 0 or self.last_error is not None
+            if not run_now and self._timer is None:
+                self._timer = threading.Timer(self.window, self._expire)
+                self._timer.daemon = True
+                self._timer.start()
+                if not self._exit_flush:
+                    atexit.register(self._flush_at_exit)
+                    self._exit_flush = True
+        if run_now:
+            self.flush()
+
+    def _expire(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception as err:
+            LOG.error("Delayed call to %(func)s failed: %(err)s" %
+                      {'func': self._function.__name__, 'err': err})
+            self.last_error = err
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as err:
+            LOG.error("Call to %(func)s at exit failed: %(err)s" %
+                      {'func': self._function.__name__, 'err': err})
+
+    def flush(self):
+        """Run the function now if requested, return whether it ran."""
+        with self._run_lock:
+            with self._lock:
+                if not self._pending:
+                    return False
+                self._pending = False
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            try:
+                self._function()
+            except Exception:
+                # to be run again on next flush
+                with self._lock:
+                    self._pending = True
+                raise
+            self.last_error = None
+            return True
+
+
+def xcat_request(method, url, body=None, headers=None, conn_pool=None,
+                 coalesce=False):
+    """Send request to xCAT server and return the parsed response.
+
+    :param conn_pool: XCATConnectionPool to take the connection from, the
+                      process wide pool is used if not specified.
+    :param coalesce:  share the GET request with the identical ones issued
+                      concurrently. Only for reads whose result does not
+                      depend on the writes of the caller, a GET never joins
+                      a request sent before the last write completed.
+    """
+    if method == "GET" and coalesce:
+        key = (url, json.dumps(body, sort_keys=True),
+               json.dumps(headers, sort_keys=True), id(conn_pool))
+        return _GET_SINGLE_FLIGHT.do(key, _xcat_request, method, url,
+                                     body, headers, conn_pool)
+    try:
+        return _xcat_request(method, url, body, headers, conn_pool)
+    finally:
+        if method != "GET":
+            _GET_SINGLE_FLIGHT.fence()
+
+
+def _xcat_request(method, url, body=None, headers=None, conn_pool=None):
     headers = headers or {}
-    conn = XCATConnection()
-    resp = conn.request(method, url, body, headers)
+    pool = conn_pool or get_xcat_conn_pool()
+    if pool is None:
+        resp = XCATConnection().request(method, url, body, headers)
+    else:
+        with pool.connection() as conn:
+            resp = XCATConnection(conn).request(method, url, body, headers)
     return load_xcat_resp(resp['message'])
 
 
 def jsonloads(jsonstr):
     try:
-        return json.loads(jsonstr)
+        return jsonutils.loads(jsonstr)
     except ValueError:
         errmsg = "xCAT response data is not in JSON format"
         LOG.error(errmsg)
@@ -388,6 +757,23 @@ def wrap_invalid_xcat_resp_data_error(function):
     return decorated_function
 
 
+def _get_keyword_pattern(dirt):
+    """Return the compiled regex matching any keyword of dirt, and the map
+    from keyword to dirt key. Compiled once per keyword dictionary.
+    """
+    cache_key = tuple(sorted(dirt.items()))
+    compiled = _KEYWORD_PATTERNS.get(cache_key)
+    if compiled is None:
+        names = dict((kw, k) for k, kw in dirt.items())
+        # longest first, so a keyword is preferred over its own prefix
+        keywords = sorted(names, key=len, reverse=True)
+        # the first keyword of each line and the rest of the line
+        pattern = re.compile('(%s)([^\n]*)' %
+                             '|'.join(re.escape(kw) for kw in keywords))
+        compiled = _KEYWORD_PATTERNS[cache_key] = (pattern, names)
+    return compiled
+
+
 @wrap_invalid_xcat_resp_data_error
 def translate_xcat_resp(rawdata, dirt):
     """Translate xCAT response JSON stream to a python dictionary.
@@ -404,16 +790,14 @@ def translate_xcat_resp(rawdata, dirt):
      ...
      keywordn: valuen,}
 
+    The response is parsed in a single pass with a regex matching all the
+    keywords, only the first keyword found in a line is considered.
     """
-    data_list = rawdata.split("\n")
+    pattern, names = _get_keyword_pattern(dirt)
 
     data = {}
-
-    for ls in data_list:
-        for k in list(dirt.keys()):
-            if ls.__contains__(dirt[k]):
-                data[k] = ls[(ls.find(dirt[k]) + len(dirt[k])):].strip()
-                break
+    for match in pattern.finditer(rawdata):
+        data[names[match.group(1)]] = match.group(2).strip()
 
     if data == {}:
         msg = "No value matched with keywords. Raw Data: %(raw)s; " \
@@ -506,7 +890,7 @@ def _is_warning(err_str):
 def get_userid(node_name):
     """Returns z/VM userid for the xCAT node."""
     url = get_xcat_url().lsdef_node(''.join(['/', node_name]))
-    info = xcat_request('GET', url)
+    info = xcat_request('GET', url, coalesce=True)
     with expect_invalid_xcat_resp_data(info):
         for s in info['info'][0]:
             if s.__contains__('userid='):
@@ -532,6 +916,64 @@ def xdsh(node, commands):
     return res_dict
 
 
+def xdsh_batch(node, commands, stop_on_error=True):
+    """Run several commands on xCAT node with a single xdsh call.
+
+    The exit code of each command is echoed after a marker, so the output
+    can be split back per command. A command failing stops the batch if
+    stop_on_error, the other commands are run anyway otherwise. An error
+    naming all the failed commands is raised after the batch is done.
+
+    :returns: list of the output of each command.
+    """
+    script = []
+    for idx, cmd in enumerate(commands):
+        script.append('%(cmd)s 2>&1; rc=$?; echo "%(marker)s %(idx)d $rc"' %
+                      {'cmd': cmd, 'marker': const.XDSH_RC_MARKER,
+                       'idx': idx})
+        if stop_on_error:
+            script.append('[ $rc -eq 0 ] || exit 0')
+    resp = xdsh(node, '; '.join(script))
+
+    results = _split_xdsh_batch_output(node, resp)
+    failures = ['"%(cmd)s" failed with %(rc)d: %(output)s' %
+                {'cmd': commands[idx], 'rc': rc, 'output': output}
+                for idx, (rc, output) in sorted(results.items()) if rc]
+    if not failures and len(results) < len(commands):
+        failures = ['"%s" was not run' % commands[idx]
+                    for idx in range(len(commands)) if idx not in results]
+    if failures:
+        msg = ("Commands on %(node)s failed: %(err)s" %
+               {'node': node, 'err': '; '.join(failures)})
+        LOG.error(msg)
+        raise exception.ZVMXCATInternalError(msg=msg)
+
+    return [results[idx][1] for idx in range(len(commands))]
+
+
+@wrap_invalid_xcat_resp_data_error
+def _split_xdsh_batch_output(node, resp):
+    """Return {command index: (exit code, output)} from xdsh_batch."""
+    prefix = '%s: ' % node
+    lines = []
+    for data in resp['data']:
+        for text in data:
+            lines.extend(text.split('\n'))
+
+    results = {}
+    output = []
+    for line in lines:
+        if line.startswith(prefix):
+            line = line[len(prefix):]
+        if line.startswith(const.XDSH_RC_MARKER):
+            idx, rc = line[len(const.XDSH_RC_MARKER):].split()
+            results[int(idx)] = (int(rc), '\n'.join(output))
+            output = []
+        else:
+            output.append(line)
+    return results
+
+
 def execute(cmd):
     """execute command in shell and return output"""
     # TODO:do some exception in future
@@ -541,6 +983,12 @@ def execute(cmd):
     return output
 
 
+def get_free_space(path):
+    """Return the bytes available in the file system of path."""
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
 def get_host():
     return ''.join([pwd.getpwuid(os.geteuid()).pw_name, '@',
                     CONF.network.my_ip])
@@ -612,6 +1060,58 @@ def looping_call(f, sleep=5, inc_sleep=0, max_sleep=60, timeout=600,
         retry = False
 
 
+def run_pipeline(items, stages):
+    """Run every item through a list of stages, the stages overlapping.
+
+    Each stage has its own pool of worker threads, an item enters a stage
+    as soon as it left the previous one, so the items at different stages
+    are processed at the same time. An item failing in a stage leaves the
+    pipeline, the other items go on.
+
+    :param items:  list of items to process.
+    :param stages: list of (name, function, workers) tuples, function is
+                   called with the item, at most workers items are
+                   processed by the stage at the same time.
+    :returns: a list with for each item None if it passed all stages, or
+              a (stage name, exception) tuple for the stage it failed in.
+    """
+    results = [None] * len(items)
+    if not items:
+        return results
+
+    pools = [multiprocessing.pool.ThreadPool(workers)
+             for (_name, _function, workers) in stages]
+    finished = threading.Semaphore(0)
+
+    def _run_stage(idx, stage):
+        name, function = stages[stage][:2]
+        done = True
+        try:
+            function(items[idx])
+            if stage + 1 < len(stages):
+                pools[stage + 1].apply_async(_run_stage, (idx, stage + 1))
+                done = False
+        except BaseException as err:
+            LOG.error("Stage %(stage)s failed for %(item)s: %(err)s" %
+                      {'stage': name, 'item': items[idx], 'err': err})
+            results[idx] = (name, err)
+        finally:
+            # whatever happened, the item is out of the pipeline
+            if done:
+                finished.release()
+
+    try:
+        for idx in range(len(items)):
+            pools[0].apply_async(_run_stage, (idx, 0))
+        for idx in range(len(items)):
+            finished.acquire()
+    finally:
+        for pool in pools:
+            pool.close()
+            pool.join()
+    return results
+
+
 def _get_instances_path():
         return os.path.normpath(CONF.instance.instances_path)
 
@@ -667,7 +1167,7 @@ def get_xcat_version():
 
     url = get_xcat_url().version()
     with expect_invalid_xcat_resp_data():
-        data = xcat_request('GET', url)['data']
+        data = xcat_request('GET', url, coalesce=True)['data']
         version = data[0][0].split()[1]
         version = version.strip()
         return version
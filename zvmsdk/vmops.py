@@ -13,7 +13,6 @@
 #    under the License.
 
 
-import time
 import uuid
 
 from zvmsdk import client as zvmclient
@@ -23,6 +22,8 @@ from zvmsdk import dist
 from zvmsdk import exception
 from zvmsdk import log
 from zvmsdk import imageops
+from zvmsdk import imagestore
+from zvmsdk import powerstate
 from zvmsdk import utils as zvmutils
 
 
@@ -45,11 +46,16 @@ class VMOps(object):
         self._dist_manager = dist.ListDistManager()
         self._imageops = imageops.get_imageops()
         self._pathutils = zvmutils.PathUtils()
+        self._power_poller = powerstate.get_power_poller()
 
     def get_power_state(self, guest_id):
         """Get power status of a z/VM instance."""
         return self._zvmclient.get_power_state(guest_id)
 
+    def get_power_states(self, userid_list):
+        """Get power status of a list of z/VM instances."""
+        return self._zvmclient.get_power_states(userid_list)
+
     @zvmutils.wrap_invalid_xcat_resp_data_error
     def _get_cpu_num_from_user_dict(self, dict_info):
         cpu_num = 0
@@ -119,23 +125,37 @@ class VMOps(object):
         """"Power on z/VM instance."""
         self._zvmclient.guest_start(userid)
 
-    def guest_stop(self, userid, timeout, retry_interval):
-        self._zvmclient.guest_stop(userid)
+    def guest_stop(self, userid, timeout, retry_interval=None):
+        """Signal the guest to shut down once, wait for it to be off.
 
-        # retry shutdown until timeout
-        if timeout > 0:
-            retry_count = timeout // retry_interval
-            while (retry_count > 0):
-                if self.get_power_state(userid) == constants.POWER_STATE_OFF:
-                    # In shutdown state already
-                    return
-                else:
-                    self._zvmclient.guest_stop(userid)
-                    time.sleep(retry_interval)
-                    retry_count -= 1
-
-            LOG.warning("Failed to shutdown guest vm %(userid)s in %(time)d "
-                         "seconds" % {'userid': userid, 'time': timeout})
+        retry_interval is not used, the guest is not signaled again.
+        """
+        waiter = self.guest_stop_async(userid, timeout)
+        if timeout <= 0:
+            return
+
+        waiter.wait(timeout)
+        if waiter.error is not None:
+            raise waiter.error
+        if not waiter.reached:
+            LOG.warning("Failed to shutdown guest vm %(userid)s in "
+                        "%(time)d seconds" % {'userid': userid,
+                                              'time': timeout})
+
+    def guest_stop_async(self, userid, timeout):
+        """Power off z/VM instance without waiting for it.
+
+        Return a powerstate.PowerStateWaiter done as soon as the instance
+        is seen off, or after timeout seconds.
+        """
+        self._zvmclient.guest_stop(userid)
+        if timeout <= 0:
+            waiter = powerstate.PowerStateWaiter(userid,
+                                                 constants.POWER_STATE_OFF)
+            waiter._finish(False)
+            return waiter
+        return self._power_poller.watch(userid, constants.POWER_STATE_OFF,
+                                        timeout)
 
     def create_vm(self, instance_name, cpu, memory, disk_list=[],
                   user_profile=CONF.zvm.user_profile):
@@ -160,7 +180,40 @@ class VMOps(object):
 
     def is_powered_off(self, instance_name):
         """Return True if the instance is powered off."""
-        return self._zvmclient.get_power_state(instance_name) == 'off'
+        state = self._power_poller.get_power_states([instance_name]).get(
+            instance_name)
+        if state is None:
+            # query it alone to raise the error
+            state = self._zvmclient.get_power_state(instance_name)
+        return state == constants.POWER_STATE_OFF
+
+    def watch_power_state(self, userid, state, timeout, callback=None):
+        """Return a powerstate.PowerStateWaiter of userid reaching state."""
+        return self._power_poller.watch(userid, state, timeout, callback)
+
+    def create_vms(self, vm_specs):
+        """Create many z/VM userids, failures don't stop the others."""
+        vm_list = [{'userid': spec['userid'],
+                    'cpu': spec['vcpus'],
+                    'memory': spec['memory'],
+                    'disk_list': spec.get('disk_list') or [],
+                    'profile': spec.get('user_profile') or
+                               CONF.zvm.user_profile}
+                   for spec in vm_specs]
+        LOG.debug("Creating the z/VM user entries for %d instances"
+                  % len(vm_list))
+        failures = self._zvmclient.create_vms(vm_list)
+
+        results = {}
+        for vm, failure in zip(vm_list, failures):
+            if failure is None:
+                results[vm['userid']] = {'created': True}
+            else:
+                stage, err = failure
+                results[vm['userid']] = {'created': False,
+                                         'stage': stage,
+                                         'error': str(err)}
+        return results
 
     def delete_vm(self, userid):
         """Delete z/VM userid for the instance.This will remove xCAT node
@@ -168,6 +221,19 @@ class VMOps(object):
         """
         self._zvmclient.delete_vm(userid)
 
+    def delete_vms(self, userid_list):
+        """Delete many z/VM userids, failures don't stop the others."""
+        LOG.debug("Deleting %d instances" % len(userid_list))
+        failures = self._zvmclient.delete_vms(userid_list)
+
+        results = {}
+        for userid, err in zip(userid_list, failures):
+            if err is None:
+                results[userid] = {'deleted': True}
+            else:
+                results[userid] = {'deleted': False, 'error': str(err)}
+        return results
+
     def capture_instance(self, instance_name):
         """Invoke xCAT REST API to capture a instance."""
         LOG.info('Begin to capture instance %s' % instance_name)
@@ -182,6 +248,19 @@ class VMOps(object):
 
     def delete_image(self, image_name):
         """"Invoke xCAT REST API to delete a image."""
+        store = imagestore.get_image_store()
+        if store.resolve(image_name) != image_name:
+            # the image is shared with other names, only drop this one
+            store.remove_alias(image_name)
+            LOG.info('Image alias %s successfully deleted' % image_name)
+            return
+        aliases = store.aliases(image_name)
+        if aliases:
+            msg = ("Image %(name)s is still used by the images %(aliases)s, "
+                   "delete them first" % {'name': image_name,
+                                          'aliases': ', '.join(aliases)})
+            raise exception.ZVMImageError(msg=msg)
+
         try:
             self._zvmclient.remove_image_file(image_name)
         except exception.ZVMException:
@@ -193,6 +272,7 @@ class VMOps(object):
         except exception.ZVMException:
             LOG.warn(("Failed to delete image definition %s from xCAT") %
                      image_name)
+        store.remove(image_name)
         LOG.info('Image %s successfully deleted' % image_name)
 
     def guest_deploy(self, user_id, image_name, transportfiles=None,
@@ -200,6 +280,7 @@ class VMOps(object):
         try:
             LOG.debug("Begin to deploy image on vm %s", user_id)
 
+            image_name = imagestore.get_image_store().resolve(image_name)
             self._zvmclient.guest_deploy(user_id, image_name,
                                          transportfiles, vdev)
 